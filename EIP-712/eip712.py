@@ -0,0 +1,170 @@
+from operator import itemgetter
+
+from eth_keys import keys
+from eth_keys.exceptions import BadSignature, ValidationError
+from eth_utils import keccak, is_hex_address
+
+
+DOMAIN_FIELDS = (('name', 'string'), ('version', 'string'), ('chainId', 'uint256'), ('verifyingContract', 'address'))
+# the domain hardcoded in EIP712FlatStruct.sol and EIP712NestedStruct.sol, and signed by sign.js and sign_nested.js
+DEFAULT_DOMAIN = {
+    'name': 'VerifierApp101',
+    'version': '1',
+    'chainId': 5,
+    'verifyingContract': '0x8c1eD7e19abAa9f23c476dA86Dc1577F1Ef401f5'
+}
+
+# struct definitions of the example contracts, fields in the order they are declared in solidity
+FLAT_TYPES = {
+    'Unit': (('actionType', 'string'), ('timestamp', 'uint256'), ('authorizer', 'string')),
+}
+NESTED_TYPES = {
+    'Unit': (('actionType', 'string'), ('timestamp', 'uint256'), ('authorizer', 'Identity')),
+    'Identity': (('userId', 'uint256'), ('wallet', 'address')),
+}
+
+UINT256_MAX = 2 ** 256 - 1
+# encode_type() of a struct -> its compiled flattener
+_flatteners = dict()
+
+
+class InvalidProof(Exception):
+    pass
+
+
+def encode_type(primary_type, types):
+    """
+    `Unit(string actionType,uint256 timestamp,Identity authorizer)Identity(uint256 userId,address wallet)`:
+    the primary type followed by the structs it references, sorted by name
+    """
+    dependencies = set()
+    stack = [primary_type]
+    while stack:
+        for _, field_type in types[stack.pop()]:
+            if field_type in types and field_type != primary_type and field_type not in dependencies:
+                dependencies.add(field_type)
+                stack.append(field_type)
+    return ''.join(
+        f'{name}({",".join(f"{field_type} {field}" for field, field_type in types[name])})'
+        for name in [primary_type] + sorted(dependencies)
+    )
+
+
+def _compile_flattener(types, type_name):
+    fields = types[type_name]
+    if len(fields) == 1:
+        field = fields[0][0]
+
+        def getter(message):
+            return (message[field],)
+    else:
+        getter = itemgetter(*(field for field, _ in fields))
+    nested = [(i, _compile_flattener(types, field_type))
+              for i, (_, field_type) in enumerate(fields) if field_type in types]
+    if not nested:
+        def flatten(message):
+            return list(getter(message))
+    else:
+        def flatten(message):
+            values = list(getter(message))
+            for i, flatten_struct in nested:
+                values[i] = flatten_struct(values[i])
+            return values
+    return flatten
+
+
+def struct_flattener(types, primary_type='Unit'):
+    """
+    Function that turns a message of `primary_type` into the list of its field values in the order the struct declares
+    them, nested structs included as lists, i.e. the tuple EthVigil encodes for the contract. The field order is
+    compiled once per struct definition, so flattening a message costs one lookup per field.
+    """
+    key = encode_type(primary_type, types)
+    if key not in _flatteners:
+        flatten = _compile_flattener(types, primary_type)
+
+        def flatten_message(message):
+            try:
+                return flatten(message)
+            except (KeyError, TypeError) as e:
+                raise InvalidProof(f'message does not fit {key}: missing or malformed {e}')
+        _flatteners[key] = flatten_message
+    return _flatteners[key]
+
+
+class TypedDataVerifier(object):
+    """
+    EIP-712 hashing and signer recovery of the messages signed for one domain, as `hashUnit()` and `ecrecover()`
+    compute them on chain.
+    The type hashes and the domain separator are computed once, so checking a proof costs the hashing of the message
+    itself and a public key recovery.
+    """
+    def __init__(self, types, primary_type='Unit', domain=None):
+        self.types = types
+        self.primary_type = primary_type
+        self.domain = domain or DEFAULT_DOMAIN
+        self.type_hashes = {name: keccak(text=encode_type(name, types)) for name in types}
+        domain_types = {'EIP712Domain': DOMAIN_FIELDS}
+        self.domain_separator = keccak(
+            keccak(text=encode_type('EIP712Domain', domain_types)) + self._encode_fields(DOMAIN_FIELDS, self.domain)
+        )
+        self._prefix = b'\x19\x01' + self.domain_separator
+
+    def __repr__(self):
+        return f'TypedDataVerifier({self.primary_type!r}, domain={self.domain!r})'
+
+    def _encode_value(self, field_type, value):
+        if field_type in self.types:
+            return self.hash_struct(field_type, value)
+        if field_type == 'string':
+            if not isinstance(value, str):
+                raise InvalidProof(f'expected a string, got {value!r}')
+            return keccak(text=value)
+        if field_type == 'uint256':
+            try:
+                value = int(value, 0) if isinstance(value, str) else value
+            except ValueError:
+                raise InvalidProof(f'expected an unsigned integer, got {value!r}')
+            if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= UINT256_MAX:
+                raise InvalidProof(f'expected an unsigned integer, got {value!r}')
+            return value.to_bytes(32, 'big')
+        if field_type == 'address':
+            if not isinstance(value, str) or not is_hex_address(value):
+                raise InvalidProof(f'expected an address, got {value!r}')
+            return bytes.fromhex(value[2:]).rjust(32, b'\x00')
+        raise InvalidProof(f'unsupported field type {field_type}')
+
+    def _encode_fields(self, fields, value):
+        if not isinstance(value, dict):
+            raise InvalidProof(f'expected an object, got {value!r}')
+        if set(value) != {field for field, _ in fields}:
+            raise InvalidProof(f'expected the fields {", ".join(field for field, _ in fields)}, got '
+                               f'{", ".join(value)}')
+        return b''.join(self._encode_value(field_type, value[field]) for field, field_type in fields)
+
+    def hash_struct(self, type_name, value):
+        return keccak(self.type_hashes[type_name] + self._encode_fields(self.types[type_name], value))
+
+    def message_hash(self, message):
+        """
+        The digest the message's signature signs
+        """
+        return keccak(self._prefix + self.hash_struct(self.primary_type, message))
+
+    def recover(self, message, sig_r, sig_s, sig_v):
+        """
+        Checksummed address of the signer of `message`. Raises InvalidProof if the message does not fit the struct
+        or no signer can be recovered from the signature.
+        """
+        try:
+            r, s, v = int(sig_r, 16), int(sig_s, 16), int(sig_v)
+        except (TypeError, ValueError):
+            raise InvalidProof('sigR and sigS must be hex strings and sigV an integer')
+        if v not in (27, 28):
+            raise InvalidProof(f'sigV must be 27 or 28, got {sig_v}')
+        message_hash = self.message_hash(message)
+        try:
+            signature = keys.Signature(vrs=(v - 27, r, s))
+            return signature.recover_public_key_from_msg_hash(message_hash).to_checksum_address()
+        except (BadSignature, ValidationError) as e:
+            raise InvalidProof(f'no signer can be recovered from the signature: {e}')
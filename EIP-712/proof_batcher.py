@@ -0,0 +1,112 @@
+import asyncio
+import json
+import time
+
+
+class ProofBatcher(object):
+    """
+    Coalesces submitProof calls that arrive in bursts.
+
+    Proofs are collected for up to `window` seconds, or until `max_batch` of them are waiting, and the batch is then
+    handed to a pipeline that keeps at most `concurrency` calls to EthVigil in flight. Identical proofs for the same
+    contract within a batch are sent once and share the response. Each caller gets the response to its own proof,
+    or the exception its call raised.
+    Must be used from a single event loop.
+    """
+    def __init__(self, client, window=0.005, max_batch=50, concurrency=10):
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+        self._pending = list()
+        self._timer = None
+        self._semaphore = None
+        # proofs dispatched to the pipeline that are waiting for a free slot, or in flight
+        self._waiting = 0
+        self._in_flight = 0
+        self.batches = 0
+        self.proofs = 0
+        self.calls = 0
+        self.coalesced = 0
+        # batch size -> number of batches of that size
+        self.batch_sizes = dict()
+        self._total_wait = 0.0
+
+    def __repr__(self):
+        return f'ProofBatcher(window={self.window}, max_batch={self.max_batch}, concurrency={self.concurrency})'
+
+    async def submit(self, contract_address, method_args):
+        """
+        Queues a proof and returns the EthVigil response to its submitProof call
+        """
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        future = loop.create_future()
+        self._pending.append((contract_address, method_args, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, list()
+        if not batch:
+            return
+        self.batches += 1
+        self.proofs += len(batch)
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+        now = time.perf_counter()
+        calls = dict()
+        for contract_address, method_args, future, queued_at in batch:
+            self._total_wait += now - queued_at
+            key = (contract_address.lower(), json.dumps(method_args, sort_keys=True))
+            calls.setdefault(key, (contract_address, method_args, list()))[2].append(future)
+        self.coalesced += len(batch) - len(calls)
+        for contract_address, method_args, futures in calls.values():
+            self._waiting += len(futures)
+            asyncio.ensure_future(self._send(contract_address, method_args, futures))
+
+    async def _send(self, contract_address, method_args, futures):
+        try:
+            async with self._semaphore:
+                self._in_flight += 1
+                self.calls += 1
+                try:
+                    response = await self.client.call('submitProof', method_args, contract_address=contract_address)
+                finally:
+                    self._in_flight -= 1
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future in futures:
+                if not future.done():
+                    future.set_result(response)
+        finally:
+            self._waiting -= len(futures)
+
+    def stats(self):
+        """
+        Queue depth and batch sizes, to tune `window` and `max_batch` against the latency they add
+        """
+        return {
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+            'concurrency': self.concurrency,
+            # collecting in the current window, and dispatched but not answered yet
+            'queue_depth': len(self._pending) + self._waiting,
+            'in_flight': self._in_flight,
+            'batches': self.batches,
+            'proofs': self.proofs,
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'mean_batch_size': round(self.proofs / self.batches, 2) if self.batches else None,
+            'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            'mean_window_wait_ms': round(self._total_wait / self.proofs * 1000, 3) if self.proofs else None,
+        }
@@ -1,6 +1,9 @@
-import requests
 import json
 from dynaconf import settings
+from ethvigil_async_client import AsyncEthVigilClient, timed_out
+from eip712 import TypedDataVerifier, InvalidProof, struct_flattener, FLAT_TYPES, NESTED_TYPES
+from metrics import InstrumentedApplication, MetricsHandler, monitor_loop_lag, server_metrics
+from proof_batcher import ProofBatcher
 import tornado.httpserver
 import tornado.ioloop
 import tornado.options
@@ -10,8 +13,16 @@ import tornado.escape
 from tornado.options import define, options
 import logging
 import sys
+import time
 
 define("port", default=6635, help="run on the given port", type=int)
+define("concurrency", default=20, help="maximum number of calls to EthVigil in flight", type=int)
+define("request_timeout", default=70, help="seconds an EthVigil call may take, connecting included", type=float)
+define("batch_window_ms", default=0, help="collect proofs for this many ms before submitting them, 0 to submit each "
+                                          "right away", type=float)
+define("batch_max", default=50, help="submit the collected proofs as soon as this many are waiting", type=int)
+define("verify_proofs", default=True, help="recover the signer of each proof locally and reject invalid proofs "
+                                          "before submitting them", type=bool)
 
 tornado_logger = logging.getLogger('EIP712ProofLogger')
 tornado_logger.propagate = False
@@ -37,6 +48,11 @@ logging.getLogger("tornado.access").propagate = False
 
 
 class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, client, batcher=None, verifiers=None):
+        self.client = client
+        self.batcher = batcher
+        self.verifiers = verifiers
+
     def set_default_headers(self):
         self.set_header("Access-Control-Allow-Origin", "*")
         self.set_header("Access-Control-Allow-Headers", "x-requested-with, Content-Type")
@@ -54,8 +70,59 @@ class BaseHandler(tornado.web.RequestHandler):
         self.set_status(204)
         self.flush()
 
+    def verify_proof(self, contract_address, request_json):
+        """
+        Recovers the signer of a proof as the contract would. Answers with a 400 and returns False if the message does
+        not fit the contract's struct, no signer can be recovered, or the signer is not the one the request claims.
+        """
+        if self.verifiers is None:
+            return True
+        verifier = self.verifiers.get(contract_address.lower(), self.verifiers[None])
+        try:
+            signer = verifier.recover(request_json.get('messageObject'), request_json.get('sigR'),
+                                      request_json.get('sigS'), request_json.get('sigV'))
+            claimed_signer = request_json.get('signer')
+            if claimed_signer and claimed_signer.lower() != signer.lower():
+                raise InvalidProof(f'proof is signed by {signer}, not {claimed_signer}')
+        except InvalidProof as e:
+            tornado_logger.debug(f'Rejecting proof for contract {contract_address}: {e}')
+            self.set_status(status_code=400)
+            self.write({'success': False, 'error': str(e)})
+            return False
+        tornado_logger.debug(f'Proof signed by {signer}')
+        return True
+
+    def submit_proof(self, contract_address, method_args):
+        if self.batcher is not None:
+            return self.batcher.submit(contract_address, method_args)
+        return self.client.call('submitProof', method_args, contract_address=contract_address)
+
+    async def relay(self, upstream_call):
+        """
+        Awaits a call to EthVigil and relays its response, or a 504 if the call timed out and a 502 if it failed
+        otherwise, e.g. could not connect
+        """
+        try:
+            r = await upstream_call
+        except tornado.httpclient.HTTPClientError as e:
+            # HTTP errors are returned as responses, this is a CurlError (code 599) for a request that got no response
+            tornado_logger.error(f'EthVigil call failed: {e}')
+            self.set_status(status_code=504 if timed_out(e) else 502)
+            self.write({'success': False, 'error': str(e)})
+            return
+        tornado_logger.debug(r.text)
+        self.set_status(status_code=r.status_code)
+        self.write(r.json())
+
+
+class StructProofHandler(BaseHandler):
+    """
+    Takes proofs of one struct type, e.g. the `Unit` of EIP712FlatStruct.sol at /flat
+    """
+    def initialize(self, client, flatten, batcher=None, verifiers=None):
+        super().initialize(client, batcher=batcher, verifiers=verifiers)
+        self.flatten = flatten
 
-class FlatStructHandler(BaseHandler):
     async def post(self):
         request_json = tornado.escape.json_decode(self.request.body)
         tornado_logger.debug(request_json)
@@ -65,18 +132,23 @@ class FlatStructHandler(BaseHandler):
             command = ""
         else:
             contract_address = request_json['contractAddress']
-        api_key = settings['ETHVIGIL_API_KEY']
-        headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
         if command == 'submitProof':
-            # expand the message object into individual components
-            msg_obj = list(request_json['messageObject'].values())
+            if not self.verify_proof(contract_address, request_json):
+                return
+            # the message object goes out as the list of its fields in the order the solidity struct declares them,
+            # because that is the order of the tuple type, like (string, uint256, (uint256, address))
+            try:
+                msg_obj = self.flatten(request_json['messageObject'])
+            except InvalidProof as e:
+                self.set_status(status_code=400)
+                self.write({'success': False, 'error': str(e)})
+                return
             msg_obj_request_str = json.dumps(msg_obj)
             sig_r = request_json['sigR']
             sig_s = request_json['sigS']
             # sig_v = 28
             sig_v = request_json['sigV']
 
-            method_api_endpoint = f'{settings["REST_API_ENDPOINT"]}/contract/{contract_address}/submitProof'
             method_args = {
                 '_msg': msg_obj_request_str,
                 'sigR': sig_r,
@@ -85,86 +157,85 @@ class FlatStructHandler(BaseHandler):
             }
             tornado_logger.debug('Sending method args to submitProof')
             tornado_logger.debug(method_args)
-            r = requests.post(url=method_api_endpoint, json=method_args, headers=headers)
-            tornado_logger.debug(r.text)
-            self.set_status(status_code=r.status_code)
-            self.write(r.json())
+            await self.relay(self.submit_proof(contract_address, method_args))
         elif command == 'testVerify':
-            method_api_endpoint = f'{settings["REST_API_ENDPOINT"]}/contract/{contract_address}/testVerify'
             tornado_logger.debug(f'Calling testVerify on contract {contract_address}...')
-            r = requests.get(url=method_api_endpoint, headers=headers)
-            tornado_logger.debug(r.text)
-            self.set_status(status_code=r.status_code)
-            self.write(r.json())
+            await self.relay(self.client.read('testVerify', contract_address=contract_address))
         else:
             self.set_status(status_code=202)
             self.write({'success': True})
 
 
-def expand_msgobject(message_obj_map):
-    ret_l = list()
-    for k in ['actionType', 'timestamp']:
-        ret_l.append(message_obj_map[k])
-    nested_l = list()
-    for k in ['userId', 'wallet']:
-        nested_l.append(message_obj_map['authorizer'][k])
-    ret_l.append(nested_l)
-    return ret_l
+def struct_definitions():
+    """
+    Path -> (struct types, primary type) of the proofs taken: the example contracts' structs at /flat and /nested,
+    and any struct defined under EIP712_STRUCTS in settings
+    """
+    structs = {'flat': (FLAT_TYPES, 'Unit'), 'nested': (NESTED_TYPES, 'Unit')}
+    for path, definition in settings.get('EIP712_STRUCTS', dict()).items():
+        types = {name: tuple(tuple(field) for field in fields) for name, fields in definition['types'].items()}
+        structs[path] = (types, definition.get('primaryType', 'Unit'))
+    return structs
 
 
-class NestedStructHandler(BaseHandler):
-    async def post(self):
-        # tornado_logger.debug(self.request.headers['content-type'])
-        # tornado_logger.debug('---Transaction---')
-        tornado_logger.debug(self.request.body)
-        request_json = tornado.escape.json_decode(self.request.body)
-        # self.set_status(status_code=202)
-        # self.write({'success': True})
+def proof_verifiers(struct_types, primary_type):
+    """
+    Verifiers for the contracts whose domain is set in EIP712_DOMAINS, keyed by contract address, and under the None
+    key the verifier for any other contract, with the domain of the example contracts
+    """
+    verifiers = {contract.lower(): TypedDataVerifier(struct_types, primary_type, domain=dict(domain))
+                 for contract, domain in settings.get('EIP712_DOMAINS', dict()).items()}
+    verifiers[None] = TypedDataVerifier(struct_types, primary_type)
+    return verifiers
+
+
+class TimedClient(object):
+    """
+    Client recording the duration of the contract calls it makes, and the ones that failed, per contract method
+    """
+    def __init__(self, client, metrics):
+        self.client = client
+        self._duration = metrics['ethvigil_call_duration_seconds']
+        self._errors = metrics['ethvigil_call_errors_total']
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def _timed(self, method, upstream_call):
+        start = time.perf_counter()
         try:
-            command = request_json['command']
-        except KeyError:
-            command = ""
-        else:
-            contract_address = request_json['contractAddress']
-        api_key = settings['ETHVIGIL_API_KEY']
-        headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-        if command == 'submitProof':
-            # expand the message object into individual components
-            # msg_obj = ["Action7440", 1570112162, [123, "0x00EAd698A5C3c72D5a28429E9E6D6c076c086997"]]
-            # msg_obj_request_str = '["Action7440", 1570112162, [123, "0x00EAd698A5C3c72D5a28429E9E6D6c076c086997"]]'
+            r = await upstream_call
+        except Exception:
+            self._errors.incr(method)
+            raise
+        finally:
+            self._duration.observe(method, time.perf_counter() - start)
+        if r.status_code >= 400:
+            self._errors.incr(method)
+        return r
 
-            # it is necessary to expand the fields according to the order as defined in solidity struct
-            # because: the tuple type like (string, uint256, (uint256, address)) is defined according to that order
-            msg_obj = expand_msgobject(request_json['messageObject'])
-            msg_obj_request_str = json.dumps(msg_obj)
-            sig_r = request_json['sigR']
-            sig_s = request_json['sigS']
-            # sig_v = 28
-            sig_v = request_json['sigV']
+    def call(self, method, method_args, **kwargs):
+        return self._timed(method, self.client.call(method, method_args, **kwargs))
+
+    def read(self, method, *args, **kwargs):
+        return self._timed(method, self.client.read(method, *args, **kwargs))
 
-            method_api_endpoint = f'{settings["REST_API_ENDPOINT"]}/contract/{contract_address}/submitProof'
-            method_args = {
-                '_msg': msg_obj_request_str,
-                'sigR': sig_r,
-                'sigS': sig_s,
-                'sigV': sig_v
-            }
-            tornado_logger.debug('Sending method args to submitProof')
-            tornado_logger.debug(method_args)
-            r = requests.post(url=method_api_endpoint, json=method_args, headers=headers)
-            tornado_logger.debug(r.text)
-            self.set_status(status_code=r.status_code)
-            self.write(r.json())
-        elif command == 'testVerify':
-            method_api_endpoint = f'{settings["REST_API_ENDPOINT"]}/contract/{contract_address}/testVerify'
-            tornado_logger.debug(f'Calling testVerify on contract {contract_address}...')
-            r = requests.get(url=method_api_endpoint, headers=headers)
-            tornado_logger.debug(r.text)
-            self.set_status(status_code=r.status_code)
-            self.write(r.json())
-        else:
-            self.set_status(status_code=202)
-            self.write({'success': True})
+
+def proof_metrics():
+    metrics = server_metrics()
+    metrics.histogram('ethvigil_call_duration_seconds', 'Time EthVigil took to answer a contract call', 'method')
+    metrics.counter('ethvigil_call_errors_total', 'Contract calls that failed or were answered with a 4xx or 5xx '
+                                                  'status', 'method')
+    metrics.bind(0)
+    return metrics
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, batcher):
+        self.batcher = batcher
+
+    def get(self):
+        self.write(self.batcher.stats() if self.batcher is not None else {'batching': False})
 
 
 class WebhookHandler(BaseHandler):
@@ -179,14 +250,28 @@ class WebhookHandler(BaseHandler):
 
 def main():
     tornado.options.parse_command_line()
-    application = tornado.web.Application([
-        (r"/flat", FlatStructHandler),
-        (r"/webhook", WebhookHandler),
-        (r"/nested", NestedStructHandler)
-
-    ])
+    metrics = proof_metrics()
+    client = AsyncEthVigilClient(rest_api_endpoint=settings['REST_API_ENDPOINT'], api_key=settings['ETHVIGIL_API_KEY'],
+                                 concurrency=options.concurrency, request_timeout=options.request_timeout)
+    # the batcher's calls go through it as well
+    client = TimedClient(client, metrics)
+    batcher = None
+    if options.batch_window_ms:
+        batcher = ProofBatcher(client, window=options.batch_window_ms / 1000, max_batch=options.batch_max,
+                               concurrency=options.concurrency)
+    handlers = list()
+    for path, (struct_types, primary_type) in struct_definitions().items():
+        verifiers = proof_verifiers(struct_types, primary_type) if options.verify_proofs else None
+        handlers.append((f"/{path}", StructProofHandler, dict(client=client, batcher=batcher, verifiers=verifiers,
+                                                                flatten=struct_flattener(struct_types, primary_type))))
+    application = InstrumentedApplication(handlers + [
+        (r"/webhook", WebhookHandler, dict(client=client)),
+        (r"/stats", StatsHandler, dict(batcher=batcher)),
+        (r"/metrics", MetricsHandler, dict(metrics=metrics)),
+    ], metrics)
     http_server = tornado.httpserver.HTTPServer(application)
     http_server.listen(options.port)
+    tornado.ioloop.IOLoop.current().spawn_callback(monitor_loop_lag, metrics['ioloop_lag_seconds'])
     try:
         tornado.ioloop.IOLoop.current().start()
     except KeyboardInterrupt:
@@ -0,0 +1,68 @@
+"""
+Compares calls/sec of per-call `requests.post`/`requests.get` (a new connection each time) against the pooled
+EthVigilClient, against a local mock EthVigil server.
+
+python benchmarks/http_client.py [--calls 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'erc20'))
+
+import mock_ethvigil  # noqa: E402
+from ethvigil_client import EthVigilClient  # noqa: E402
+
+CONTRACT = '0x' + '22' * 20
+ACCOUNT = '0x774246187E1E2205C5920898eEde0945016080Df'
+API_KEY = 'mock-api-key'
+
+
+def unpooled_mint(rest_api_endpoint):
+    method_args = {'account': ACCOUNT, 'amount': 1}
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': API_KEY}
+    return requests.post(url=f'{rest_api_endpoint}/contract/{CONTRACT}/mint', json=method_args, headers=headers)
+
+
+def unpooled_balanceof(rest_api_endpoint):
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': API_KEY}
+    return requests.get(url=f'{rest_api_endpoint}/contract/{CONTRACT}/balanceOf/{ACCOUNT}', headers=headers)
+
+
+def run(label, fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        r = fn()
+        assert r.status_code == 200, r.text
+    elapsed = time.perf_counter() - start
+    print(f'{label:<38} {calls / elapsed:10.1f} calls/sec | {elapsed * 1000 / calls:7.3f} ms/call')
+    return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    proc, internal_api_endpoint, rest_api_endpoint = mock_ethvigil.spawn()
+    try:
+        client = EthVigilClient(rest_api_endpoint, internal_api_endpoint, api_key=API_KEY)
+        before = run('requests.post mint (before)', lambda: unpooled_mint(rest_api_endpoint), args.calls)
+        after = run('EthVigilClient.call mint (after)',
+                    lambda: client.call(CONTRACT, 'mint', {'account': ACCOUNT, 'amount': 1}), args.calls)
+        print(f'{"speedup":<38} {after / before:10.2f}x')
+        before = run('requests.get balanceOf (before)', lambda: unpooled_balanceof(rest_api_endpoint), args.calls)
+        after = run('EthVigilClient.read balanceOf (after)',
+                    lambda: client.read(CONTRACT, 'balanceOf', ACCOUNT), args.calls)
+        print(f'{"speedup":<38} {after / before:10.2f}x')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == '__main__':
+    main()
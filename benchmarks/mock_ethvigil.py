@@ -0,0 +1,140 @@
+"""
+Local stand-in for the EthVigil APIs, for benchmarking the examples without touching the real service.
+
+python benchmarks/mock_ethvigil.py [--port 7077] [--latency_ms 0] [--jitter_ms 0] [--error_rate 0] [--error_status 503]
+                                   [--gzip_status 415]
+
+Internal API: http://127.0.0.1:<port>/api   (/login, /deploy, /hooks/add, /hooks/updateEvents)
+REST API:     http://127.0.0.1:<port>/v0.1  (/contract/<address>/<method>[/<args>...])
+"""
+import asyncio
+import hashlib
+import itertools
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import tornado.escape
+import tornado.ioloop
+import tornado.options
+import tornado.web
+from tornado.options import define, options
+
+define("port", default=7077, help="run on the given port", type=int)
+define("latency_ms", default=0, help="delay of every request, standing in for the real API's latency", type=float)
+define("jitter_ms", default=0, help="random extra delay of every request, up to this many ms", type=float)
+define("error_rate", default=0, help="fraction of requests answered with --error_status instead", type=float)
+define("error_status", default=503, help="HTTP status of the injected errors", type=int)
+define("gzip_status", default=415, help="HTTP status of the answers to gzip-compressed bodies, 0 to decompress and "
+                                         "accept them", type=int)
+define("seed", default=0, help="seed of the random jitter and errors, so that runs inject the same ones", type=int)
+
+_counter = itertools.count(1)
+_random = random.Random()
+
+
+def fake_hash():
+    return '0x' + hashlib.sha256(str(next(_counter)).encode()).hexdigest()
+
+
+class MockHandler(tornado.web.RequestHandler):
+    async def prepare(self):
+        delay = options.latency_ms + (_random.uniform(0, options.jitter_ms) if options.jitter_ms else 0)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if options.error_rate and _random.random() < options.error_rate:
+            self.set_status(options.error_status)
+            self.finish({'success': False, 'error': 'injected by the mock EthVigil server'})
+        elif self.request.headers.get('Content-Encoding') == 'gzip':
+            # only set when the server does not decompress bodies, i.e. with --gzip_status other than 0
+            self.set_status(options.gzip_status)
+            self.finish({'success': False, 'error': 'gzip-compressed bodies are not supported'})
+
+    def write_success(self, data):
+        self.write({'success': True, 'data': data})
+
+
+class LoginHandler(MockHandler):
+    def post(self):
+        tornado.escape.json_decode(self.request.body)
+        self.write_success({'key': 'mock-api-key'})
+
+
+class DeployHandler(MockHandler):
+    def post(self):
+        request_json = tornado.escape.json_decode(self.request.body)
+        contract = '0x' + hashlib.sha256(request_json.get('code', '').encode()).hexdigest()[:40]
+        self.write_success({'contract': contract, 'gas': '145790', 'txhash': fake_hash()})
+
+
+class HooksHandler(MockHandler):
+    def post(self, action):
+        request_json = tornado.escape.json_decode(self.request.body)
+        if action == 'add':
+            self.write_success({'id': next(_counter)})
+        else:
+            self.write({'success': True, 'subscribedEvents': request_json.get('events', ['*'])})
+
+
+class ContractHandler(MockHandler):
+    def get(self, contract_address, method, args):
+        # read-only calls: every uint256 getter returns the same value
+        self.write_success([{'uint256': 1000}])
+
+    def post(self, contract_address, method, args):
+        tornado.escape.json_decode(self.request.body)
+        self.write_success([{'txHash': fake_hash()}])
+
+
+def make_app():
+    return tornado.web.Application([
+        (r"/api/login", LoginHandler),
+        (r"/api/deploy", DeployHandler),
+        (r"/api/hooks/(add|updateEvents)", HooksHandler),
+        (r"/v0.1/contract/(\w+)/(\w+)((?:/[^/]+)*)", ContractHandler),
+    ], log_function=lambda handler: None)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spawn(port=None, latency_ms=0, jitter_ms=0, error_rate=0, error_status=503, gzip_status=415, seed=0):
+    """
+    Runs the mock server in a child process, so that it does not compete with the benchmark for the GIL.
+    Returns (process, internal API endpoint, REST API endpoint)
+    """
+    port = port or free_port()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), f'--port={port}', f'--latency_ms={latency_ms}',
+                             f'--jitter_ms={jitter_ms}', f'--error_rate={error_rate}', f'--error_status={error_status}',
+                             f'--gzip_status={gzip_status}', f'--seed={seed}', '--logging=none'])
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    else:
+        proc.kill()
+        raise RuntimeError('Mock EthVigil server did not start')
+    return proc, f'http://127.0.0.1:{port}/api', f'http://127.0.0.1:{port}/v0.1'
+
+
+def main():
+    tornado.options.parse_command_line()
+    _random.seed(options.seed)
+    make_app().listen(options.port, address='127.0.0.1', decompress_request=not options.gzip_status)
+    try:
+        tornado.ioloop.IOLoop.current().start()
+    except KeyboardInterrupt:
+        tornado.ioloop.IOLoop.current().stop()
+
+
+if __name__ == '__main__':
+    main()
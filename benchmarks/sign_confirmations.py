@@ -0,0 +1,58 @@
+"""
+Signing throughput of `ethsign-cli sign-confirmations` with 1, 2, 4, ... signing processes, against signing the
+unique IDs one at a time with sign_confirmation() in a single process, as one submitConfirmation run per ID does.
+
+python benchmarks/sign_confirmations.py [--ids 100000] [--max-workers <cores>]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'eth_sign'))
+
+from confirmations import sign_in_pool  # noqa: E402
+from eth_sign_cli import sign_confirmation  # noqa: E402
+
+PRIVATE_KEY = '0x' + '11' * 32
+CONTRACT = '0xBFd6eabcB94eB1dEA59d8A8a5019699C18681CB0'
+
+
+async def sign_all(count, workers):
+    signed = 0
+    async for chunk in sign_in_pool(enumerate(range(count), start=1), CONTRACT, PRIVATE_KEY, workers=workers):
+        signed += len(chunk)
+    return signed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ids', type=int, default=100000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    sample = min(args.ids, 2000)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for unique_id in range(sample):
+            sign_confirmation(unique_id, CONTRACT, PRIVATE_KEY)
+    baseline = sample / (time.perf_counter() - start)
+    print(f'{"sign_confirmation, one by one":<32} {baseline:10.0f} signatures/sec')
+
+    workers, single = 1, None
+    while workers <= args.max_workers:
+        start = time.perf_counter()
+        assert asyncio.run(sign_all(args.ids, workers)) == args.ids
+        rate = args.ids / (time.perf_counter() - start)
+        single = single or rate
+        print(f'{f"{workers} signing processes":<32} {rate:10.0f} signatures/sec | {rate / single:5.2f}x '
+              f'| {rate / baseline:6.1f}x one by one')
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
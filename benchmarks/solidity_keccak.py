@@ -0,0 +1,71 @@
+"""
+solidityKeccak of (uint256, address) rows, the hash sign_confirmation signs, with the implementation eth_sign_cli.py
+used to have (hex strings joined and decoded back to bytes) against the bytes-native solidityKeccak and
+solidityKeccakBatch.
+
+python benchmarks/solidity_keccak.py [--rows 1000000] [--validity-check]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import eth_utils
+from eth_abi import is_encodable
+from eth_abi.packed import encode_single_packed
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'eth_sign'))
+
+from eth_sign_cli import solidityKeccak, solidityKeccakBatch  # noqa: E402
+
+ABI_TYPES = ['uint256', 'address']
+
+
+def hex_solidity_keccak(abi_types, values, validity_check=False):
+    """
+    solidityKeccak as it was: every packed value goes through a hex string
+    """
+    if validity_check:
+        for t, v in zip(abi_types, values):
+            if not is_encodable(t, v):
+                return False
+    hex_string = eth_utils.add_0x_prefix(''.join(
+        encode_single_packed(abi_type, value).hex()
+        for abi_type, value
+        in zip(abi_types, values)
+    ))
+    return eth_utils.keccak(hexstr=hex_string)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--validity-check', action='store_true', help='check that each value is encodable first')
+    args = parser.parse_args()
+
+    random.seed(0)
+    contract = eth_utils.to_checksum_address('0x' + os.urandom(20).hex())
+    rows = [(ABI_TYPES, [random.getrandbits(64), contract]) for _ in range(args.rows)]
+
+    results = dict()
+    start = time.perf_counter()
+    legacy = [hex_solidity_keccak(abi_types, values, args.validity_check) for abi_types, values in rows]
+    results['hex strings (before)'] = time.perf_counter() - start
+    start = time.perf_counter()
+    single = [solidityKeccak(abi_types, values, args.validity_check) for abi_types, values in rows]
+    results['solidityKeccak'] = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = solidityKeccakBatch(rows, args.validity_check)
+    results['solidityKeccakBatch'] = time.perf_counter() - start
+    assert legacy == single == batch
+
+    print(f'{args.rows} (uint256, address) rows{", validity checked" if args.validity_check else ""}')
+    baseline = results['hex strings (before)']
+    for name, elapsed in results.items():
+        print(f'{name:<22} {elapsed:8.2f} s | {args.rows / elapsed:10.0f} hashes/sec | {baseline / elapsed:5.2f}x')
+
+
+if __name__ == '__main__':
+    main()
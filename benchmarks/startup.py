@@ -0,0 +1,82 @@
+"""
+Measures the wall clock startup time of the CLI tools for commands that should not pay for
+imports, settings or logins they do not use.
+
+python benchmarks/startup.py [--runs 20] [--budget-ms 100]
+
+Every command is launched as a fresh interpreter, from a scratch directory holding a minimal settings.json.
+The time of a bare `python -c pass` is reported alongside and subtracted before comparing against the budget,
+since interpreter startup is outside the control of the CLI code.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLIS = {
+    'erc20-cli': os.path.join(REPO_ROOT, 'erc20', 'cli.py'),
+    'ethsign-cli': os.path.join(REPO_ROOT, 'eth_sign', 'eth_sign_cli.py')
+}
+
+COMMANDS = [['--help'], ['init']]
+
+SETTINGS = {
+    'development': {
+        'privatekey': '0x' + '11' * 32,
+        'contractAddress': '0x' + '22' * 20,
+        # unroutable endpoints: any accidental network call shows up as a hang or an error
+        'REST_API_ENDPOINT': 'http://127.0.0.1:9/v0.1',
+        'INTERNAL_API_ENDPOINT': 'http://127.0.0.1:9/api'
+    }
+}
+
+
+def time_command(argv, cwd, runs):
+    timings = list()
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=100.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ev-startup-')
+    try:
+        with open(os.path.join(workdir, 'settings.json'), 'w') as f:
+            json.dump(SETTINGS, f)
+        shutil.copy(os.path.join(REPO_ROOT, 'erc20', '.env'), workdir)
+
+        baseline = statistics.median(time_command([sys.executable, '-c', 'pass'], workdir, args.runs))
+        print(f'{"interpreter startup":<28} median {baseline:8.1f} ms')
+        over_budget = False
+        for name, script in CLIS.items():
+            for command in COMMANDS:
+                timings = time_command([sys.executable, script] + command, workdir, args.runs)
+                median = statistics.median(timings)
+                net = median - baseline
+                label = f'{name} {" ".join(command)}'
+                verdict = 'ok' if net < args.budget_ms else 'OVER BUDGET'
+                print(f'{label:<28} median {median:8.1f} ms | min {min(timings):8.1f} ms | '
+                      f'net of interpreter {net:8.1f} ms | {verdict}')
+                over_budget = over_budget or net >= args.budget_ms
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
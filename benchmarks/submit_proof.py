@@ -0,0 +1,130 @@
+"""
+Load test of EIP-712/submit_proof.py: posts concurrent submitProof requests while every EthVigil call takes
+`--latency-ms`, against a local mock EthVigil server.
+
+If the handlers blocked the IOLoop on each upstream call, the requests would be served one at a time and take about
+requests x latency; served concurrently, a batch of up to `--server-concurrency` requests takes about one latency.
+
+With `--batch-window-ms`, the server collects proofs into batches; its queue depth and batch sizes are printed.
+
+python benchmarks/submit_proof.py [--requests 100] [--latency-ms 200] [--server-concurrency 20] [--batch-window-ms 0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import requests
+import tornado.httpclient
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'EIP-712'))
+
+import mock_ethvigil  # noqa: E402
+from eip712 import TypedDataVerifier, FLAT_TYPES  # noqa: E402
+from eth_keys import keys  # noqa: E402
+
+CONTRACT = '0x8e12f01dae5fe7f1122dc42f2cb084f2f9e8aa03'
+SIGNING_KEY = keys.PrivateKey(b'\x01' * 32)
+VERIFIER = TypedDataVerifier(FLAT_TYPES)
+
+
+def signed_proof(i):
+    """
+    A distinct flat struct proof, so that the server cannot coalesce it, signed the way sign.js would
+    """
+    message = {'actionType': 'Action7440', 'timestamp': 1570112162 + i, 'authorizer': 'auth239430'}
+    signature = SIGNING_KEY.sign_msg_hash(VERIFIER.message_hash(message))
+    return {
+        'command': 'submitProof',
+        'contractAddress': CONTRACT,
+        'messageObject': message,
+        'sigR': f'0x{signature.r:064x}',
+        'sigS': f'0x{signature.s:064x}',
+        'sigV': signature.v + 27,
+        'signer': SIGNING_KEY.public_key.to_checksum_address(),
+    }
+
+
+def start_server(rest_api_endpoint, concurrency, batch_window_ms):
+    port = mock_ethvigil.free_port()
+    env = dict(os.environ, DYNACONF_REST_API_ENDPOINT=rest_api_endpoint, DYNACONF_ETHVIGIL_API_KEY='mock-api-key')
+    proc = subprocess.Popen(
+        [sys.executable, 'submit_proof.py', f'--port={port}', f'--concurrency={concurrency}',
+         f'--batch_window_ms={batch_window_ms}', '--logging=none'],
+        cwd=os.path.join(REPO_ROOT, 'EIP-712'), env=env, stdout=subprocess.DEVNULL
+    )
+    deadline = time.time() + 10
+    while True:
+        try:
+            requests.options(f'http://127.0.0.1:{port}/flat')
+            return proc, port
+        except requests.ConnectionError:
+            if time.time() > deadline:
+                proc.kill()
+                raise RuntimeError('submit_proof.py did not start')
+            time.sleep(0.1)
+
+
+async def submit_proofs(port, count):
+    client = tornado.httpclient.AsyncHTTPClient(force_instance=True, max_clients=count)
+    latencies = list()
+
+    bodies = [json.dumps(signed_proof(i)) for i in range(count)]
+
+    async def submit(i):
+        body = bodies[i]
+        start = time.perf_counter()
+        response = await client.fetch(f'http://127.0.0.1:{port}/flat', method='POST', body=body,
+                                      request_timeout=600)
+        assert response.code == 200, response.body
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(submit(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=200, help='latency of every mock EthVigil call')
+    parser.add_argument('--server-concurrency', type=int, default=20, help='--concurrency of submit_proof.py')
+    parser.add_argument('--batch-window-ms', type=float, default=0, help='--batch_window_ms of submit_proof.py')
+    args = parser.parse_args()
+
+    mock_proc, _, rest_api_endpoint = mock_ethvigil.spawn(latency_ms=args.latency_ms)
+    try:
+        proc, port = start_server(rest_api_endpoint, args.server_concurrency, args.batch_window_ms)
+        try:
+            elapsed, latencies = asyncio.run(submit_proofs(port, args.requests))
+            stats = requests.get(f'http://127.0.0.1:{port}/stats').json()
+        finally:
+            proc.terminate()
+            proc.wait()
+    finally:
+        mock_proc.terminate()
+        mock_proc.wait()
+
+    latency = args.latency_ms / 1000
+    serialized = args.requests * latency
+    ideal = -(-args.requests // args.server_concurrency) * latency
+    print(f'{args.requests} concurrent submitProof requests, {args.latency_ms:.0f} ms per EthVigil call')
+    print(f'{"elapsed":<28} {elapsed:8.2f} s | {args.requests / elapsed:8.1f} proofs/sec')
+    print(f'{"if serialized":<28} {serialized:8.2f} s')
+    print(f'{"ideal with --concurrency":<28} {ideal:8.2f} s')
+    print(f'{"median / max latency":<28} {latencies[len(latencies) // 2]:8.2f} s | {latencies[-1]:.2f} s')
+    if args.batch_window_ms:
+        print(f'{"batches / mean size":<28} {stats["batches"]:8d}   | {stats["mean_batch_size"]}')
+        print(f'{"batch sizes":<28} {stats["batch_sizes"]}')
+        print(f'{"mean window wait":<28} {stats["mean_window_wait_ms"]:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
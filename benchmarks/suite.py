@@ -0,0 +1,402 @@
+"""
+End-to-end benchmark suite: drives the examples in this repository against a local mock EthVigil server and reports
+p50/p99 latency and throughput of each, saving the results as JSON so that runs can be compared.
+
+python benchmarks/suite.py [--groups cli,scripts,submit_proof,listeners] [--latency-ms 20] [--jitter-ms 0]
+                           [--error-rate 0] [--output benchmark-results.json] [--compare baseline.json]
+
+Groups:
+  cli           erc20/cli.py commands, each launched as a fresh interpreter like a user would. Single calls report the
+                latency of the whole command; batch-mint, balances and deploy-many report the time of a run and rows/sec.
+                Errors are commands exiting with a non zero status
+  scripts       erc20/standalone_scripts, their main() called in-process with their placeholder endpoints and keys
+                swapped for the mock server's and a throwaway key
+  submit_proof  concurrent submitProof requests to EIP-712/submit_proof.py
+  listeners     webhook events posted to the erc20 and eth_sign webhook listeners over keep-alive connections
+
+With --compare, every scenario also found in the baseline results is checked: a p50 or p99 more than --tolerance
+higher, or a throughput more than --tolerance lower, counts as a regression and makes the suite exit non zero.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'benchmarks'))
+
+# before any of the examples' directories is put on sys.path, since they hold modules of the same names
+import webhook_listener as webhook_listener_benchmark  # noqa: E402
+import submit_proof as submit_proof_benchmark  # noqa: E402
+import mock_ethvigil  # noqa: E402
+
+GROUPS = ['cli', 'scripts', 'submit_proof', 'listeners']
+CONTRACT = '0x' + '22' * 20
+ACCOUNT = '0x774246187E1E2205C5920898eEde0945016080Df'
+PRIVATE_KEY = '0x' + '11' * 32
+# results are only comparable between runs against the same mock server
+MOCK_SETTINGS = ('latency_ms', 'jitter_ms', 'error_rate', 'error_status')
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an ascending list
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))]
+
+
+def summarize(group, name, latencies, elapsed, items=None, errors=0, unit='request'):
+    """
+    Result of a scenario: `latencies` are seconds per `unit`, `items` the number of requests or rows the scenario
+    got through in `elapsed` seconds, by default one per latency sample
+    """
+    latencies = sorted(latencies)
+    items = len(latencies) if items is None else items
+    return {
+        'group': group,
+        'name': name,
+        'unit': unit,
+        'samples': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'throughput': round(items / elapsed, 2) if elapsed else None,
+    }
+
+
+def print_result(result):
+    def fmt(value):
+        return f'{value:10.2f}' if value is not None else f'{"-":>10}'
+    print(f'{result["group"] + " " + result["name"]:<40} p50 {fmt(result["p50_ms"])} ms | p99 {fmt(result["p99_ms"])} ms'
+          f' | {fmt(result["throughput"])} /s | {result["samples"]} {result["unit"]}s, {result["errors"]} errors',
+          flush=True)
+
+
+async def post_all(port, path, bodies, connections, expected_status):
+    """
+    Posts `bodies` over `connections` keep-alive connections. Returns the latency of every request,
+    the number of responses with another status than `expected_status` and the elapsed time.
+    """
+    pending = iter(bodies)
+    latencies = list()
+    errors = 0
+
+    async def connection():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for body in pending:
+            start = time.perf_counter()
+            writer.write(b'POST %s HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: %d\r\n\r\n%s' % (path.encode(), len(body), body))
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(re.search(rb'content-length: *(\d+)', head, re.IGNORECASE).group(1))
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            errors += int(head.split(b' ', 2)[1]) != expected_status
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(connections)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def wait_for(url, proc, what):
+    deadline = time.time() + 15
+    while True:
+        try:
+            requests.get(url)
+            return
+        except requests.ConnectionError:
+            if proc.poll() is not None or time.time() > deadline:
+                proc.kill()
+                raise RuntimeError(f'{what} did not start')
+            time.sleep(0.1)
+
+
+def cli_workdir(internal_api_endpoint, rest_api_endpoint):
+    """
+    Scratch directory to run erc20/cli.py from, holding its settings.json, .env and contract source
+    """
+    workdir = tempfile.mkdtemp(prefix='ev-suite-')
+    with open(os.path.join(workdir, 'settings.json'), 'w') as f:
+        json.dump({'development': {'privatekey': PRIVATE_KEY, 'contractAddress': CONTRACT,
+                                   'REST_API_ENDPOINT': rest_api_endpoint,
+                                   'INTERNAL_API_ENDPOINT': internal_api_endpoint}}, f)
+    for name in ('.env', 'ERC20Mintable.sol'):
+        shutil.copy(os.path.join(REPO_ROOT, 'erc20', name), workdir)
+    return workdir
+
+
+def isolated_env(directory):
+    """
+    Environment pointing the session cache, read cache, deploy registry and event store into `directory`,
+    so that benchmarks leave the user's own ones in ~/.ethvigil alone
+    """
+    return dict(os.environ, EV_SESSION_CACHE=os.path.join(directory, 'session.json'),
+                EV_READ_CACHE=os.path.join(directory, 'read_cache.sqlite'),
+                EV_DEPLOY_REGISTRY=os.path.join(directory, 'deploys.json'),
+                EV_EVENT_STORE=os.path.join(directory, 'events.sqlite'))
+
+
+def bench_cli(args, workdir):
+    env = isolated_env(workdir)
+    cli = os.path.join(REPO_ROOT, 'erc20', 'cli.py')
+
+    def run(argv):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, cli] + argv, cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - start, proc.returncode != 0
+
+    # log in once, so that every command below uses the cached API key like it would in day to day use
+    run(['totalsupply', '--no-cache'])
+    results = list()
+    for name, argv in (('totalsupply', ['totalsupply', '--no-cache']),
+                       ('balanceof', ['balanceof', ACCOUNT, '--no-cache']),
+                       ('mint', ['mint', ACCOUNT, '1'])):
+        latencies, errors = list(), 0
+        start = time.perf_counter()
+        for _ in range(args.cli_runs):
+            latency, failed = run(argv)
+            latencies.append(latency)
+            errors += failed
+        results.append(summarize('cli', name, latencies, time.perf_counter() - start, errors=errors, unit='command'))
+
+    rows = args.bulk_rows
+    recipients = os.path.join(workdir, 'recipients.csv')
+    with open(recipients, 'w') as f:
+        f.writelines(f'0x{i:040x},1\n' for i in range(rows))
+    addresses = os.path.join(workdir, 'addresses.txt')
+    with open(addresses, 'w') as f:
+        f.writelines(f'0x{i:040x}\n' for i in range(rows))
+    manifest = os.path.join(workdir, 'tokens.csv')
+    with open(manifest, 'w') as f:
+        f.writelines(f'Token {i},TK{i},18\n' for i in range(args.deploy_rows))
+    for name, argv, items in (
+            ('batch-mint', lambda run_number: ['batch-mint', recipients, '--concurrency', '20',
+                                               '--checkpoint', os.path.join(workdir, f'mint-{run_number}.checkpoint')],
+             rows),
+            ('balances', lambda run_number: ['balances', addresses, '--concurrency', '20',
+                                             '-o', os.path.join(workdir, 'balances.csv')], rows),
+            ('deploy-many', lambda run_number: ['deploy-many', manifest, '--concurrency', '4', '--force',
+                                                '--webhook', 'http://127.0.0.1:9/hook',
+                                                '-o', os.path.join(workdir, 'deployed.csv')], args.deploy_rows)):
+        latencies, errors = list(), 0
+        for run_number in range(args.bulk_runs):
+            latency, failed = run(argv(run_number))
+            latencies.append(latency)
+            errors += failed
+        results.append(summarize('cli', name, latencies, sum(latencies), items=items * args.bulk_runs, errors=errors,
+                                 unit='run'))
+    return results
+
+
+def load_script(path):
+    spec = importlib.util.spec_from_file_location(f'standalone_{os.path.basename(path)[:-3]}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_scripts(args, workdir, mock_internal_api_endpoint, mock_rest_api_endpoint):
+    scripts_dir = os.path.join(REPO_ROOT, 'erc20', 'standalone_scripts')
+    modules = {name[:-3]: load_script(os.path.join(scripts_dir, name))
+               for name in sorted(os.listdir(scripts_dir)) if name.endswith('.py')}
+    from ethvigil_client import EthVigilClient
+    from eth_account.account import Account
+
+    class MockEndpointClient(EthVigilClient):
+        def __init__(self, rest_api_endpoint=None, internal_api_endpoint=None, **kwargs):
+            super().__init__(mock_rest_api_endpoint, mock_internal_api_endpoint, **kwargs)
+
+    class ThrowawayKeyAccount(Account):
+        @classmethod
+        def signHash(cls, message_hash, private_key):
+            return Account.signHash(message_hash, PRIVATE_KEY)
+
+        @classmethod
+        def from_key(cls, private_key):
+            return Account.from_key(PRIVATE_KEY)
+
+    registry = os.path.join(workdir, 'script-deploys.json')
+    os.environ['EV_DEPLOY_REGISTRY'] = registry
+    cwd = os.getcwd()
+    # deploy_contract.py reads ./ERC20Mintable.sol
+    os.chdir(workdir)
+    results = list()
+    try:
+        for name, module in modules.items():
+            module.EthVigilClient = MockEndpointClient
+            if hasattr(module, 'Account'):
+                module.Account = ThrowawayKeyAccount
+            latencies, errors = list(), 0
+            start = time.perf_counter()
+            for _ in range(args.script_runs):
+                if os.path.exists(registry):
+                    # deploy for real every time rather than answer from the deploy registry
+                    os.unlink(registry)
+                call_start = time.perf_counter()
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()) as output:
+                        module.main()
+                    errors += '"success": false' in output.getvalue() or 'Failed' in output.getvalue()
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - call_start)
+            results.append(summarize('scripts', name, latencies, time.perf_counter() - start, errors=errors,
+                                     unit='call'))
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def bench_submit_proof(args, rest_api_endpoint):
+    proc, port = submit_proof_benchmark.start_server(rest_api_endpoint, args.connections, 0)
+    try:
+        bodies = [json.dumps(submit_proof_benchmark.signed_proof(i)).encode() for i in range(args.requests)]
+        latencies, errors, elapsed = asyncio.run(post_all(port, '/flat', bodies, args.connections, 200))
+    finally:
+        proc.terminate()
+        proc.wait()
+    return [summarize('submit_proof', 'flat', latencies, elapsed, errors=errors)]
+
+
+def bench_listeners(args):
+    results = list()
+    for example, extra_options in (('erc20', []), ('eth_sign', ['--verify_workers=0'])):
+        port = mock_ethvigil.free_port()
+        event_log_dir = tempfile.mkdtemp(prefix='ev-suite-events-')
+        env = isolated_env(event_log_dir)
+        proc = subprocess.Popen(
+            [sys.executable, 'webhook_listener.py', f'--port={port}', f'--event_log_dir={event_log_dir}',
+             '--logging=none'] + extra_options,
+            cwd=os.path.join(REPO_ROOT, example), env=env, stdout=subprocess.DEVNULL
+        )
+        try:
+            wait_for(f'http://127.0.0.1:{port}/stats', proc, f'{example} webhook listener')
+            bodies = [webhook_listener_benchmark.event_body(i) for i in range(args.requests)]
+            latencies, errors, elapsed = asyncio.run(post_all(port, '/', bodies, args.connections, 202))
+        finally:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(event_log_dir, ignore_errors=True)
+        results.append(summarize('listeners', example, latencies, elapsed, errors=errors))
+    return results
+
+
+def compare(results, config, baseline_path, tolerance):
+    """
+    Prints the change of every scenario against the baseline results. Returns the number of regressions.
+    """
+    with open(baseline_path, 'r') as f:
+        baseline_run = json.load(f)
+    baseline = {(r['group'], r['name']): r for r in baseline_run['results']}
+    regressions = 0
+    print(f'\nAgainst {baseline_path} (tolerance {tolerance:.0%}):')
+    for setting in MOCK_SETTINGS:
+        if baseline_run['config'].get(setting) != config.get(setting):
+            print(f'Warning: the baseline was run with {setting} {baseline_run["config"].get(setting)}, '
+                  f'this run with {config.get(setting)}')
+    for result in results:
+        before = baseline.get((result['group'], result['name']))
+        if before is None:
+            continue
+        changes = list()
+        for metric, higher_is_worse in (('p50_ms', True), ('p99_ms', True), ('throughput', False)):
+            if not before.get(metric) or result.get(metric) is None:
+                continue
+            change = result[metric] / before[metric] - 1
+            regressed = change > tolerance if higher_is_worse else change < -tolerance
+            regressions += regressed
+            changes.append(f'{metric} {change:+7.1%}{" REGRESSION" if regressed else ""}')
+        print(f'{result["group"] + " " + result["name"]:<40} ' + ' | '.join(changes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', default=','.join(GROUPS), help='comma separated groups to run')
+    parser.add_argument('--latency-ms', type=float, default=20, help='latency of every mock EthVigil request')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='random extra latency, up to this many ms')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of mock EthVigil requests that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--cli-runs', type=int, default=10, help='launches of every single call CLI command')
+    parser.add_argument('--bulk-runs', type=int, default=3, help='runs of every bulk CLI command')
+    parser.add_argument('--bulk-rows', type=int, default=500, help='rows of the batch-mint and balances input')
+    parser.add_argument('--deploy-rows', type=int, default=20, help='tokens in the deploy-many manifest')
+    parser.add_argument('--script-runs', type=int, default=50, help='calls of every standalone script')
+    parser.add_argument('--requests', type=int, default=2000, help='requests posted to each server')
+    parser.add_argument('--connections', type=int, default=20, help='concurrent connections posting to each server')
+    parser.add_argument('--output', default='benchmark-results.json', help='JSON file to save the results to')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative change that counts as a regression')
+    args = parser.parse_args()
+    groups = args.groups.split(',')
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f'unknown groups {", ".join(sorted(unknown))}, choose from {", ".join(GROUPS)}')
+
+    mock_proc, internal_api_endpoint, rest_api_endpoint = mock_ethvigil.spawn(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        error_status=args.error_status
+    )
+    workdir = cli_workdir(internal_api_endpoint, rest_api_endpoint)
+    results = list()
+    try:
+        for group in GROUPS:
+            if group not in groups:
+                continue
+            if group == 'cli':
+                group_results = bench_cli(args, workdir)
+            elif group == 'scripts':
+                group_results = bench_scripts(args, workdir, internal_api_endpoint, rest_api_endpoint)
+            elif group == 'submit_proof':
+                group_results = bench_submit_proof(args, rest_api_endpoint)
+            else:
+                group_results = bench_listeners(args)
+            for result in group_results:
+                print_result(result)
+            results.extend(group_results)
+    finally:
+        mock_proc.terminate()
+        mock_proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    with open(args.output, 'w') as f:
+        json.dump({
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'config': vars(args),
+            'results': results,
+        }, f, indent=1)
+    print(f'Results saved to {args.output}')
+    if args.compare and compare(results, vars(args), args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
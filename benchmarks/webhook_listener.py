@@ -0,0 +1,139 @@
+"""
+Load test of the erc20 webhook listener: events/sec with 1, 2, 4, ... worker processes, up to the core count,
+and how evenly SO_REUSEPORT spread the events over the workers.
+
+Events are posted over keep-alive connections by `--clients` load generator processes. These share the machine
+with the listener, so leave them cores to run on: by default the listener gets half of the cores.
+
+python benchmarks/webhook_listener.py [--max-workers 4] [--clients 4] [--connections 32] [--duration 10]
+                                      [--dedup-shards 8]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'benchmarks'))
+
+import mock_ethvigil  # noqa: E402
+
+CONTRACT = '0x' + '22' * 20
+
+
+def event_body(i):
+    return json.dumps({
+        'txHash': '0x' + f'{i:064x}', 'logIndex': 0, 'blockNumber': 1000 + i, 'transactionIndex': 0,
+        'contract': CONTRACT, 'event_name': 'Transfer',
+        'event_data': {'from': '0x' + '11' * 20, 'to': '0x' + f'{i:040x}', 'value': 1},
+        'ethvigil_event_id': i, 'ctime': int(time.time())
+    }).encode()
+
+
+async def post_events(port, connections, duration):
+    deadline = time.perf_counter() + duration
+    counts = list()
+
+    async def connection(n):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        sent = 0
+        while time.perf_counter() < deadline:
+            body = event_body(n * 1000000 + sent)
+            writer.write(b'POST / HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(re.search(rb'content-length: *(\d+)', head, re.IGNORECASE).group(1))
+            await reader.readexactly(length)
+            assert head.split(b' ', 2)[1] == b'202', head
+            sent += 1
+        writer.close()
+        counts.append(sent)
+
+    await asyncio.gather(*(connection(n) for n in range(connections)))
+    return sum(counts)
+
+
+def load_generator(port, connections, duration, results):
+    results.put(asyncio.run(post_events(port, connections, duration)))
+
+
+def run(workers, args):
+    port = mock_ethvigil.free_port()
+    event_log_dir = tempfile.mkdtemp(prefix='event_log_')
+    # keeps the listener off the user's own stores
+    env = dict(os.environ, EV_READ_CACHE=os.path.join(event_log_dir, 'read_cache.sqlite'),
+               EV_EVENT_STORE=os.path.join(event_log_dir, 'events.sqlite'))
+    proc = subprocess.Popen(
+        [sys.executable, 'webhook_listener.py', f'--port={port}', f'--workers={workers}',
+         f'--event_log_dir={event_log_dir}', f'--dedup_shards={args.dedup_shards}', '--logging=none'],
+        cwd=os.path.join(REPO_ROOT, 'erc20'), env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                if len(requests.get(f'http://127.0.0.1:{port}/stats').json()['workers']) == workers:
+                    break
+            except requests.ConnectionError:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError('Webhook listener did not start')
+            time.sleep(0.1)
+        results = multiprocessing.Queue()
+        generators = [
+            multiprocessing.Process(target=load_generator, args=(port, args.connections, args.duration, results))
+            for _ in range(args.clients)
+        ]
+        start = time.perf_counter()
+        for generator in generators:
+            generator.start()
+        events = sum(results.get() for _ in generators)
+        elapsed = time.perf_counter() - start
+        for generator in generators:
+            generator.join()
+        stats = requests.get(f'http://127.0.0.1:{port}/stats').json()
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(event_log_dir)
+    shares = [w['share'] for w in stats['workers']]
+    return events / elapsed, min(shares), max(shares)
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-workers', type=int, default=max(1, cores // 2))
+    parser.add_argument('--clients', type=int, default=max(1, cores - cores // 2))
+    parser.add_argument('--connections', type=int, default=32, help='keep-alive connections per load generator')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--dedup-shards', type=int, default=8, help='--dedup_shards of the listener, which keeps the '
+                                                                    'ids of the events in SQLite with more than 1 worker')
+    args = parser.parse_args()
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= args.max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    print(f'{"workers":>7} {"events/sec":>12} {"speedup":>8} {"efficiency":>10} {"min share":>10} {"max share":>10}')
+    baseline = None
+    for workers in worker_counts:
+        rate, min_share, max_share = run(workers, args)
+        baseline = baseline or rate
+        print(f'{workers:>7} {rate:>12.1f} {rate / baseline:>7.2f}x {rate / baseline / workers:>10.0%} '
+              f'{min_share:>10.3f} {max_share:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,6 @@
 import click
-import requests
-
-from eth_account.messages import defunct_hash_message
-from eth_account.account import Account
+import functools
 import json
-from dynaconf import settings
 
 
 CONTEXT_SETTINGS = dict(
@@ -12,32 +8,115 @@ CONTEXT_SETTINGS = dict(
 )
 
 
+class ContextObject(dict):
+    """
+    Context object handed to every command.
+
+    Settings are read from settings.json, and the API key obtained from the session cache or /login,
+    only when a command first looks them up, so commands pay only for what they actually use.
+    """
+    settings_keys = {
+        'private_key': 'privatekey',
+        'contract_address': 'contractAddress',
+        'internal_api_endpoint': 'INTERNAL_API_ENDPOINT',
+        'rest_api_endpoint': 'REST_API_ENDPOINT'
+    }
+
+    def load_settings(self):
+        from profiling import span
+        with span('load settings.json', 'settings'):
+            from dynaconf import settings
+            from session_cache import SessionCache
+            for key, setting in self.settings_keys.items():
+                self[key] = settings[setting]
+            self['session_cache'] = SessionCache(ttl=settings.get('SESSION_CACHE_TTL', 12 * 3600))
+        if self['contract_address'] == "" or not self['contract_address']:
+            click.echo("Contract address was not supplied in configuration")
+
+    def __missing__(self, key):
+        if key in self.settings_keys or key == 'session_cache':
+            self.load_settings()
+        elif key == 'read_cache':
+            from dynaconf import settings
+            from read_cache import ReadCache
+            # off unless configured: without a webhook listener invalidating it, cached reads go stale
+            ttl = settings.get('READ_CACHE_TTL', 0)
+            self['read_cache'] = ReadCache(ttl=ttl, endpoint=self['rest_api_endpoint']) if ttl > 0 else None
+        elif key == 'ledger':
+            from dynaconf import settings
+            from ledger import Ledger
+            self['ledger'] = Ledger.from_event_log(settings.get('EVENT_LOG_DIR', 'events'))
+        elif key == 'client':
+            from dynaconf import settings
+            from ethvigil_client import EthVigilClient
+            self['client'] = EthVigilClient(self['rest_api_endpoint'], self['internal_api_endpoint'],
+                                            gzip_deploys=settings.get('GZIP_DEPLOYS', False))
+        elif key == 'api_key':
+            from profiling import span
+            from session_cache import get_api_key
+            with span('get API key', 'login'):
+                self['api_key'] = get_api_key(self['internal_api_endpoint'], self['private_key'],
+                                              functools.partial(ev_login, client=self['client']),
+                                              cache=self['session_cache'])
+        else:
+            raise KeyError(key)
+        return self[key]
+
+
 @click.group(context_settings=CONTEXT_SETTINGS)
+@click.option('--profile', is_flag=True, help='Print the time the command spent on imports, settings, login, signing, '
+                                               'HTTP calls and JSON parsing')
+@click.option('--profile-dump', type=click.Path(dir_okay=False),
+              help='Profile the command with cProfile as well and write the stats to this file')
+@click.option('--profile-trace', type=click.Path(dir_okay=False),
+              help='Write the timed spans to this file in the Trace Event Format, for chrome://tracing or Perfetto')
 @click.pass_context
-def cli(ctx):
-    private_key = settings['privatekey']
-    api_endpoint = settings['INTERNAL_API_ENDPOINT']
-    rest_api_endpoint = settings['REST_API_ENDPOINT']
-    api_key = ev_login(api_endpoint, private_key)
-    contract_addr = settings['contractAddress']
-    if contract_addr == "" or not contract_addr:
-        click.echo("Contract address was not supplied in configuration")
-    ctx.obj = {
-        'api_key': api_key,
-        'private_key': private_key,
-        'contract_address': contract_addr,
-        'internal_api_endpoint': api_endpoint,
-        'rest_api_endpoint': rest_api_endpoint
-    }
+def cli(ctx, profile, profile_dump, profile_trace):
+    ctx.obj = ContextObject()
+    if profile or profile_dump or profile_trace:
+        start_profiling(ctx, profile_dump, profile_trace)
 
 
-def ev_login(api_endpoint, private_key):
+def start_profiling(ctx, dump_path=None, trace_path=None):
+    """
+    Times the phases of the command about to run and prints their breakdown to stderr once it is done
+    """
+    import cProfile
+    import profiling
+    profiler = profiling.start()
+    if dump_path:
+        c_profiler = cProfile.Profile()
+        c_profiler.enable()
+
+    def report():
+        if dump_path:
+            c_profiler.disable()
+            c_profiler.dump_stats(dump_path)
+        profiler.stop()
+        for line in profiler.breakdown(ctx.invoked_subcommand or ctx.info_name):
+            click.echo(line, err=True)
+        if trace_path:
+            profiler.write_trace(trace_path)
+            click.echo(f'Trace written to {trace_path}', err=True)
+        if dump_path:
+            click.echo(f'cProfile stats written to {dump_path}', err=True)
+
+    ctx.call_on_close(report)
+
+
+def ev_login(api_endpoint, private_key, client=None):
+    import requests
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
+    from ethvigil_client import EthVigilClient
+    from profiling import span
+    client = client or EthVigilClient(internal_api_endpoint=api_endpoint)
     msg = "Trying to login"
-    message_hash = defunct_hash_message(text=msg)
-    signed_msg = Account.signHash(message_hash, private_key)
+    with span('sign login message', 'sign'):
+        message_hash = defunct_hash_message(text=msg)
+        signed_msg = Account.signHash(message_hash, private_key)
     # --ethvigil API CALL---
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
-    r = requests.post(api_endpoint + '/login', json={'msg': msg, 'sig': signed_msg.signature.hex()}, headers=headers)
+    r = client.login(msg, signed_msg.signature.hex())
     if r.status_code == requests.codes.ok:
         r = r.json()
         return r['data']['key']
@@ -45,9 +124,90 @@ def ev_login(api_endpoint, private_key):
         return None
 
 
+def ev_request(ctx_obj, method, url, method_args=None, key_field=None):
+    """
+    Sends an API request authenticated with the cached API key, either as the X-API-KEY header
+    or as the `key_field` of the JSON body.
+    If the API rejects the key, logs in again once and retries with the fresh key.
+    """
+    import requests
+    from session_cache import get_api_key
+    r = None
+    for refresh in (False, True):
+        if refresh:
+            ctx_obj['api_key'] = get_api_key(ctx_obj['internal_api_endpoint'], ctx_obj['private_key'],
+                                             functools.partial(ev_login, client=ctx_obj['client']),
+                                             refresh=True, cache=ctx_obj['session_cache'])
+        if key_field:
+            method_args[key_field] = ctx_obj['api_key']
+            r = ctx_obj['client'].request(method, url, json=method_args)
+        else:
+            r = ctx_obj['client'].request(method, url, json=method_args, api_key=ctx_obj['api_key'])
+        if r.status_code not in (requests.codes.unauthorized, requests.codes.forbidden):
+            break
+    return r
+
+
+def ev_read(ctx_obj, method, *args, use_cache=True):
+    """
+    Calls a read-only method of the configured contract and returns the response body.
+    Successful responses are served from and stored in the read cache shared with the webhook listener, if enabled.
+    """
+    contract_address = ctx_obj['contract_address']
+    use_cache = use_cache and ctx_obj['read_cache'] is not None
+    if use_cache:
+        from read_cache import ReadCache
+        key = ReadCache.key(contract_address, method, *args)
+        cached = ctx_obj['read_cache'].get(key)
+        if cached is not None:
+            return cached
+    r = ev_request(ctx_obj, 'get', ctx_obj['client'].contract_url(contract_address, method, *args))
+    if use_cache and r.status_code == 200 and r.json().get('success'):
+        ctx_obj['read_cache'].put(key, r.text)
+    return r.text
+
+
+def forget_reads(ctx_obj):
+    """
+    Drops the cached reads of the configured contract once a command sent transactions to it, so that reads right
+    after it are not answered with the balances from before
+    """
+    if ctx_obj['read_cache'] is not None:
+        ctx_obj['read_cache'].invalidate_contract(ctx_obj['contract_address'])
+
+
+def ledger_read(ctx_obj, method, *args):
+    """
+    Answers a call to a read-only method of the configured contract from the token ledger kept by the webhook listener,
+    without calling the API. Returns a response body in the same format as the API.
+    """
+    ledger = ctx_obj['ledger']
+    read = {'balanceOf': ledger.balance_of, 'allowance': ledger.allowance, 'totalSupply': ledger.supply}[method]
+    return json.dumps({'success': True, 'data': [{'uint256': read(ctx_obj['contract_address'], *args)}]})
+
+
+async def ev_call_async(ctx_obj, client_method, *args):
+    """
+    Counterpart of ev_request for AsyncEthVigilClient methods: if the API rejects the key, logs in again once
+    and retries with the fresh key. Concurrent calls rejected with the same key trigger a single login.
+    """
+    from session_cache import get_api_key
+    api_key = ctx_obj['api_key']
+    r = await client_method(*args, api_key=api_key)
+    if r.status_code in (401, 403):
+        if ctx_obj['api_key'] == api_key:
+            # blocks the event loop, but at most once per rejected key
+            ctx_obj['api_key'] = get_api_key(ctx_obj['internal_api_endpoint'], ctx_obj['private_key'],
+                                             functools.partial(ev_login, client=ctx_obj['client']),
+                                             refresh=True, cache=ctx_obj['session_cache'])
+        r = await client_method(*args, api_key=ctx_obj['api_key'])
+    return r
+
+
 @cli.command()
+@click.option('--force', is_flag=True, help='Deploy even if the same contract was deployed before')
 @click.pass_obj
-def deploy(ctx_obj):
+def deploy(ctx_obj, force):
     """
     Deploys a new instance of ERC20Mintable.sol on EthVigil.
     When prompted, enter a JSON-compatible list of constructor inputs to be passed on to the ERC20Mintable contract.
@@ -56,7 +216,13 @@ def deploy(ctx_obj):
     NOTE: Enter double quoted strings. Single quoted strings are not supported as JSON serialized.
 
     Check deploy.py for a code example
+
+    A deploy of the same source with the same constructor inputs, endpoint and account as an earlier successful one
+    is not sent again: the known results are shown instead, unless --force is passed.
     """
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
+    from deploy_registry import deploy_once
     msg = "Trying to deploy"
     message_hash = defunct_hash_message(text=msg)
     private_key = ctx_obj['private_key']
@@ -95,19 +261,134 @@ def deploy(ctx_obj):
     }
     click.echo('Deploying with constructor arguments: ')
     click.echo(constructor_inputs)
-    # API call to deploy
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
-    r = requests.post(ctx_obj['internal_api_endpoint']+'/deploy', json=deploy_params, headers=headers)
-    rj = r.json()
+    # API call to deploy, unless this exact deploy succeeded before
+    rj, known = deploy_once(ctx_obj['client'], deploy_params, Account.from_key(private_key).address, force=force)
+    if known:
+        click.echo('This contract was already deployed with the same source and constructor inputs. '
+                   'Pass --force to deploy another instance.')
     click.echo('Deployed contract results')
     click.echo(rj)
     if rj['success']:
         click.echo('Copy the contract address into settings.json')
 
 
+@cli.command('deploy-many')
+@click.argument('manifest', required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', '-o', help='CSV or NDJSON file to write the deployed contract addresses to. '
+                                     'Defaults to <manifest>.deployed.csv')
+@click.option('--concurrency', default=4, show_default=True, help='Maximum number of deploys in flight')
+@click.option('--webhook', help='Register this URL as a webhook on every newly deployed contract')
+@click.option('--events', default='*', show_default=True,
+              help='Comma separated events to subscribe the webhook to, * for all events')
+@click.option('--force', is_flag=True, help='Deploy even if the same contract was deployed before')
+@click.option('--format', 'input_format', type=click.Choice(['csv', 'ndjson']),
+              help='Input format. Guessed from the file extension by default')
+@click.pass_obj
+def deploy_many(ctx_obj, manifest, output, concurrency, webhook, events, force, input_format):
+    """
+    Deploys an instance of ERC20Mintable.sol for every token listed in <manifest>, up to --concurrency at a time.
+
+    <manifest>: CSV file of `name,symbol,decimals` rows (header row optional),
+    or NDJSON file of {"name": ..., "symbol": ..., "decimals": ...} objects.
+
+    Tokens already deployed with the same constructor inputs are not deployed again, unless --force is passed,
+    so an interrupted run can simply be started again. The contract address of every row is written to --output.
+    """
+    import asyncio
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
+    from dynaconf import settings
+    from bulk import Progress, RecordWriter, iter_records, run_bounded
+    from deploy_registry import DeployRegistry, deploy_once_async
+    from ethvigil_async_client import AsyncEthVigilClient
+    private_key = ctx_obj['private_key']
+    # log in before entering the event loop, only needed to register webhooks
+    if webhook and not ctx_obj['api_key']:
+        click.echo('Could not log in to EthVigil. Check the privatekey and INTERNAL_API_ENDPOINT in settings.json')
+        return
+    msg = "Trying to deploy"
+    sig = Account.signHash(defunct_hash_message(text=msg), private_key).signature.hex()
+    hook_msg = 'dummystring'
+    hook_sig = Account.signHash(defunct_hash_message(text=hook_msg), private_key).signature.hex()
+    address = Account.from_key(private_key).address
+    with open('./ERC20Mintable.sol', 'r') as f:
+        contract_code = f.read()
+    registry = DeployRegistry()
+    fields = ['name', 'symbol', 'decimals']
+    writer = RecordWriter(output or manifest + '.deployed.csv',
+                          ['row'] + fields + ['state', 'contract', 'txhash', 'hook_id', 'error'])
+    progress = Progress(click.echo, 'Contracts deployed')
+    counts = {'deployed': 0, 'known': 0, 'failed': 0, 'hook_failed': 0}
+
+    async def main():
+        client = AsyncEthVigilClient(internal_api_endpoint=ctx_obj['internal_api_endpoint'], concurrency=concurrency,
+                                     gzip_deploys=settings.get('GZIP_DEPLOYS', False))
+
+        async def hook_call(client_method, method_args, api_key=None):
+            # the hooks API takes the key in the request body
+            return await client_method(dict(method_args, key=api_key))
+
+        async def register_hook(contract):
+            method_args = {'msg': hook_msg, 'sig': hook_sig, 'type': 'web', 'contract': contract, 'web': webhook}
+            r = await ev_call_async(ctx_obj, hook_call, client.add_hook, method_args)
+            rj = r.json() if r.status_code == 200 else dict()
+            if not rj.get('success'):
+                raise ValueError(f'Failed to register webhook: HTTP {r.status_code}: {r.text[:500]}')
+            hook_id = rj['data']['id']
+            method_args = {'msg': hook_msg, 'sig': hook_sig, 'type': 'web', 'contract': contract, 'id': hook_id,
+                           'events': events.split(',')}
+            r = await ev_call_async(ctx_obj, hook_call, client.update_hook_events, method_args)
+            if r.status_code != 200 or not r.json().get('success'):
+                raise ValueError(f'Failed to add hook {hook_id} to events: HTTP {r.status_code}: {r.text[:500]}')
+            return hook_id
+
+        async def deploy_row(row):
+            row_number, record = row
+            result = dict(record, row=row_number)
+            try:
+                inputs = [record['name'], record['symbol'], int(record['decimals'])]
+                deploy_params = {'msg': msg, 'sig': sig, 'name': 'ERC20Mintable', 'inputs': inputs,
+                                 'code': contract_code}
+                rj, known = await deploy_once_async(client, deploy_params, address, registry=registry, force=force)
+            except Exception as e:
+                result.update(state='failed', error=repr(e))
+            else:
+                if rj.get('success'):
+                    result.update(state='known' if known else 'deployed', contract=rj['data']['contract'],
+                                  txhash=rj['data'].get('txhash'))
+                else:
+                    result.update(state='failed', error=json.dumps(rj)[:500])
+            counts[result['state']] += 1
+            if webhook and result['state'] == 'deployed':
+                try:
+                    result['hook_id'] = await register_hook(result['contract'])
+                except Exception as e:
+                    counts['hook_failed'] += 1
+                    result['error'] = str(e)
+            writer.write(result)
+            progress.update()
+
+        try:
+            await run_bounded(iter_records(manifest, fields, input_format), deploy_row, concurrency)
+        finally:
+            client.close()
+
+    try:
+        asyncio.run(main())
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        writer.close()
+    click.echo(progress.summary())
+    click.echo(f'Deployed: {counts["deployed"]} | already deployed: {counts["known"]} | failed: {counts["failed"]}'
+               + (f' | webhook registration failed: {counts["hook_failed"]}' if webhook else ''))
+    click.echo(f'Contract addresses written to {writer.path}')
+
+
 @cli.command()
 @click.pass_obj
 def init(ctx_obj):
+    ctx_obj.load_settings()
     print("Got context object")
     print(ctx_obj)
 
@@ -126,35 +407,191 @@ def mint(ctx_obj, to_address, amount):
     <amount>: units of new tokens to be minted
 
     """
-    api_key = ctx_obj['api_key']
     contract_addr = ctx_obj['contract_address']
     if contract_addr == "":
         click.echo('No contract address configured to send the transaction to. Check settings.json')
         return
     method_args = {'account': to_address, 'amount': amount}
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{ctx_obj["rest_api_endpoint"]}/contract/{contract_addr}/mint'
+    method_api_endpoint = ctx_obj['client'].contract_url(contract_addr, 'mint')
     click.echo('Calling mint()\n........')
     click.echo(f'Contract: {contract_addr}')
     click.echo(f'Method arguments:\n===============\n{method_args}')
-    r = requests.post(url=method_api_endpoint, json=method_args, headers=headers)
+    r = ev_request(ctx_obj, 'post', method_api_endpoint, method_args)
+    forget_reads(ctx_obj)
     click.echo(r.text)
 
 
+@cli.command('batch-mint')
+@click.argument('recipients', required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--checkpoint', help='Checkpoint file recording the outcome of every row. '
+                                   'Defaults to <recipients>.checkpoint')
+@click.option('--concurrency', default=10, show_default=True, help='Maximum number of mint() calls in flight')
+@click.option('--format', 'input_format', type=click.Choice(['csv', 'ndjson']),
+              help='Input format. Guessed from the file extension by default')
+@click.option('--retry-unknown', is_flag=True, help='Also resend rows whose outcome was not known when a previous '
+                                                    'run stopped. These may already have been minted.')
+@click.pass_obj
+def batch_mint(ctx_obj, recipients, checkpoint, concurrency, input_format, retry_unknown):
+    """
+    Mints tokens to many addresses listed in <recipients>, sending up to --concurrency calls at a time.
+
+    <recipients>: CSV file of `to_address,amount` rows (header row optional),
+    or NDJSON file of {"to_address": ..., "amount": ...} objects.
+
+    The outcome of every row is recorded in the checkpoint file. Run the same command again to resume
+    an interrupted run: rows already minted are skipped.
+    """
+    import asyncio
+    from bulk import Checkpoint, Progress, error_outcome, iter_records, outcome, run_bounded
+    from ethvigil_async_client import AsyncEthVigilClient
+    contract_addr = ctx_obj['contract_address']
+    if contract_addr == "":
+        click.echo('No contract address configured to send the transaction to. Check settings.json')
+        return
+    # log in before entering the event loop
+    if not ctx_obj['api_key']:
+        click.echo('Could not log in to EthVigil. Check the privatekey and INTERNAL_API_ENDPOINT in settings.json')
+        return
+    checkpoint = Checkpoint(checkpoint or recipients + '.checkpoint', retry_unknown=retry_unknown)
+    progress = Progress(lambda line: click.echo(line, err=True), 'Minted')
+
+    def pending_rows():
+        for row_number, record in iter_records(recipients, ['to_address', 'amount'], input_format):
+            identity = f'{record["to_address"]}:{record["amount"]}'
+            if not checkpoint.should_skip(row_number, identity):
+                yield row_number, record, identity
+
+    async def main():
+        client = AsyncEthVigilClient(ctx_obj['rest_api_endpoint'], contract_address=contract_addr,
+                                     concurrency=concurrency)
+
+        async def mint_row(row):
+            row_number, record, identity = row
+            checkpoint.mark_pending(row_number, identity)
+            try:
+                r = await ev_call_async(ctx_obj, client.mint, record['to_address'], record['amount'])
+            except Exception as e:
+                state, details = error_outcome(e)
+            else:
+                state, details = outcome(r)
+            checkpoint.mark(row_number, state, **details)
+            progress.update()
+
+        try:
+            await run_bounded(pending_rows(), mint_row, concurrency)
+        finally:
+            client.close()
+
+    try:
+        asyncio.run(main())
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        checkpoint.close()
+        forget_reads(ctx_obj)
+    click.echo(progress.summary())
+    counts = checkpoint.counts()
+    click.echo(f'Checkpoint {checkpoint.path}: ' + ', '.join(f'{state}: {n}' for state, n in sorted(counts.items())))
+    if counts.get('failed'):
+        click.echo('Failed rows were rejected by the API or could not reach it, and will be retried when the command is '
+                   'run again.')
+    if counts.get('unknown') or counts.get('pending'):
+        click.echo('Rows in the unknown/pending state may or may not have been minted. Check them on chain '
+                   'before rerunning with --retry-unknown.')
+
+
 @cli.command()
 @click.argument('account', required=True)
+@click.option('--no-cache', is_flag=True, help='Always ask the API, bypassing the read cache')
+@click.option('--local', is_flag=True, help='Answer from the token ledger kept by the webhook listener')
 @click.pass_obj
-def balanceof(ctx_obj, account):
+def balanceof(ctx_obj, account, no_cache, local):
     """
     Fetches the tokens allotted to an address specified by <account> on this contract instance
     """
-    api_key = ctx_obj['api_key']
-    rest_api_endpoint = ctx_obj['rest_api_endpoint']
+    if local:
+        print(ledger_read(ctx_obj, 'balanceOf', account))
+        return
+    print(ev_read(ctx_obj, 'balanceOf', account, use_cache=not no_cache))
+
+
+@cli.command()
+@click.argument('addresses', required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', '-o', default='-', show_default=True, help='CSV or NDJSON file to write balances to')
+@click.option('--concurrency', default=20, show_default=True, help='Maximum number of balanceOf() calls in flight')
+@click.option('--format', 'input_format', type=click.Choice(['csv', 'ndjson']),
+              help='Input format. Guessed from the file extension by default')
+@click.pass_obj
+def balances(ctx_obj, addresses, output, concurrency, input_format):
+    """
+    Fetches the token balances of every address listed in <addresses>, along with totalSupply.
+
+    <addresses>: one address per line (or the first column of a CSV file),
+    or NDJSON file of {"address": ...} objects.
+
+    Balances are written to --output as they arrive, as `address,balance,error` CSV rows or NDJSON objects.
+    Finally the sum of the balances fetched is compared against totalSupply.
+    """
+    import asyncio
+    from bulk import Progress, RecordWriter, iter_records, read_value, run_bounded
+    from ethvigil_async_client import AsyncEthVigilClient
     contract_address = ctx_obj['contract_address']
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{rest_api_endpoint}/contract/{contract_address}/balanceOf/{account}'
-    r = requests.get(url=method_api_endpoint, headers=headers)
-    print(r.text)
+    if not ctx_obj['api_key']:
+        click.echo('Could not log in to EthVigil. Check the privatekey and INTERNAL_API_ENDPOINT in settings.json')
+        return
+    writer = RecordWriter(output, ['address', 'balance', 'error'])
+    # keep stdout clean for the balances when they are written there
+    progress = Progress(lambda line: click.echo(line, err=True), 'Balances fetched')
+    totals = {'sum': 0, 'errors': 0, 'total_supply': None}
+
+    async def main():
+        client = AsyncEthVigilClient(ctx_obj['rest_api_endpoint'], contract_address=contract_address,
+                                     concurrency=concurrency)
+
+        async def fetch_balance(row):
+            row_number, record = row
+            try:
+                balance = int(read_value(await ev_call_async(ctx_obj, client.balance_of, record['address'])))
+            except Exception as e:
+                totals['errors'] += 1
+                writer.write({'address': record['address'], 'error': str(e)})
+            else:
+                totals['sum'] += balance
+                writer.write({'address': record['address'], 'balance': balance})
+            progress.update()
+
+        async def fetch_total_supply():
+            try:
+                totals['total_supply'] = int(read_value(await ev_call_async(ctx_obj, client.total_supply)))
+            except Exception as e:
+                click.echo(f'Fetching totalSupply failed: {e}', err=True)
+
+        try:
+            total_supply = asyncio.ensure_future(fetch_total_supply())
+            await run_bounded(iter_records(addresses, ['address'], input_format), fetch_balance, concurrency)
+            await total_supply
+        finally:
+            client.close()
+
+    try:
+        asyncio.run(main())
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        writer.close()
+    click.echo(progress.summary(), err=True)
+    if totals['total_supply'] is None:
+        click.echo(f'Sum of balances: {totals["sum"]} | totalSupply could not be fetched', err=True)
+        return
+    click.echo(f'Sum of balances: {totals["sum"]} | totalSupply: {totals["total_supply"]} | '
+               f'difference: {totals["total_supply"] - totals["sum"]}', err=True)
+    if totals['errors']:
+        click.echo(f'{totals["errors"]} balances could not be fetched, see the error column', err=True)
+    elif totals['sum'] == totals['total_supply']:
+        click.echo('Sum check passed: the balances add up to totalSupply', err=True)
+    else:
+        click.echo('Sum check failed: the address list does not cover all holders, or balances changed while '
+                   'they were being fetched', err=True)
 
 
 @cli.command()
@@ -165,18 +602,17 @@ def approve(ctx_obj, spender_address, tokens):
     """
     Approves <spender_address> to spend  <tokens> on behalf of msg.sender
     """
-    api_key = ctx_obj['api_key']
     contract_addr = ctx_obj['contract_address']
     if contract_addr == "":
         click.echo('No contract address configured to send the transaction to. Check settings.json')
         return
     method_args = {'spender': spender_address, 'value': tokens}
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{ctx_obj["rest_api_endpoint"]}/contract/{contract_addr}/approve'
+    method_api_endpoint = ctx_obj['client'].contract_url(contract_addr, 'approve')
     click.echo('Calling approve()\n........')
     click.echo(f'Contract: {contract_addr}')
     click.echo(f'Method arguments:\n===============\n{method_args}')
-    r = requests.post(url=method_api_endpoint, json=method_args, headers=headers)
+    r = ev_request(ctx_obj, 'post', method_api_endpoint, method_args)
+    forget_reads(ctx_obj)
     click.echo(r.text)
 
 
@@ -192,21 +628,105 @@ def transferfrom(ctx_obj, sender, recipient, amount):
 
     NOTE: The EthVigil API signer address for Gorli testnet, 0x3dc7d43d5f180661970387a4f89c7e715b567512, needs to be approve()-d by the <sender> first.
     """
-    api_key = ctx_obj['api_key']
     contract_addr = ctx_obj['contract_address']
     if contract_addr == "":
         click.echo('No contract address configured to send the transaction to. Check settings.json')
         return
     method_args = {'sender': sender, 'recipient': recipient, 'amount': amount}
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{ctx_obj["rest_api_endpoint"]}/contract/{contract_addr}/transferFrom'
+    method_api_endpoint = ctx_obj['client'].contract_url(contract_addr, 'transferFrom')
     click.echo('Calling transferFrom()\n........')
     click.echo(f'Contract: {contract_addr}')
     click.echo(f'Method arguments:\n===============\n{method_args}')
-    r = requests.post(url=method_api_endpoint, json=method_args, headers=headers)
+    r = ev_request(ctx_obj, 'post', method_api_endpoint, method_args)
+    forget_reads(ctx_obj)
     click.echo(r.text)
 
 
+@cli.command()
+@click.argument('transfers', required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', '-o', help='CSV or NDJSON file to write per-row outcomes to. '
+                                     'Defaults to <transfers>.results.csv')
+@click.option('--concurrency', default=10, show_default=True,
+              help='Number of lanes sending transfers in parallel. Transfers from one sender always share a lane')
+@click.option('--retries', default=3, show_default=True, help='Retries per transfer on transient failures')
+@click.option('--format', 'input_format', type=click.Choice(['csv', 'ndjson']),
+              help='Input format. Guessed from the file extension by default')
+@click.pass_obj
+def payout(ctx_obj, transfers, output, concurrency, retries, input_format):
+    """
+    Sends many transferFrom() calls listed in <transfers>, in parallel across senders.
+
+    <transfers>: CSV file of `sender,recipient,amount` rows (header row optional),
+    or NDJSON file of {"sender": ..., "recipient": ..., "amount": ...} objects.
+
+    Transfers from the same sender are sent one at a time, in file order, so that its allowance is drawn down
+    predictably. Refused connections, failed DNS lookups and 429/503 responses are retried with backoff.
+    The outcome of every row is written to --output and a summary is printed at the end.
+
+    NOTE: The EthVigil API signer address needs to be approve()-d by every sender first, see transferfrom --help.
+    """
+    import asyncio
+    from bulk import Progress, RecordWriter, error_outcome, iter_records, outcome, run_partitioned, with_retries
+    from ethvigil_async_client import AsyncEthVigilClient
+    contract_addr = ctx_obj['contract_address']
+    if contract_addr == "":
+        click.echo('No contract address configured to send the transaction to. Check settings.json')
+        return
+    if not ctx_obj['api_key']:
+        click.echo('Could not log in to EthVigil. Check the privatekey and INTERNAL_API_ENDPOINT in settings.json')
+        return
+    fields = ['sender', 'recipient', 'amount']
+    writer = RecordWriter(output or transfers + '.results.csv',
+                          ['row'] + fields + ['state', 'txHash', 'attempts', 'status_code', 'response', 'error'])
+    progress = Progress(click.echo, 'Transfers sent')
+    counts = {'done': 0, 'failed': 0, 'unknown': 0, 'retried': 0}
+
+    async def main():
+        client = AsyncEthVigilClient(ctx_obj['rest_api_endpoint'], contract_address=contract_addr,
+                                     concurrency=concurrency)
+
+        async def transfer(row):
+            row_number, record = row
+            attempts = 0
+
+            async def send():
+                nonlocal attempts
+                attempts += 1
+                return await ev_call_async(ctx_obj, client.transfer_from,
+                                           record['sender'], record['recipient'], record['amount'])
+
+            try:
+                r = await with_retries(send, retries=retries)
+            except Exception as e:
+                state, details = error_outcome(e)
+            else:
+                state, details = outcome(r)
+            counts[state] += 1
+            counts['retried'] += attempts > 1
+            writer.write(dict(record, row=row_number, state=state, attempts=attempts, **details))
+            progress.update()
+
+        try:
+            await run_partitioned(iter_records(transfers, fields, input_format),
+                                  lambda row: row[1]['sender'].lower(), transfer, concurrency)
+        finally:
+            client.close()
+
+    try:
+        asyncio.run(main())
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        writer.close()
+        forget_reads(ctx_obj)
+    click.echo(progress.summary())
+    click.echo(f'Succeeded: {counts["done"]} | failed: {counts["failed"]} | outcome unknown: {counts["unknown"]} | '
+               f'needed retries: {counts["retried"]}')
+    if counts['failed'] or counts['unknown']:
+        click.echo(f'See {writer.path} for the failed transfers. Transfers with an unknown outcome may still '
+                   f'have gone through: check them on chain before sending them again.')
+
+
 @cli.command()
 @click.argument('spender', required=True)
 @click.argument('added_value')
@@ -218,18 +738,17 @@ def increaseallowance(ctx_obj, spender, added_value):
      *
      * Emits an Approval event indicating the updated allowance.
     """
-    api_key = ctx_obj['api_key']
     contract_addr = ctx_obj['contract_address']
     if contract_addr == "":
         click.echo('No contract address configured to send the transaction to. Check settings.json')
         return
     method_args = {'spender': spender, 'addedValue': added_value}
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{ctx_obj["rest_api_endpoint"]}/contract/{contract_addr}/increaseAllowance'
+    method_api_endpoint = ctx_obj['client'].contract_url(contract_addr, 'increaseAllowance')
     click.echo('Calling increaseAllowance()\n........')
     click.echo(f'Contract: {contract_addr}')
     click.echo(f'Method arguments:\n===============\n{method_args}')
-    r = requests.post(url=method_api_endpoint, json=method_args, headers=headers)
+    r = ev_request(ctx_obj, 'post', method_api_endpoint, method_args)
+    forget_reads(ctx_obj)
     click.echo(r.text)
 
 
@@ -244,59 +763,59 @@ def decreaseallowance(ctx_obj, spender, subtracted_value):
          *
          * Emits an Approval event indicating the updated allowance.
     """
-    api_key = ctx_obj['api_key']
     contract_addr = ctx_obj['contract_address']
     if contract_addr == "":
         click.echo('No contract address configured to send the transaction to. Check settings.json')
         return
     method_args = {'spender': spender, 'subtractedValue': subtracted_value}
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{ctx_obj["rest_api_endpoint"]}/contract/{contract_addr}/decreaseAllowance'
+    method_api_endpoint = ctx_obj['client'].contract_url(contract_addr, 'decreaseAllowance')
     click.echo('Calling decreaseAllowance()\n........')
     click.echo(f'Contract: {contract_addr}')
     click.echo(f'Method arguments:\n===============\n{method_args}')
-    r = requests.post(url=method_api_endpoint, json=method_args, headers=headers)
+    r = ev_request(ctx_obj, 'post', method_api_endpoint, method_args)
+    forget_reads(ctx_obj)
     click.echo(r.text)
 
 
 @cli.command()
 @click.argument('owner', required=True)
 @click.argument('spender', required=True)
+@click.option('--no-cache', is_flag=True, help='Always ask the API, bypassing the read cache')
+@click.option('--local', is_flag=True, help='Answer from the token ledger kept by the webhook listener')
 @click.pass_obj
-def allowance(ctx_obj, owner, spender):
+def allowance(ctx_obj, owner, spender, no_cache, local):
     """
     Returns the remaining number of tokens that `spender` will be allowed to spend on behalf of `owner` through {transferFrom}.
     This is zero by default.
     """
-    api_key = ctx_obj['api_key']
     contract_address = ctx_obj['contract_address']
-    rest_api_endpoint = ctx_obj['rest_api_endpoint']
     if contract_address == "":
         click.echo('No contract address configured to send the transaction to. Check settings.json')
         return
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{rest_api_endpoint}/contract/{contract_address}/allowance/{owner}/{spender}'
-    r = requests.get(url=method_api_endpoint, headers=headers)
-    print(r.text)
+    if local:
+        print(ledger_read(ctx_obj, 'allowance', owner, spender))
+        return
+    print(ev_read(ctx_obj, 'allowance', owner, spender, use_cache=not no_cache))
 
 @cli.command()
 @click.argument('url', required=True)
 @click.pass_obj
 def registerhook(ctx_obj, url):
+    import requests
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
     contract = ctx_obj['contract_address']
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
     msg = 'dummystring'
     message_hash = defunct_hash_message(text=msg)
     sig_msg = Account.signHash(message_hash, ctx_obj['private_key'])
     method_args = {
         "msg": msg,
         "sig": sig_msg.signature.hex(),
-        "key": ctx_obj['api_key'],
         "type": "web",
         "contract": contract,
         "web": url
     }
-    r = requests.post(url=f'{ctx_obj["internal_api_endpoint"]}/hooks/add', json=method_args, headers=headers)
+    r = ev_request(ctx_obj, 'post', ctx_obj['client'].internal_url('hooks/add'), method_args, key_field='key')
     click.echo(r.text)
     if r.status_code == requests.codes.ok:
         r = r.json()
@@ -315,12 +834,13 @@ def registerhook(ctx_obj, url):
 @click.argument('events', required=True)
 @click.pass_obj
 def addhooktoevent(ctx_obj, hookid, events):
+    import requests
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
     msg = 'dummystring'
     message_hash = defunct_hash_message(text=msg)
     contract_address = ctx_obj['contract_address']
     private_key = ctx_obj['private_key']
-    api_key = ctx_obj['api_key']
-    api_endpoint = ctx_obj['internal_api_endpoint']
     sig_msg = Account.signHash(message_hash, private_key)
     events_to_be_registered_on = list()
     if not events:
@@ -331,16 +851,13 @@ def addhooktoevent(ctx_obj, hookid, events):
     method_args = {
         "msg": msg,
         "sig": sig_msg.signature.hex(),
-        "key": api_key,
         "type": "web",
         "contract": contract_address,
         "id": hookid,
         "events": events_to_be_registered_on
     }
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
     click.echo(f'Registering | hook ID: {hookid} | events: {events_to_be_registered_on} | contract: {contract_address}')
-    r = requests.post(url=f'{api_endpoint}/hooks/updateEvents', json=method_args,
-                      headers=headers)
+    r = ev_request(ctx_obj, 'post', ctx_obj['client'].internal_url('hooks/updateEvents'), method_args, key_field='key')
     click.echo(r.text)
     if r.status_code == requests.codes.ok:
         r = r.json()
@@ -355,15 +872,55 @@ def addhooktoevent(ctx_obj, hookid, events):
 
 
 @cli.command()
+@click.option('--no-cache', is_flag=True, help='Always ask the API, bypassing the read cache')
+@click.option('--local', is_flag=True, help='Answer from the token ledger kept by the webhook listener')
 @click.pass_obj
-def totalsupply(ctx_obj):
-    api_key = ctx_obj['api_key']
-    rest_api_endpoint = ctx_obj['rest_api_endpoint']
-    contract_address = ctx_obj['contract_address']
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{rest_api_endpoint}/contract/{contract_address}/totalSupply'
-    r = requests.get(url=method_api_endpoint, headers=headers)
-    print(r.text)
+def totalsupply(ctx_obj, no_cache, local):
+    if local:
+        print(ledger_read(ctx_obj, 'totalSupply'))
+        return
+    print(ev_read(ctx_obj, 'totalSupply', use_cache=not no_cache))
+
+
+def parse_timestamp(ctx, param, value):
+    """
+    Unix timestamp of a --since/--until value, given as a unix timestamp or an ISO 8601 date (UTC unless it says)
+    """
+    if value is None or value.isdigit():
+        return int(value) if value else None
+    import datetime
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise click.BadParameter('expected a unix timestamp or an ISO 8601 date, e.g. 2020-05-01T12:00:00')
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp())
+
+
+@cli.command()
+@click.option('--address', '-a', help='Only events with this address among their arguments, e.g. as the recipient')
+@click.option('--event', 'event_name', help='Only events of this name, e.g. Transfer')
+@click.option('--contract', help='Only events emitted by this contract')
+@click.option('--since', callback=parse_timestamp, help='Only events seen at or after this time')
+@click.option('--until', callback=parse_timestamp, help='Only events seen before this time')
+@click.option('--from-block', type=int, help='Only events at or after this block')
+@click.option('--to-block', type=int, help='Only events at or before this block')
+@click.option('--limit', default=100, show_default=True, help='Maximum number of events to print')
+def events(address, event_name, contract, since, until, from_block, to_block, limit):
+    """
+    Prints contract events recorded by the webhook listener, latest first, one JSON object per line.
+
+    Queries the local event store (~/.ethvigil/events.sqlite, or EV_EVENT_STORE), not the EthVigil API.
+    """
+    from event_store import EventStore
+    store = EventStore()
+    try:
+        for event in store.query(address=address, contract=contract, event_name=event_name, since=since, until=until,
+                                 from_block=from_block, to_block=to_block, limit=limit):
+            click.echo(json.dumps(event))
+    finally:
+        store.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.expanduser('~'), '.ethvigil', 'deploys.json')
+
+
+def deploy_key(code, name, inputs, api_endpoint, address):
+    """
+    Content address of a deploy: a hash of the contract source, name and constructor inputs, and of the API endpoint
+    and account it is deployed with, since the same contract deployed elsewhere or by someone else is another contract
+    """
+    digest = hashlib.sha256()
+    for part in (api_endpoint.rstrip('/'), address.lower(), name, json.dumps(inputs, sort_keys=True), code):
+        encoded = part.encode('utf-8')
+        # length prefixed, so that no two different deploys hash the same parts
+        digest.update(len(encoded).to_bytes(8, 'big'))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class DeployRegistry(object):
+    """
+    On-disk registry of successful deploys, keyed by deploy_key(), shared by the CLIs in this repository so that
+    deploying the same contract again returns the known address instead of deploying a copy.
+    The registry file is rewritten atomically: readers either see the previous contents or the new ones.
+    """
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('EV_DEPLOY_REGISTRY', DEFAULT_REGISTRY_PATH)
+
+    def __repr__(self):
+        return f'DeployRegistry({self.path!r})'
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                deploys = json.load(f)
+        except (OSError, ValueError):
+            return dict()
+        return deploys if isinstance(deploys, dict) else dict()
+
+    def _dump(self, deploys):
+        registry_dir = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(registry_dir, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=registry_dir, prefix='.deploys-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(deploys, f, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get(self, key):
+        return self._load().get(key)
+
+    def put(self, key, entry):
+        deploys = self._load()
+        deploys[key] = dict(entry, deployed_at=int(time.time()))
+        self._dump(deploys)
+
+    def forget(self, key):
+        deploys = self._load()
+        if deploys.pop(key, None) is not None:
+            self._dump(deploys)
+
+
+def _deploy_key(client, deploy_params, address):
+    return deploy_key(deploy_params['code'], deploy_params['name'], deploy_params['inputs'],
+                      client.internal_api_endpoint, address)
+
+
+def _record(registry, key, deploy_params, rj):
+    if not rj.get('success'):
+        return
+    try:
+        registry.put(key, {'name': deploy_params['name'], 'inputs': deploy_params['inputs'], 'response': rj})
+    except OSError as e:
+        # an unwritable registry only costs us the check for repeated deploys
+        print(f'Could not update deploy registry at {registry.path}: {e}', file=sys.stderr)
+
+
+def deploy_once(client, deploy_params, address, registry=None, force=False):
+    """
+    Deploys a contract through `client` unless the same deploy, by deploy_key(), succeeded before.
+    Returns the API response of the deploy, or of the earlier one, as JSON, and whether it came from the registry.
+    With `force`, deploys anyway and records the new deploy instead.
+    """
+    registry = registry or DeployRegistry()
+    key = _deploy_key(client, deploy_params, address)
+    entry = None if force else registry.get(key)
+    if entry is not None:
+        return entry['response'], True
+    rj = client.deploy(deploy_params).json()
+    _record(registry, key, deploy_params, rj)
+    return rj, False
+
+
+async def deploy_once_async(client, deploy_params, address, registry=None, force=False):
+    """
+    deploy_once() through an AsyncEthVigilClient
+    """
+    registry = registry or DeployRegistry()
+    key = _deploy_key(client, deploy_params, address)
+    entry = None if force else registry.get(key)
+    if entry is not None:
+        return entry['response'], True
+    rj = (await client.deploy(deploy_params)).json()
+    _record(registry, key, deploy_params, rj)
+    return rj, False
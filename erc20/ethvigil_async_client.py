@@ -0,0 +1,190 @@
+import asyncio
+import gzip
+
+try:
+    import pycurl
+except ImportError:
+    raise ImportError('AsyncEthVigilClient needs pycurl to keep connections alive, '
+                      'install it with `pip install -r requirements.txt`') from None
+import tornado.curl_httpclient
+import tornado.escape
+import tornado.httpclient
+
+import profiling
+
+
+# seconds. Tornado counts the connect timeout as part of the request timeout
+CONNECT_TIMEOUT = 10
+REQUEST_TIMEOUT = 70
+DEPLOY_TIMEOUT = 190
+# deploy bodies at least this large, i.e. carrying a sizeable contract source, are sent gzip-compressed
+GZIP_MIN_BYTES = 4096
+# answers to a gzip-compressed deploy telling that the API could not read the body, see EthVigilClient.deploy()
+GZIP_REJECTED_STATUS = (400, 415)
+# libcurl errors raised before anything reached the server: the host name did not resolve or the connection was refused
+CONNECT_ERRNOS = (pycurl.E_COULDNT_RESOLVE_HOST, pycurl.E_COULDNT_CONNECT)
+
+# the curl based client keeps connections alive between requests, the default simple client opens one per request
+tornado.httpclient.AsyncHTTPClient.configure(tornado.curl_httpclient.CurlAsyncHTTPClient)
+
+
+def connect_failed(error):
+    """
+    Whether a request raised `error` before reaching the server, so that sending it again cannot act on it twice.
+    Failed connections raise a CurlError, i.e. an HTTPClientError with code 599, rather than an OSError.
+    """
+    return isinstance(error, tornado.curl_httpclient.CurlError) and error.errno in CONNECT_ERRNOS
+
+
+def timed_out(error):
+    return isinstance(error, tornado.curl_httpclient.CurlError) and error.errno == pycurl.E_OPERATION_TIMEDOUT
+
+
+class AsyncResponse(object):
+    """
+    requests-like view of a Tornado HTTP response, so that callers can keep handling
+    `status_code`, `text` and `json()` the same way as with the synchronous client.
+    """
+    def __init__(self, response):
+        self.status_code = response.code
+        self.content = response.body or b''
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        with profiling.span('parse response', 'json'):
+            return tornado.escape.json_decode(self.content)
+
+
+class AsyncEthVigilClient(object):
+    """
+    asyncio counterpart of EthVigilClient, for bulk jobs and Tornado handlers.
+
+    At most `concurrency` requests are in flight at any time across all coroutines sharing an instance,
+    further calls wait on a semaphore rather than piling up in the HTTP client's queue, where they would
+    already be counted against their timeout.
+    Instances must be created and used on the same event loop.
+    """
+    def __init__(self, rest_api_endpoint=None, internal_api_endpoint=None, api_key=None, contract_address=None,
+                 concurrency=10, connect_timeout=CONNECT_TIMEOUT, request_timeout=REQUEST_TIMEOUT, gzip_deploys=False):
+        self.rest_api_endpoint = rest_api_endpoint.rstrip('/') if rest_api_endpoint else None
+        self.internal_api_endpoint = internal_api_endpoint.rstrip('/') if internal_api_endpoint else None
+        self.api_key = api_key
+        self.contract_address = contract_address
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.gzip_deploys = gzip_deploys
+        self._semaphore = None
+        self._http_client = None
+
+    @property
+    def http_client(self):
+        # created lazily so that the client binds to the running event loop
+        if self._http_client is None:
+            self._http_client = tornado.httpclient.AsyncHTTPClient(force_instance=True, max_clients=self.concurrency)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._http_client
+
+    def contract_url(self, contract_address, method, *args):
+        return '/'.join([f'{self.rest_api_endpoint}/contract/{contract_address}/{method}'] + [str(a) for a in args])
+
+    def internal_url(self, path):
+        return f'{self.internal_api_endpoint}/{path.lstrip("/")}'
+
+    async def request(self, method, url, json=None, api_key=None, request_timeout=None, compress=False):
+        api_key = api_key or self.api_key
+        headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
+        if api_key:
+            headers['X-API-KEY'] = api_key
+        body = tornado.escape.utf8(tornado.escape.json_encode(json)) if json is not None else None
+        if compress:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        http_request = tornado.httpclient.HTTPRequest(
+            url, method=method.upper(), headers=headers, body=body,
+            connect_timeout=self.connect_timeout, request_timeout=request_timeout or self.request_timeout
+        )
+        http_client = self.http_client
+        async with self._semaphore:
+            with profiling.span(f'{method.upper()} {url}', 'http'):
+                response = await http_client.fetch(http_request, raise_error=False)
+        return AsyncResponse(response)
+
+    async def call(self, method, method_args, contract_address=None, api_key=None):
+        """
+        Sends a transaction to a contract method
+        """
+        url = self.contract_url(contract_address or self.contract_address, method)
+        return await self.request('post', url, json=method_args, api_key=api_key)
+
+    async def read(self, method, *args, contract_address=None, api_key=None):
+        """
+        Calls a read-only contract method
+        """
+        url = self.contract_url(contract_address or self.contract_address, method, *args)
+        return await self.request('get', url, api_key=api_key)
+
+    # ERC20Mintable methods, with the same arguments as the corresponding CLI commands
+
+    async def mint(self, to_address, amount, **kwargs):
+        return await self.call('mint', {'account': to_address, 'amount': amount}, **kwargs)
+
+    async def approve(self, spender_address, tokens, **kwargs):
+        return await self.call('approve', {'spender': spender_address, 'value': tokens}, **kwargs)
+
+    async def transfer_from(self, sender, recipient, amount, **kwargs):
+        return await self.call('transferFrom', {'sender': sender, 'recipient': recipient, 'amount': amount},
+                               **kwargs)
+
+    async def increase_allowance(self, spender, added_value, **kwargs):
+        return await self.call('increaseAllowance', {'spender': spender, 'addedValue': added_value}, **kwargs)
+
+    async def decrease_allowance(self, spender, subtracted_value, **kwargs):
+        return await self.call('decreaseAllowance', {'spender': spender, 'subtractedValue': subtracted_value},
+                               **kwargs)
+
+    async def balance_of(self, account, **kwargs):
+        return await self.read('balanceOf', account, **kwargs)
+
+    async def allowance(self, owner, spender, **kwargs):
+        return await self.read('allowance', owner, spender, **kwargs)
+
+    async def total_supply(self, **kwargs):
+        return await self.read('totalSupply', **kwargs)
+
+    # internal API
+
+    async def login(self, msg, sig):
+        return await self.request('post', self.internal_url('login'), json={'msg': msg, 'sig': sig})
+
+    async def deploy(self, deploy_params):
+        """
+        Deploys a contract. With gzip_deploys, large sources are uploaded gzip-compressed, and uploaded again
+        uncompressed if the API could not read them, like EthVigilClient.deploy()
+        """
+        if self.gzip_deploys and len(tornado.escape.json_encode(deploy_params)) >= GZIP_MIN_BYTES:
+            r = await self.request('post', self.internal_url('deploy'), json=deploy_params,
+                                   request_timeout=DEPLOY_TIMEOUT, compress=True)
+            if r.status_code not in GZIP_REJECTED_STATUS:
+                return r
+            r = await self.request('post', self.internal_url('deploy'), json=deploy_params,
+                                   request_timeout=DEPLOY_TIMEOUT)
+            if r.status_code < 400:
+                self.gzip_deploys = False
+            return r
+        return await self.request('post', self.internal_url('deploy'), json=deploy_params,
+                                  request_timeout=DEPLOY_TIMEOUT)
+
+    async def add_hook(self, method_args):
+        return await self.request('post', self.internal_url('hooks/add'), json=method_args)
+
+    async def update_hook_events(self, method_args):
+        return await self.request('post', self.internal_url('hooks/updateEvents'), json=method_args)
+
+    def close(self):
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
@@ -0,0 +1,114 @@
+import gzip
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import profiling
+
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 60)
+# compiling and deploying a contract takes considerably longer than a method call
+DEPLOY_TIMEOUT = (10, 180)
+# deploy bodies at least this large, i.e. carrying a sizeable contract source, are sent gzip-compressed
+GZIP_MIN_BYTES = 4096
+# answers to a gzip-compressed deploy telling that the API could not read the body, so that nothing was deployed and the
+# source can be uploaded again uncompressed: 415 Unsupported Media Type, or 400 from an API that ignores Content-Encoding
+# and fails to parse the compressed bytes as JSON. Any other error may come after the contract was deployed
+GZIP_REJECTED_STATUS = (400, 415)
+
+
+class EthVigilClient(object):
+    """
+    Pooled HTTP client for the EthVigil REST API (contract method calls) and internal API (login, deploy, hooks).
+
+    A single instance keeps TCP+TLS connections alive between calls. Each endpoint gets its own connection pool,
+    sized for the expected number of concurrent calls to it: REST method calls are usually made in bulk,
+    the internal API only sees the occasional login or hook registration.
+    Pass gzip_deploys=True to upload large contract sources gzip-compressed.
+    """
+    def __init__(self, rest_api_endpoint=None, internal_api_endpoint=None, api_key=None, timeout=DEFAULT_TIMEOUT,
+                 rest_pool_size=10, internal_pool_size=2, gzip_deploys=False):
+        self.rest_api_endpoint = rest_api_endpoint.rstrip('/') if rest_api_endpoint else None
+        self.internal_api_endpoint = internal_api_endpoint.rstrip('/') if internal_api_endpoint else None
+        self.api_key = api_key
+        self.timeout = timeout
+        self.gzip_deploys = gzip_deploys
+        self.session = requests.Session()
+        self.session.headers.update({'accept': 'application/json', 'Content-Type': 'application/json'})
+        for endpoint, pool_size in ((self.rest_api_endpoint, rest_pool_size),
+                                    (self.internal_api_endpoint, internal_pool_size)):
+            if endpoint:
+                self.session.mount(endpoint, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def contract_url(self, contract_address, method, *args):
+        """
+        URL of a contract method on the REST API. Arguments of read-only methods are passed as path segments:
+        contract_url('0xabc', 'allowance', owner, spender) -> {REST_API_ENDPOINT}/contract/0xabc/allowance/{owner}/{spender}
+        """
+        return '/'.join([f'{self.rest_api_endpoint}/contract/{contract_address}/{method}'] + [str(a) for a in args])
+
+    def internal_url(self, path):
+        return f'{self.internal_api_endpoint}/{path.lstrip("/")}'
+
+    def request(self, method, url, json=None, api_key=None, timeout=None):
+        api_key = api_key or self.api_key
+        headers = {'X-API-KEY': api_key} if api_key else None
+        with profiling.span(f'{method.upper()} {url}', 'http'):
+            r = self.session.request(method, url, json=json, headers=headers, timeout=timeout or self.timeout)
+        return self._timed_json(r)
+
+    @staticmethod
+    def _timed_json(r):
+        if profiling.enabled():
+            # requests only parses the body when json() is called
+            r.json = profiling.timed(r.json, 'parse response', 'json')
+        return r
+
+    def call(self, contract_address, method, method_args, api_key=None):
+        """
+        Sends a transaction to a contract method
+        """
+        return self.request('post', self.contract_url(contract_address, method), json=method_args, api_key=api_key)
+
+    def read(self, contract_address, method, *args, api_key=None):
+        """
+        Calls a read-only contract method
+        """
+        return self.request('get', self.contract_url(contract_address, method, *args), api_key=api_key)
+
+    def login(self, msg, sig):
+        return self.request('post', self.internal_url('login'), json={'msg': msg, 'sig': sig})
+
+    def deploy(self, deploy_params):
+        """
+        Deploys a contract. With gzip_deploys, large sources are uploaded gzip-compressed. If the API answers that
+        upload with one of GZIP_REJECTED_STATUS, i.e. it could not read the body, the source is uploaded again
+        uncompressed, and if that succeeds later deploys are sent uncompressed right away.
+        """
+        url = self.internal_url('deploy')
+        body = json.dumps(deploy_params).encode('utf-8')
+        if len(body) >= GZIP_MIN_BYTES and self.gzip_deploys:
+            with profiling.span(f'POST {url} (gzip)', 'http'):
+                r = self.session.post(url, data=gzip.compress(body), headers={'Content-Encoding': 'gzip'},
+                                      timeout=DEPLOY_TIMEOUT)
+            if r.status_code not in GZIP_REJECTED_STATUS:
+                return self._timed_json(r)
+            with profiling.span(f'POST {url}', 'http'):
+                r = self.session.post(url, data=body, timeout=DEPLOY_TIMEOUT)
+            if r.status_code < 400:
+                self.gzip_deploys = False
+            return self._timed_json(r)
+        with profiling.span(f'POST {url}', 'http'):
+            r = self.session.post(url, data=body, timeout=DEPLOY_TIMEOUT)
+        return self._timed_json(r)
+
+    def add_hook(self, method_args):
+        return self.request('post', self.internal_url('hooks/add'), json=method_args)
+
+    def update_hook_events(self, method_args):
+        return self.request('post', self.internal_url('hooks/updateEvents'), json=method_args)
+
+    def close(self):
+        self.session.close()
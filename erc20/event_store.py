@@ -0,0 +1,114 @@
+import json
+import os
+import re
+import sqlite3
+
+
+DEFAULT_STORE_PATH = os.path.join(os.path.expanduser('~'), '.ethvigil', 'events.sqlite')
+ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS events ('
+    'id INTEGER PRIMARY KEY, contract TEXT NOT NULL, event_name TEXT NOT NULL, block_number INTEGER, '
+    'tx_hash TEXT, log_index INTEGER, ctime INTEGER, payload TEXT NOT NULL, UNIQUE (tx_hash, log_index))',
+    'CREATE INDEX IF NOT EXISTS events_contract ON events (contract, event_name, block_number)',
+    'CREATE INDEX IF NOT EXISTS events_block_number ON events (block_number)',
+    'CREATE INDEX IF NOT EXISTS events_ctime ON events (ctime)',
+    # every address found among the event arguments, e.g. `from` and `to` of a Transfer, with the first argument
+    # that holds it
+    'CREATE TABLE IF NOT EXISTS event_addresses ('
+    'address TEXT NOT NULL, block_number INTEGER, event_id INTEGER NOT NULL, role TEXT NOT NULL, '
+    'PRIMARY KEY (address, block_number, event_id)) WITHOUT ROWID',
+)
+
+
+class EventStore(object):
+    """
+    SQLite (WAL mode) store of the contract events delivered to the webhook listener, indexed by contract,
+    event name, address and block number for local queries.
+
+    `add` only buffers an event; buffered events are inserted in a single transaction by `flush`, which `add`
+    calls itself once `batch_size` events are buffered. Events already stored (same transaction hash and log index)
+    are ignored, so feeding the same events again is harmless.
+    """
+    def __init__(self, path=None, batch_size=1000):
+        self.path = path or os.environ.get('EV_EVENT_STORE', DEFAULT_STORE_PATH)
+        self.batch_size = batch_size
+        self._pending = list()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), mode=0o700, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+
+    def __repr__(self):
+        return f'EventStore({self.path!r})'
+
+    def add(self, event):
+        """
+        Buffers an event payload delivered by an EthVigil webhook
+        """
+        self._pending.append(event)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, list()
+        stored = 0
+        with self.conn:
+            self.conn.execute('BEGIN')
+            for event in pending:
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO events (contract, event_name, block_number, tx_hash, log_index, ctime, '
+                    'payload) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (event.get('contract', '').lower(), event['event_name'], event.get('blockNumber'),
+                     event.get('txHash'), event.get('logIndex'), event.get('ctime'), json.dumps(event))
+                )
+                if not cursor.rowcount:
+                    continue
+                stored += 1
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO event_addresses (address, block_number, event_id, role) VALUES (?, ?, ?, ?)',
+                    [(value.lower(), event.get('blockNumber'), cursor.lastrowid, role)
+                     for role, value in (event.get('event_data') or dict()).items()
+                     if isinstance(value, str) and ADDRESS_RE.match(value)]
+                )
+        return stored
+
+    def query(self, address=None, contract=None, event_name=None, since=None, until=None, from_block=None,
+              to_block=None, limit=100):
+        """
+        Event payloads matching all the given filters, latest block first.
+        `since` and `until` are unix timestamps, compared with the time EthVigil saw the event.
+        """
+        conditions, params = list(), list()
+        if address:
+            # walk the (address, block_number) index, then look the events up
+            table = 'event_addresses a JOIN events e ON e.id = a.event_id'
+            conditions.append('a.address = ?')
+            params.append(address.lower())
+            block_column = 'a.block_number'
+        else:
+            table = 'events e'
+            block_column = 'e.block_number'
+        for condition, value in (('e.contract = ?', contract.lower() if contract else None),
+                                 ('e.event_name = ?', event_name),
+                                 ('e.ctime >= ?', since), ('e.ctime < ?', until),
+                                 (f'{block_column} >= ?', from_block), (f'{block_column} <= ?', to_block)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        params.append(limit)
+        rows = self.conn.execute(
+            f'SELECT e.payload FROM {table} {where} ORDER BY {block_column} DESC, e.id DESC LIMIT ?',
+            params
+        )
+        return [json.loads(payload) for payload, in rows]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,165 @@
+import glob
+import json
+import os
+import tempfile
+
+from event_log import EventLogReader
+
+
+SNAPSHOT_NAME = 'ledger.json'
+ZERO_ADDRESS = '0x' + '0' * 40
+
+
+class Ledger(object):
+    """
+    Token balances, total supply and allowances of ERC20 contracts, kept up to date from their
+    `Transfer` and `Approval` events in O(1) per event.
+
+    The ledger only knows the events the webhook listener received, so it matches the chain only if the listener
+    was subscribed to the contract's events since its deployment.
+    `seq` is the sequence number of the last event log record applied. A snapshot plus the event log records after
+    its `seq` rebuild the ledger as of the last event received.
+    """
+    def __init__(self):
+        self.seq = -1
+        # (contract, account) -> balance
+        self.balances = dict()
+        # contract -> total supply
+        self.total_supply = dict()
+        # (contract, owner, spender) -> (allowance, block number, log index)
+        self.allowances = dict()
+
+    def __repr__(self):
+        return f'Ledger(seq={self.seq}, accounts={len(self.balances)})'
+
+    def apply(self, event, seq=None):
+        """
+        Applies an EthVigil webhook payload; payloads other than Transfer and Approval events only advance `seq`
+        """
+        if seq is not None:
+            self.seq = seq
+        event_name = event.get('event_name')
+        if event_name not in ('Transfer', 'Approval'):
+            return
+        contract = event.get('contract', '').lower()
+        data = event.get('event_data') or dict()
+        value = int(data.get('value', 0))
+        if event_name == 'Transfer':
+            sender, recipient = data.get('from', '').lower(), data.get('to', '').lower()
+            if sender == ZERO_ADDRESS:
+                self.total_supply[contract] = self.total_supply.get(contract, 0) + value
+            else:
+                self.balances[contract, sender] = self.balances.get((contract, sender), 0) - value
+            if recipient == ZERO_ADDRESS:
+                self.total_supply[contract] = self.total_supply.get(contract, 0) - value
+            else:
+                self.balances[contract, recipient] = self.balances.get((contract, recipient), 0) + value
+        else:
+            key = (contract, data.get('owner', '').lower(), data.get('spender', '').lower())
+            position = (event.get('blockNumber') or 0, event.get('logIndex') or 0)
+            if key not in self.allowances or self.allowances[key][1:] <= position:
+                self.allowances[key] = (value,) + position
+
+    def balance_of(self, contract, account):
+        return self.balances.get((contract.lower(), account.lower()), 0)
+
+    def allowance(self, contract, owner, spender):
+        return self.allowances.get((contract.lower(), owner.lower(), spender.lower()), (0,))[0]
+
+    def supply(self, contract):
+        return self.total_supply.get(contract.lower(), 0)
+
+    def merge(self, other):
+        """
+        Adds in the ledger built from another worker's events. Transfers add up whatever their order;
+        for allowances the latest Approval on chain wins.
+        """
+        for key, balance in other.balances.items():
+            self.balances[key] = self.balances.get(key, 0) + balance
+        for contract, total_supply in other.total_supply.items():
+            self.total_supply[contract] = self.total_supply.get(contract, 0) + total_supply
+        for key, allowance in other.allowances.items():
+            if key not in self.allowances or self.allowances[key][1:] <= allowance[1:]:
+                self.allowances[key] = allowance
+
+    def copy(self):
+        """
+        Shallow copy, fast enough to take on the event loop and write out from a worker thread
+        """
+        ledger = Ledger()
+        ledger.seq = self.seq
+        ledger.balances = self.balances.copy()
+        ledger.total_supply = self.total_supply.copy()
+        ledger.allowances = self.allowances.copy()
+        return ledger
+
+    def state(self):
+        """
+        The ledger as JSON-serializable data
+        """
+        return {
+            'seq': self.seq,
+            'balances': [[contract, account, str(balance)] for (contract, account), balance in self.balances.items()],
+            'total_supply': {contract: str(total_supply) for contract, total_supply in self.total_supply.items()},
+            'allowances': [list(key) + [str(allowance), block_number, log_index]
+                           for key, (allowance, block_number, log_index) in self.allowances.items()],
+        }
+
+    def write_snapshot(self, path):
+        """
+        Atomically replaces the snapshot at `path`
+        """
+        state = self.state()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.ledger-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """
+        Ledger from the snapshot at `path`, or an empty one if there is none
+        """
+        ledger = cls()
+        if not os.path.exists(path):
+            return ledger
+        with open(path, 'r') as f:
+            state = json.load(f)
+        ledger.seq = state['seq']
+        ledger.balances = {(contract, account): int(balance) for contract, account, balance in state['balances']}
+        ledger.total_supply = {contract: int(total_supply) for contract, total_supply in state['total_supply'].items()}
+        ledger.allowances = {(contract, owner, spender): (int(allowance), block_number, log_index)
+                             for contract, owner, spender, allowance, block_number, log_index in state['allowances']}
+        return ledger
+
+    def catch_up(self, event_log_dir):
+        """
+        Applies the event log records after `seq`. Returns the number of records applied.
+        """
+        applied = 0
+        for seq, payload in EventLogReader(event_log_dir).replay(self.seq + 1):
+            self.apply(json.loads(payload), seq)
+            applied += 1
+        return applied
+
+    @classmethod
+    def from_event_log(cls, event_log_dir):
+        """
+        Ledger as of the last event the webhook listener logged to `event_log_dir`, from the latest snapshot
+        and the records logged after it. Merges the ledgers of all workers of a listener run with --workers.
+        """
+        ledger = cls()
+        for directory in [event_log_dir] + sorted(glob.glob(os.path.join(event_log_dir, 'worker-*'))):
+            if not os.path.isdir(directory):
+                continue
+            worker_ledger = cls.load(os.path.join(directory, SNAPSHOT_NAME))
+            worker_ledger.catch_up(directory)
+            ledger.merge(worker_ledger)
+        return ledger
@@ -0,0 +1,258 @@
+import asyncio
+import bisect
+import mmap
+
+import tornado.web
+
+
+# seconds, upper bounds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+# bytes a label value is stored in, after a marker byte telling a used series from an unused one
+LABEL_BYTES = 64
+# label value of the series counting whatever did not fit in the others
+OTHER = '_other'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric(object):
+    """
+    A counter, gauge or histogram with at most one label, e.g. http_requests_total{route="/"}.
+    Series are created on first use, up to `capacity` per worker; further label values are recorded under `_other`.
+    """
+    def __init__(self, name, help_text, kind, label=None, capacity=32, buckets=()):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label = label
+        self.capacity = capacity if label else 1
+        self.buckets = tuple(buckets)
+        # values of a series; a histogram has a count per bucket, one for +Inf, and the sum in nanoseconds
+        self.width = len(self.buckets) + 2 if kind == 'histogram' else 1
+        self._labels = None
+        self._values = None
+        self._label_offset = 0
+        self._value_offset = 0
+        self._worker = 0
+        # label value -> offset of its series in _values, for the series of this worker
+        self._index = dict()
+
+    def __repr__(self):
+        return f'Metric({self.name!r}, {self.kind!r}, series={len(self._index)})'
+
+    def _series_slots(self, worker_id):
+        return range(worker_id * self.capacity, (worker_id + 1) * self.capacity)
+
+    def _label_at(self, slot):
+        start = self._label_offset + slot * LABEL_BYTES
+        raw = bytes(self._labels[start:start + LABEL_BYTES])
+        if raw[:1] != b'\x01':
+            return None
+        return raw[1:].rstrip(b'\x00').decode('utf-8', errors='replace')
+
+    def _bind(self, worker_id):
+        self._worker = worker_id
+        self._index = dict()
+        for slot in self._series_slots(worker_id):
+            label_value = self._label_at(slot)
+            if label_value is not None:
+                self._index.setdefault(label_value, self._value_offset + slot * self.width)
+                if self.kind == 'gauge':
+                    # left over by a previous process in this worker's slot
+                    self._values[self._value_offset + slot * self.width] = 0
+
+    def _series(self, label_value):
+        offset = self._index.get(label_value)
+        if offset is not None:
+            return offset
+        if self.label and len(self._index) >= self.capacity - 1 and label_value != OTHER:
+            return self._series(OTHER)
+        slot = self._worker * self.capacity + len(self._index)
+        encoded = b'\x01' + label_value.encode('utf-8')[:LABEL_BYTES - 1]
+        start = self._label_offset + slot * LABEL_BYTES
+        self._labels[start:start + len(encoded)] = encoded
+        offset = self._index[label_value] = self._value_offset + slot * self.width
+        return offset
+
+    def incr(self, label_value='', n=1):
+        self._values[self._series(label_value)] += n
+
+    def observe(self, label_value, seconds):
+        offset = self._series(label_value)
+        self._values[offset + bisect.bisect_left(self.buckets, seconds)] += 1
+        self._values[offset + len(self.buckets) + 1] += int(seconds * 1e9)
+
+    def collect(self, workers):
+        """
+        {label value: values} summed over the series of all workers
+        """
+        totals = dict()
+        for worker_id in range(workers):
+            for slot in self._series_slots(worker_id):
+                label_value = self._label_at(slot)
+                if label_value is None:
+                    continue
+                start = self._value_offset + slot * self.width
+                values = self._values[start:start + self.width].tolist()
+                if label_value in totals:
+                    values = [a + b for a, b in zip(totals[label_value], values)]
+                totals[label_value] = values
+        return totals
+
+    def exposition(self, workers):
+        """
+        Lines of the metric in the Prometheus text format
+        """
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for label_value, values in sorted(self.collect(workers).items()):
+            labels = f'{self.label}="{_escape(label_value)}"' if self.label else ''
+            if self.kind != 'histogram':
+                lines.append(f'{self.name}{{{labels}}} {values[0]}' if labels else f'{self.name} {values[0]}')
+                continue
+            separator = ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1] / 1e9}' if labels
+                         else f'{self.name}_sum {values[-1] / 1e9}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}' if labels
+                         else f'{self.name}_count {cumulative}')
+        return lines
+
+
+def _escape(label_value):
+    return label_value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics(object):
+    """
+    Prometheus metrics of a server, in anonymous shared memory like prefork.WorkerStats: declare them, allocate()
+    before forking, and bind() each worker to its slot. A worker only writes its own series, so recording takes
+    no lock and costs a dict lookup and an addition or two; /metrics of any worker adds up the series of all of them.
+    """
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.metrics = list()
+        self._mmaps = None
+
+    def __repr__(self):
+        return f'Metrics(workers={self.workers}, metrics={len(self.metrics)})'
+
+    def __getitem__(self, name):
+        for metric in self.metrics:
+            if metric.name == name:
+                return metric
+        raise KeyError(name)
+
+    def add(self, metric):
+        if self._mmaps is not None:
+            raise RuntimeError('metrics must be declared before they are allocated')
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, label=None, capacity=32):
+        return self.add(Metric(name, help_text, 'counter', label, capacity))
+
+    def gauge(self, name, help_text, label=None, capacity=32):
+        return self.add(Metric(name, help_text, 'gauge', label, capacity))
+
+    def histogram(self, name, help_text, label=None, capacity=32, buckets=LATENCY_BUCKETS):
+        return self.add(Metric(name, help_text, 'histogram', label, capacity, buckets))
+
+    def allocate(self):
+        label_bytes = value_count = 0
+        for metric in self.metrics:
+            metric._label_offset = label_bytes
+            metric._value_offset = value_count
+            label_bytes += metric.capacity * self.workers * LABEL_BYTES
+            value_count += metric.capacity * self.workers * metric.width
+        labels, values = mmap.mmap(-1, max(1, label_bytes)), mmap.mmap(-1, max(8, 8 * value_count))
+        self._mmaps = (labels, values)
+        label_view, value_view = memoryview(labels), memoryview(values).cast('q')
+        for metric in self.metrics:
+            metric._labels = label_view
+            metric._values = value_view
+        return self
+
+    def bind(self, worker_id):
+        """
+        Records into the series of `worker_id` from now on; called in the worker process
+        """
+        if self._mmaps is None:
+            self.allocate()
+        for metric in self.metrics:
+            metric._bind(worker_id)
+
+    def exposition(self):
+        lines = list()
+        for metric in self.metrics:
+            lines.extend(metric.exposition(self.workers))
+        return '\n'.join(lines) + '\n'
+
+
+def server_metrics(workers=1):
+    """
+    Metrics every server records: requests, errors, latency and requests in flight per route, and event loop lag
+    """
+    metrics = Metrics(workers)
+    metrics.counter('http_requests_total', 'Requests received', 'route')
+    metrics.counter('http_request_errors_total', 'Requests answered with a 4xx or 5xx status', 'route')
+    metrics.histogram('http_request_duration_seconds', 'Time from receiving a request to answering it', 'route')
+    metrics.gauge('http_requests_in_flight', 'Requests received and not answered yet', 'route')
+    metrics.histogram('ioloop_lag_seconds', 'How late the event loop ran a callback scheduled ahead of time',
+                      buckets=LOOP_LAG_BUCKETS)
+    return metrics
+
+
+class InstrumentedApplication(tornado.web.Application):
+    """
+    Application recording the requests to each of its routes in the server_metrics() of `metrics`.
+    Routes are the paths of its handlers; any other path is recorded as `_other`.
+    """
+    def __init__(self, handlers, metrics, **settings):
+        self.metrics = metrics
+        self.routes = frozenset(handler[0] for handler in handlers)
+        self._requests = metrics['http_requests_total']
+        self._errors = metrics['http_request_errors_total']
+        self._duration = metrics['http_request_duration_seconds']
+        self._in_flight = metrics['http_requests_in_flight']
+        super().__init__(handlers, **settings)
+
+    def _route(self, request):
+        return request.path if request.path in self.routes else OTHER
+
+    def find_handler(self, request, **kwargs):
+        route = self._route(request)
+        self._requests.incr(route)
+        self._in_flight.incr(route)
+        return super().find_handler(request, **kwargs)
+
+    def log_request(self, handler):
+        route = self._route(handler.request)
+        self._in_flight.incr(route, -1)
+        if handler.get_status() >= 400:
+            self._errors.incr(route)
+        self._duration.observe(route, handler.request.request_time())
+        super().log_request(handler)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def initialize(self, metrics):
+        self.metrics = metrics
+
+    def get(self):
+        self.set_header('Content-Type', CONTENT_TYPE)
+        self.write(self.metrics.exposition())
+
+
+async def monitor_loop_lag(histogram, interval=0.5):
+    """
+    Observes, every `interval` seconds until cancelled, how late the event loop wakes up a sleeping coroutine:
+    the time callbacks wait behind handlers hogging the loop
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        histogram.observe('', max(0.0, loop.time() - expected))
@@ -0,0 +1,188 @@
+import builtins
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+
+
+# the profiler of the running command, None unless the CLI was started with --profile
+_profiler = None
+# id of the innermost open span of the current thread or task
+_parent = contextvars.ContextVar('profiling_parent', default=None)
+_NOT_PROFILING = contextlib.nullcontext()
+
+# phases in the order the breakdown lists them
+CATEGORIES = ('import', 'settings', 'login', 'sign', 'http', 'json')
+
+
+class Profiler(object):
+    """
+    Timed spans of the phases of a CLI command: module imports, settings load, login, signing, HTTP round trips
+    and JSON parsing. Spans nest, and every phase is credited with its self time, i.e. net of the spans it encloses,
+    so for a command making one call at a time the phases and the rest of the command add up to its wall clock time.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.end = None
+        # (id, parent id, name, category, start, end, lane)
+        self.spans = list()
+        self._lock = threading.Lock()
+        self._importing = threading.local()
+        self._import = None
+
+    def __repr__(self):
+        return f'Profiler(spans={len(self.spans)})'
+
+    @contextlib.contextmanager
+    def span(self, name, category):
+        with self._lock:
+            span_id = len(self.spans)
+            self.spans.append(None)
+        token = _parent.set(span_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            _parent.reset(token)
+            self.spans[span_id] = (span_id, token.old_value, name, category, start, end, _lane())
+
+    def trace_imports(self):
+        """
+        Times the import of every module not imported yet. Only the outermost import is recorded as a span,
+        the modules it pulls in count towards it.
+        """
+        original_import = self._import = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules or getattr(self._importing, 'active', False):
+                return original_import(name, globals, locals, fromlist, level)
+            self._importing.active = True
+            try:
+                with self.span(f'import {name}', 'import'):
+                    return original_import(name, globals, locals, fromlist, level)
+            finally:
+                self._importing.active = False
+        builtins.__import__ = timed_import
+
+    def stop(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+        self.end = time.perf_counter()
+
+    def _closed_spans(self):
+        return [span for span in self.spans if span is not None]
+
+    def phases(self):
+        """
+        {category: (spans, total seconds, self seconds)}. Totals of concurrent spans, e.g. HTTP calls of a bulk
+        command, add up to more than the time they took together.
+        """
+        spans = self._closed_spans()
+        children = dict()
+        for span_id, parent, _, _, start, end, _ in spans:
+            children[parent] = children.get(parent, 0) + end - start
+        phases = dict()
+        for span_id, _, _, category, start, end, _ in spans:
+            count, total, self_time = phases.get(category, (0, 0.0, 0.0))
+            phases[category] = (count + 1, total + end - start,
+                                self_time + max(0.0, end - start - children.get(span_id, 0.0)))
+        return phases
+
+    def covered(self):
+        """
+        Seconds during which at least one span was open
+        """
+        covered, covered_until = 0.0, self.origin
+        for start, end in sorted((span[4], span[5]) for span in self._closed_spans()):
+            if end > covered_until:
+                covered += end - max(start, covered_until)
+                covered_until = end
+        return covered
+
+    def breakdown(self, title, top=10):
+        """
+        Lines of a table of the time spent in every phase, followed by the slowest spans
+        """
+        wall = (self.end or time.perf_counter()) - self.origin
+        phases = self.phases()
+        lines = [f'Profile of {title}: {wall * 1000:.1f} ms',
+                 f'{"phase":<10} {"spans":>6} {"total ms":>10} {"self ms":>10} {"share":>7}']
+        accounted = 0.0
+        for category in CATEGORIES + tuple(sorted(set(phases) - set(CATEGORIES))):
+            if category not in phases:
+                continue
+            count, total, self_time = phases[category]
+            accounted += self_time
+            lines.append(f'{category:<10} {count:>6} {total * 1000:>10.1f} {self_time * 1000:>10.1f} '
+                         f'{self_time / wall:>7.1%}')
+        # the command's own code: the time no span was open
+        rest = max(0.0, wall - self.covered())
+        lines.append(f'{"other":<10} {"":>6} {"":>10} {rest * 1000:>10.1f} {rest / wall:>7.1%}')
+        if accounted > wall:
+            lines.append('Spans of concurrent calls overlap, so their shares add up to more than 100%.')
+        slowest = sorted(self._closed_spans(), key=lambda span: span[4] - span[5])[:top]
+        if slowest:
+            lines.append('Slowest spans:')
+            lines.extend(f'{(end - start) * 1000:>10.1f} ms  {category:<8} {name}'
+                         for _, _, name, category, start, end, _ in slowest)
+        return lines
+
+    def write_trace(self, path):
+        """
+        Writes the spans in the Trace Event Format, for chrome://tracing or https://ui.perfetto.dev
+        """
+        lanes = dict()
+        events = [{
+            'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': lanes.setdefault(lane, len(lanes)),
+            'ts': round((start - self.origin) * 1e6, 1), 'dur': round((end - start) * 1e6, 1),
+        } for _, _, name, category, start, end, lane in sorted(self._closed_spans(), key=lambda span: span[4])]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def _lane():
+    """
+    Concurrent asyncio tasks get a lane each in the trace, since their spans overlap
+    """
+    # a command that never imported asyncio runs no tasks, and need not pay for importing it
+    asyncio = sys.modules.get('asyncio')
+    try:
+        task = asyncio.current_task() if asyncio is not None else None
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+def start():
+    global _profiler
+    _profiler = Profiler()
+    _profiler.trace_imports()
+    return _profiler
+
+
+def span(name, category):
+    """
+    Context manager timing a span of `category` while profiling, a no-op otherwise
+    """
+    if _profiler is None:
+        return _NOT_PROFILING
+    return _profiler.span(name, category)
+
+
+def enabled():
+    return _profiler is not None
+
+
+def timed(func, name, category):
+    """
+    `func`, timed as a span on every call
+    """
+    def timed_func(*args, **kwargs):
+        with span(name, category):
+            return func(*args, **kwargs)
+    return timed_func
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import time
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.ethvigil', 'read_cache.sqlite')
+DEFAULT_TTL = 300
+ZERO_ADDRESS = '0x' + '0' * 40
+
+
+class ReadCache(object):
+    """
+    Read-through cache of the read-only ERC20 calls (balanceOf, allowance, totalSupply), shared between CLI runs and
+    the webhook listener through a SQLite database in WAL mode.
+
+    Entries are kept per REST API `endpoint`, so that a CLI pointed at another network or endpoint does not answer
+    with the results of this one. They expire after `ttl` seconds; once there are more than `max_entries`, the least
+    recently stored ones are evicted: reads do not update `accessed_at`, which would make every cache hit a write.
+    The webhook listener, started with --read_cache, invalidates exactly the entries an event affects, under every
+    endpoint (see `invalidate_event`), so the TTL only bounds staleness while the listener is not running, or when a
+    read that raced with an event re-caches the old value.
+    """
+    def __init__(self, path=None, ttl=DEFAULT_TTL, endpoint='', max_entries=100000, evict_every=100):
+        self.path = path or os.environ.get('EV_READ_CACHE', DEFAULT_CACHE_PATH)
+        self.ttl = ttl
+        self.endpoint = endpoint.rstrip('/')
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._puts = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), mode=0o700, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS endpoint_reads '
+                          '(endpoint TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, '
+                          'accessed_at REAL NOT NULL, PRIMARY KEY (endpoint, key))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS endpoint_reads_key ON endpoint_reads (key)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS endpoint_reads_accessed_at ON endpoint_reads (accessed_at)')
+
+    def __repr__(self):
+        return f'ReadCache({self.path!r}, ttl={self.ttl}, endpoint={self.endpoint!r})'
+
+    @staticmethod
+    def key(contract_address, method, *args):
+        return '/'.join([contract_address.lower(), method] + [str(a).lower() for a in args])
+
+    def get(self, key):
+        row = self.conn.execute('SELECT value FROM endpoint_reads WHERE endpoint = ? AND key = ? AND expires_at > ?',
+                                (self.endpoint, key, time.time())).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, key, value):
+        now = time.time()
+        self.conn.execute('INSERT OR REPLACE INTO endpoint_reads (endpoint, key, value, expires_at, accessed_at) '
+                          'VALUES (?, ?, ?, ?, ?)', (self.endpoint, key, value, now + self.ttl, now))
+        self._puts += 1
+        if self._puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        with self.conn:
+            self.conn.execute('DELETE FROM endpoint_reads WHERE expires_at <= ?', (time.time(),))
+            self.conn.execute('DELETE FROM endpoint_reads WHERE rowid IN (SELECT rowid FROM endpoint_reads '
+                              'ORDER BY accessed_at DESC, rowid DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def invalidate(self, *keys):
+        """
+        Drops the entries of `keys` under every endpoint, since events do not tell which endpoint they concern
+        """
+        if keys:
+            self.conn.execute(f'DELETE FROM endpoint_reads WHERE key IN ({", ".join("?" * len(keys))})', keys)
+
+    def invalidate_contract(self, contract_address):
+        """
+        Drops every entry of a contract under this cache's endpoint, e.g. after sending transactions to it
+        """
+        prefix = contract_address.lower() + '/'
+        # '0' sorts right after '/', so the range holds exactly the keys starting with the prefix
+        self.conn.execute('DELETE FROM endpoint_reads WHERE endpoint = ? AND key >= ? AND key < ?',
+                          (self.endpoint, prefix, prefix[:-1] + '0'))
+
+    def keys_for_event(self, event):
+        """
+        Cache keys made stale by an event delivered by an EthVigil webhook
+        """
+        contract = event.get('contract')
+        data = event.get('event_data') or dict()
+        if not contract:
+            return []
+        if event.get('event_name') == 'Transfer':
+            sender, recipient = data.get('from', ''), data.get('to', '')
+            keys = [self.key(contract, 'balanceOf', sender), self.key(contract, 'balanceOf', recipient)]
+            if ZERO_ADDRESS in (sender.lower(), recipient.lower()):
+                # minted or burned
+                keys.append(self.key(contract, 'totalSupply'))
+            return keys
+        if event.get('event_name') == 'Approval':
+            return [self.key(contract, 'allowance', data.get('owner', ''), data.get('spender', ''))]
+        return []
+
+    def invalidate_event(self, event):
+        keys = self.keys_for_event(event)
+        self.invalidate(*keys)
+        return keys
+
+    def close(self):
+        self.conn.close()
@@ -16,7 +16,8 @@ setup(
             'requests == 2.22.0',
             'eth-account == 0.4.0',
             'click == 7.0',
-            'tornado == 6.0.3'
+            'tornado == 6.0.3',
+            'pycurl == 7.43.0.5'
         ],
     version="0.1"
 )
\ No newline at end of file
@@ -1,13 +1,16 @@
 from eth_account.messages import defunct_hash_message
 from eth_account.account import Account
-import requests
+import os
+import sys
+
+# the shared EthVigil client lives in the erc20 directory, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ethvigil_client import EthVigilClient  # noqa: E402
 
 
 def main():
     contract = "0xcontractAddress"
     api_key = '1122-122-23443-1133'
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json',
-               'X-API-KEY': api_key}
     private_key = "0xprivatekeyhexstring"
     api_endpoint = "https://beta.ethvigil.com/api"
     events_to_be_registered_on = ['Approval', 'Transfer']
@@ -24,12 +27,11 @@ def main():
         "id": hook_id,
         "events": events_to_be_registered_on
     }
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
+    client = EthVigilClient(internal_api_endpoint=api_endpoint)
     print(f'Registering | hook ID: {hook_id} | events: {events_to_be_registered_on} | contract: {contract}')
-    r = requests.post(url=f'{api_endpoint}/hooks/updateEvents', json=method_args,
-                      headers=headers)
+    r = client.update_hook_events(method_args)
     print(r.text)
-    if r.status_code == requests.codes.ok:
+    if r.status_code == 200:
         r = r.json()
         if r['success']:
             print('Succeeded in adding hook')
@@ -1,14 +1,17 @@
-import requests
+import os
+import sys
+
+# the shared EthVigil client lives in the erc20 directory, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ethvigil_client import EthVigilClient  # noqa: E402
 
 
 def main():
     contract_address = "0xcontractAddress"
     api_key = '1122-122-23443-1133'
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json',
-               'X-API-KEY': api_key}
     rest_api_endpoint = 'https://beta-api.ethvigil.com/v0.1'
-    method_api_endpoint = f'{rest_api_endpoint}/contract/{contract_address}/totalSupply'
-    r = requests.get(url=method_api_endpoint, headers=headers)
+    client = EthVigilClient(rest_api_endpoint=rest_api_endpoint, api_key=api_key)
+    r = client.read(contract_address, 'totalSupply')
     print(r.text)
 
 
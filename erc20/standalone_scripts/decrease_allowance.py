@@ -1,4 +1,9 @@
-import requests
+import os
+import sys
+
+# the shared EthVigil client lives in the erc20 directory, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ethvigil_client import EthVigilClient  # noqa: E402
 
 
 def main():
@@ -6,12 +11,11 @@ def main():
     api_key = '1122-122-23443-1133'
     rest_api_endpoint = 'https://beta-api.ethvigil.com/v0.1'
     method_args = {'spender': '0x774246187E1E2205C5920898eEde0945016080Df', 'subtractedValue': 100}
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{rest_api_endpoint}/contract/{contract_address}/decreaseAllowance'
+    client = EthVigilClient(rest_api_endpoint=rest_api_endpoint, api_key=api_key)
     print('Calling decreaseAllowance()\n........')
     print(f'Contract: {contract_address}')
     print(f'Method arguments:\n===============\n{method_args}')
-    r = requests.post(url=method_api_endpoint, json=method_args, headers=headers)
+    r = client.call(contract_address, 'decreaseAllowance', method_args)
     print(r.text)
 
 
@@ -1,7 +1,12 @@
 from eth_account.messages import defunct_hash_message
 from eth_account.account import Account
-import requests
-import json
+import os
+import sys
+
+# the shared EthVigil client lives in the erc20 directory, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from deploy_registry import deploy_once  # noqa: E402
+from ethvigil_client import EthVigilClient  # noqa: E402
 
 
 def main():
@@ -22,10 +27,12 @@ def main():
     print('Deploying with constructor arguments: ')
     print(constructor_inputs)
     # API call to deploy
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
     api_endpoint = "https://beta.ethvigil.com/api"
-    r = requests.post(api_endpoint + '/deploy', json=deploy_params, headers=headers)
-    rj = r.json()
+    client = EthVigilClient(internal_api_endpoint=api_endpoint)
+    # the known results are returned if this exact deploy succeeded before
+    rj, known = deploy_once(client, deploy_params, Account.from_key(private_key).address)
+    if known:
+        print('This contract was already deployed with the same source and constructor inputs')
     print('Deployed contract results')
     print(rj)
 
@@ -1,13 +1,16 @@
 from eth_account.messages import defunct_hash_message
 from eth_account.account import Account
-import requests
+import os
+import sys
+
+# the shared EthVigil client lives in the erc20 directory, one level up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ethvigil_client import EthVigilClient  # noqa: E402
 
 
 def main():
     contract = "0xcontractAddress"
     api_key = '1122-122-23443-1133'
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json',
-               'X-API-KEY': api_key}
     private_key = "0xprivatekeyhexstring"
     api_endpoint = "https://beta.ethvigil.com/api"
     msg = 'dummystring'
@@ -21,9 +24,10 @@ def main():
         "contract": contract,
         "web": "https://randomstring.ngrok.io"
     }
-    r = requests.post(url=f'{api_endpoint}/hooks/add', json=method_args, headers=headers)
+    client = EthVigilClient(internal_api_endpoint=api_endpoint)
+    r = client.add_hook(method_args)
     print(r.text)
-    if r.status_code == requests.codes.ok:
+    if r.status_code == 200:
         r = r.json()
         if not r['success']:
             print('Failed to register webhook with Ethvigil API...')
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+
+from bulk import RecordWriter, iter_records, read_value, run_bounded
+
+
+class Response(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = json.dumps(body)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def test_read_value():
+    assert read_value(Response(200, {'success': True, 'data': [{'uint256': 1000}]})) == 1000
+    with pytest.raises(ValueError, match='HTTP 404'):
+        read_value(Response(404, {'success': False, 'error': 'no such contract'}))
+    with pytest.raises(ValueError, match='HTTP 200'):
+        read_value(Response(200, {'success': False, 'error': 'reverted'}))
+
+
+def test_csv_addresses_with_and_without_header(tmp_path):
+    with_header, without_header = tmp_path / 'with.csv', tmp_path / 'without.csv'
+    with_header.write_text('Address\n0x01\n\n0x02\n')
+    without_header.write_text('0x01,ignored\n 0x02 \n')
+    expected = [(1, {'address': '0x01'}), (2, {'address': '0x02'})]
+    assert list(iter_records(str(with_header), ['address'])) == expected
+    assert list(iter_records(str(without_header), ['address'])) == expected
+
+
+def test_ndjson_addresses(tmp_path):
+    path = tmp_path / 'addresses.ndjson'
+    path.write_text('{"address": "0x01", "label": "a"}\n\n{"label": "b"}\n')
+    records = iter_records(str(path), ['address'])
+    assert next(records) == (1, {'address': '0x01'})
+    with pytest.raises(ValueError, match="Row 2 .* no 'address' key"):
+        next(records)
+
+
+@pytest.mark.parametrize('name', ['balances.csv', 'balances.ndjson'])
+def test_record_writer_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    writer = RecordWriter(path, ['address', 'balance', 'error'])
+    writer.write({'address': '0x01', 'balance': 5})
+    writer.write({'address': '0x02', 'error': 'HTTP 500'})
+    writer.close()
+    rows = [record for _, record in iter_records(path, ['address', 'balance', 'error'])]
+    assert [row['address'] for row in rows] == ['0x01', '0x02']
+    assert [str(row['balance'] or '') for row in rows] == ['5', '']
+    assert [row['error'] or '' for row in rows] == ['', 'HTTP 500']
+
+
+def test_run_bounded_caps_concurrency_and_reads_lazily():
+    state = {'in_flight': 0, 'max_in_flight': 0, 'pulled': 0, 'done': 0}
+
+    def items():
+        for i in range(50):
+            state['pulled'] += 1
+            # the items of the workers in flight, and the one waiting for a worker to free up
+            assert state['pulled'] - state['done'] <= 5 + 1
+            yield i
+
+    async def worker(item):
+        state['in_flight'] += 1
+        state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        await asyncio.sleep(0.001 * (item % 3))
+        state['in_flight'] -= 1
+        state['done'] += 1
+
+    assert asyncio.run(run_bounded(items(), worker, 5)) == 50
+    assert state['max_in_flight'] == 5 and state['done'] == 50
+
+
+def test_run_bounded_raises_the_first_error_once_in_flight_workers_finish():
+    finished = list()
+
+    async def worker(item):
+        await asyncio.sleep(0.001 * item)
+        if item == 2:
+            raise ValueError(item)
+        finished.append(item)
+
+    with pytest.raises(ValueError):
+        asyncio.run(run_bounded(range(100), worker, 4))
+    # the workers started before the error completed, no new ones were started after it
+    assert {0, 1, 3}.issubset(finished) and max(finished) < 10
@@ -0,0 +1,100 @@
+import json
+
+import pycurl
+import pytest
+import tornado.curl_httpclient
+
+from bulk import Checkpoint, error_outcome, outcome
+
+
+class Response(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = body if isinstance(body, str) else json.dumps(body)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def journal(path, states):
+    """
+    Checkpoint at `path` with rows 0, 1, ... journaled in `states`, as a crashed run leaves it
+    """
+    checkpoint = Checkpoint(path)
+    for row_number, state in enumerate(states):
+        checkpoint.mark_pending(row_number, f'row {row_number}')
+        if state != 'pending':
+            checkpoint.mark(row_number, state)
+    checkpoint.close()
+
+
+STATES = ['done', 'failed', 'unknown', 'pending']
+
+
+def test_resume_skips_the_rows_that_may_have_been_sent(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    journal(path, STATES)
+    checkpoint = Checkpoint(path)
+    assert [checkpoint.should_skip(row_number, f'row {row_number}') for row_number in range(5)] == \
+        [True, False, True, True, False]
+    assert checkpoint.counts() == {state: 1 for state in STATES}
+    checkpoint.close()
+
+
+def test_resume_with_retry_unknown_only_skips_done_rows(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    journal(path, STATES)
+    checkpoint = Checkpoint(path, retry_unknown=True)
+    assert [checkpoint.should_skip(row_number, f'row {row_number}') for row_number in range(4)] == \
+        [True, False, False, False]
+    checkpoint.close()
+
+
+def test_last_state_of_a_row_wins(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    journal(path, ['failed'])
+    checkpoint = Checkpoint(path)
+    # the failed row is retried by the resumed run, and succeeds
+    checkpoint.mark_pending(0, 'row 0')
+    checkpoint.mark(0, 'done', txHash='0x01')
+    checkpoint.close()
+    assert Checkpoint(path).should_skip(0, 'row 0')
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    journal(path, ['done'])
+    with open(path, 'a') as f:
+        f.write('{"row": 1, "sta')
+    checkpoint = Checkpoint(path)
+    assert checkpoint.should_skip(0, 'row 0')
+    assert not checkpoint.should_skip(1, 'row 1')
+    checkpoint.close()
+
+
+def test_changed_input_is_refused(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    journal(path, ['done'])
+    with pytest.raises(ValueError, match='Row 0 differs'):
+        Checkpoint(path).should_skip(0, 'another row')
+
+
+@pytest.mark.parametrize('status_code, body, state', [
+    (200, {'success': True, 'data': [{'txHash': '0x01'}]}, 'done'),
+    (200, {'success': False, 'error': 'reverted'}, 'unknown'),
+    (400, {'success': False, 'error': 'invalid address'}, 'failed'),
+    (429, 'Too Many Requests', 'failed'),
+    (502, '<html>Bad Gateway</html>', 'unknown'),
+])
+def test_outcome(status_code, body, state):
+    assert outcome(Response(status_code, body))[0] == state
+
+
+@pytest.mark.parametrize('errno, state', [
+    (pycurl.E_COULDNT_CONNECT, 'failed'),
+    (pycurl.E_COULDNT_RESOLVE_HOST, 'failed'),
+    (pycurl.E_OPERATION_TIMEDOUT, 'unknown'),
+    (pycurl.E_RECV_ERROR, 'unknown'),
+])
+def test_error_outcome(errno, state):
+    assert error_outcome(tornado.curl_httpclient.CurlError(errno, 'curl error'))[0] == state
@@ -0,0 +1,110 @@
+import asyncio
+import multiprocessing
+import os
+
+import pytest
+
+from dedup import DedupIndex, dedup_key
+
+
+def claims(dedup, *keys):
+    async def claim_all():
+        return [await dedup.claim(key) for key in keys]
+    return asyncio.run(claim_all())
+
+
+def test_dedup_key():
+    assert dedup_key({'txHash': '0xAB', 'logIndex': 3}) == '0xab:3'
+    assert dedup_key({'txHash': '0xAB'}) == '0xab'
+    assert dedup_key({'ethvigil_event_id': 7}) == 'ethvigil:7'
+    assert dedup_key({'event_name': 'Transfer'}) is None
+
+
+@pytest.mark.parametrize('shards', [None, 1, 4])
+def test_redeliveries_are_not_claimed(tmp_path, shards):
+    dedup = DedupIndex(str(tmp_path / 'dedup.sqlite') if shards else None, shards=shards or 1)
+    assert claims(dedup, 'a', 'b', 'a', 'b', 'c') == [True, True, False, False, True]
+    dedup.close()
+
+
+def test_claims_survive_restarts(tmp_path):
+    path = str(tmp_path / 'dedup.sqlite')
+    dedup = DedupIndex(path, shards=4)
+    assert claims(dedup, 'a') == [True]
+    dedup.close()
+    assert len(os.listdir(tmp_path)) >= 4
+    dedup = DedupIndex(path, shards=4)
+    assert claims(dedup, 'a', 'b') == [False, True]
+    dedup.close()
+
+
+def test_expired_keys_are_claimed_again(tmp_path):
+    dedup = DedupIndex(str(tmp_path / 'dedup.sqlite'), ttl=0)
+    assert claims(dedup, 'a', 'a') == [True, True]
+    assert len(dedup) <= 1
+    dedup.close()
+
+
+def test_least_recently_seen_keys_are_evicted_from_memory():
+    dedup = DedupIndex(max_entries=2)
+    # 'a' is seen again, so 'b' is the least recently seen one once 'c' arrives
+    assert claims(dedup, 'a', 'b', 'a', 'c') == [True, True, False, True]
+    assert len(dedup) == 2
+    assert claims(dedup, 'a', 'c', 'b') == [False, False, True]
+
+
+def test_evicted_keys_are_still_found_in_sqlite(tmp_path):
+    dedup = DedupIndex(str(tmp_path / 'dedup.sqlite'), max_entries=1)
+    assert claims(dedup, 'a', 'b', 'a') == [True, True, False]
+    dedup.close()
+
+
+def test_concurrent_claims_of_a_key_claim_it_once(tmp_path):
+    dedup = DedupIndex(str(tmp_path / 'dedup.sqlite'), shards=2)
+
+    async def claim_concurrently():
+        return await asyncio.gather(*(dedup.claim(key) for key in ['a', 'b'] * 5))
+
+    claimed = asyncio.run(claim_concurrently())
+    assert claimed[:2] == [True, True] and not any(claimed[2:])
+    dedup.close()
+
+
+def test_discarded_keys_are_claimed_again(tmp_path):
+    dedup = DedupIndex(str(tmp_path / 'dedup.sqlite'))
+
+    async def claim_discard_claim():
+        first = await dedup.claim('a')
+        await dedup.discard('a')
+        return first, await dedup.claim('a')
+
+    assert asyncio.run(claim_discard_claim()) == (True, True)
+    dedup.close()
+
+
+def claim_in_worker(path, keys, results):
+    dedup = DedupIndex(path, shards=2)
+    results.put(claims(dedup, *keys))
+    dedup.close()
+
+
+def test_workers_claim_each_key_once(tmp_path):
+    # like the workers of a pre-forked listener, each receiving every delivery
+    path = str(tmp_path / 'dedup.sqlite')
+    DedupIndex(path, shards=2).close()
+    keys = [f'0x{i:064x}:0' for i in range(200)]
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=claim_in_worker, args=(path, keys, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    claimed = [results.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+    assert [sum(worker_claims[i] for worker_claims in claimed) for i in range(len(keys))] == [1] * len(keys)
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        DedupIndex(max_entries=0)
+    with pytest.raises(ValueError):
+        DedupIndex(shards=0)
@@ -0,0 +1,85 @@
+import gzip
+import json
+
+import pytest
+
+from ethvigil_client import EthVigilClient, GZIP_MIN_BYTES
+
+
+class FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = json.dumps({'success': status_code < 400, 'data': {'contract': '0x' + '0' * 40}})
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeSession(object):
+    """
+    Answers gzip-compressed uploads with `gzip_status` and the others with `status`, recording the bodies sent
+    """
+    def __init__(self, gzip_status, status=200):
+        self.gzip_status = gzip_status
+        self.status = status
+        self.uploads = list()
+
+    def post(self, url, data, headers=None, timeout=None):
+        compressed = (headers or {}).get('Content-Encoding') == 'gzip'
+        self.uploads.append(json.loads(gzip.decompress(data) if compressed else data))
+        self.uploads[-1]['compressed'] = compressed
+        return FakeResponse(self.gzip_status if compressed else self.status)
+
+
+DEPLOY_PARAMS = {'name': 'ERC20Mintable', 'code': 'x' * GZIP_MIN_BYTES, 'inputs': {}}
+
+
+def deploying_client(session, gzip_deploys=True):
+    client = EthVigilClient(internal_api_endpoint='http://127.0.0.1:1/api', gzip_deploys=gzip_deploys)
+    client.session = session
+    return client
+
+
+def test_deploys_uncompressed_by_default():
+    session = FakeSession(gzip_status=200)
+    client = EthVigilClient(internal_api_endpoint='http://127.0.0.1:1/api')
+    client.session = session
+    client.deploy(DEPLOY_PARAMS)
+    assert [upload['compressed'] for upload in session.uploads] == [False]
+
+
+def test_small_sources_are_not_compressed():
+    session = FakeSession(gzip_status=200)
+    deploying_client(session).deploy(dict(DEPLOY_PARAMS, code='contract C {}'))
+    assert [upload['compressed'] for upload in session.uploads] == [False]
+
+
+def test_accepted_gzip_upload_is_sent_once():
+    session = FakeSession(gzip_status=200)
+    client = deploying_client(session)
+    client.deploy(DEPLOY_PARAMS)
+    assert [upload['compressed'] for upload in session.uploads] == [True]
+    assert client.gzip_deploys
+
+
+@pytest.mark.parametrize('status', [400, 415])
+def test_unreadable_gzip_upload_is_sent_again_uncompressed(status):
+    session = FakeSession(gzip_status=status)
+    client = deploying_client(session)
+    assert client.deploy(DEPLOY_PARAMS).status_code == 200
+    assert [upload['compressed'] for upload in session.uploads] == [True, False]
+    assert session.uploads[1]['code'] == DEPLOY_PARAMS['code']
+    # later deploys skip the compressed upload
+    assert not client.gzip_deploys
+    client.deploy(DEPLOY_PARAMS)
+    assert [upload['compressed'] for upload in session.uploads] == [True, False, False]
+
+
+@pytest.mark.parametrize('status', [500, 502, 503, 504])
+def test_server_errors_are_not_sent_again(status):
+    # the contract may have been deployed before the error, a second upload could deploy it twice
+    session = FakeSession(gzip_status=status)
+    client = deploying_client(session)
+    client.deploy(DEPLOY_PARAMS)
+    assert [upload['compressed'] for upload in session.uploads] == [True]
+    assert client.gzip_deploys
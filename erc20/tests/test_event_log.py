@@ -0,0 +1,100 @@
+import asyncio
+import itertools
+import os
+import types
+
+import event_log
+from event_log import EventLog, EventLogReader, list_segments
+
+
+def append(directory, payloads, segment_size=event_log.DEFAULT_SEGMENT_SIZE):
+    async def append_all():
+        log = EventLog(directory, segment_size=segment_size, commit_interval=0)
+        seqs = [await log.append(payload) for payload in payloads]
+        await log.close()
+        return seqs
+    return asyncio.run(append_all())
+
+
+def test_replay_from_any_sequence_number(tmp_path):
+    directory = str(tmp_path)
+    # every record gets a segment of its own
+    assert append(directory, [b'a', b'b', b'c'], segment_size=1) == [0, 1, 2]
+    assert len(list_segments(directory)) == 3
+    reader = EventLogReader(directory)
+    assert list(reader.replay()) == [(0, b'a'), (1, b'b'), (2, b'c')]
+    assert list(reader.replay(2)) == [(2, b'c')]
+    assert list(reader.replay(3)) == []
+
+
+def test_torn_record_is_truncated_on_open(tmp_path):
+    directory = str(tmp_path)
+    append(directory, [b'a', b'b'])
+    _, path = list_segments(directory)[-1]
+    with open(path, 'ab') as f:
+        f.write(event_log.RECORD_HEADER.pack(10, 0) + b'torn')
+    assert list(EventLogReader(directory).replay()) == [(0, b'a'), (1, b'b')]
+    assert append(directory, [b'c']) == [2]
+    assert list(EventLogReader(directory).replay()) == [(0, b'a'), (1, b'b'), (2, b'c')]
+
+
+class Stop(Exception):
+    pass
+
+
+def follow(directory, monkeypatch, from_seq, appends):
+    """
+    Records yielded by tail(from_seq), with `appends[n]` appended at the nth poll that finds no new record
+    """
+    polls = itertools.count()
+
+    def sleep(_):
+        poll = next(polls)
+        if poll >= len(appends):
+            raise Stop
+        append(directory, *appends[poll])
+
+    scanned = list()
+    scan_records = event_log.scan_records
+
+    def scan_records_from(buf, offset=None):
+        # the reader passes an offset, the writer scans its last segment on open without one
+        if offset is not None:
+            scanned.append(offset)
+        return scan_records(buf, offset or 0)
+
+    monkeypatch.setattr(event_log, 'time', types.SimpleNamespace(sleep=sleep))
+    monkeypatch.setattr(event_log, 'scan_records', scan_records_from)
+    records = list()
+    try:
+        for record in EventLogReader(directory).tail(from_seq):
+            records.append(record)
+    except Stop:
+        # raised by sleep() once all appends were made
+        pass
+    return records, scanned
+
+
+def test_tail_reads_on_from_the_last_record(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    append(directory, [b'a', b'b'])
+    records, scanned = follow(directory, monkeypatch, 1, [([b'c'],), ([],), ([b'd', b'e'],)])
+    assert records == [(1, b'b'), (2, b'c'), (3, b'd'), (4, b'e')]
+    # the segment is scanned from its start once, idle polls do not scan it at all
+    assert scanned[0] == 0 and all(offset > 0 for offset in scanned[1:])
+    assert len(scanned) == 3
+
+
+def test_tail_follows_segment_rollovers(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    append(directory, [b'a'], segment_size=1)
+    records, _ = follow(directory, monkeypatch, 0, [([b'b', b'c'], 1)])
+    assert records == [(0, b'a'), (1, b'b'), (2, b'c')]
+    assert len(list_segments(directory)) == 3
+
+
+def test_tail_waits_for_the_log(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'events')
+    os.makedirs(directory)
+    records, _ = follow(directory, monkeypatch, 0, [([b'a'],)])
+    assert records == [(0, b'a')]
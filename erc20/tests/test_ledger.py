@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+
+from event_log import EventLog
+from ledger import Ledger, SNAPSHOT_NAME, ZERO_ADDRESS
+
+TOKEN = '0x' + 'aa' * 20
+ALICE = '0x' + '11' * 20
+BOB = '0x' + '22' * 20
+CAROL = '0x' + '33' * 20
+
+
+def transfer(sender, recipient, value, block_number=1, log_index=0):
+    return {'event_name': 'Transfer', 'contract': TOKEN.upper(), 'blockNumber': block_number, 'logIndex': log_index,
+            'event_data': {'from': sender, 'to': recipient, 'value': value}}
+
+
+def approval(owner, spender, value, block_number, log_index=0):
+    return {'event_name': 'Approval', 'contract': TOKEN, 'blockNumber': block_number, 'logIndex': log_index,
+            'event_data': {'owner': owner, 'spender': spender, 'value': value}}
+
+
+def log_events(directory, events):
+    async def append_all():
+        log = EventLog(directory, commit_interval=0)
+        seqs = [await log.append(json.dumps(event).encode()) for event in events]
+        await log.close()
+        return seqs
+    return asyncio.run(append_all())
+
+
+def ledger_of(events):
+    ledger = Ledger()
+    for seq, event in enumerate(events):
+        ledger.apply(event, seq)
+    return ledger
+
+
+def test_transfers_mints_and_burns():
+    ledger = ledger_of([transfer(ZERO_ADDRESS, ALICE, 100), transfer(ALICE, BOB.upper(), 30),
+                        transfer(BOB, ZERO_ADDRESS, 10), {'event_name': 'OwnershipTransferred'}])
+    assert (ledger.balance_of(TOKEN, ALICE), ledger.balance_of(TOKEN, BOB)) == (70, 20)
+    assert ledger.supply(TOKEN.upper()) == 90
+    assert ledger.seq == 3
+
+
+def test_latest_approval_wins_whatever_the_delivery_order():
+    ledger = ledger_of([approval(ALICE, BOB, 5, block_number=12), approval(ALICE, BOB, 50, block_number=10),
+                        approval(ALICE, BOB, 7, block_number=12, log_index=3)])
+    assert ledger.allowance(TOKEN, ALICE, BOB) == 7
+
+
+def test_merged_worker_ledgers_match_a_single_ledger():
+    events = [transfer(ZERO_ADDRESS, ALICE, 100, 1), transfer(ALICE, BOB, 40, 2), transfer(BOB, CAROL, 15, 3),
+              approval(ALICE, CAROL, 9, 4), approval(ALICE, CAROL, 3, 5), transfer(CAROL, ZERO_ADDRESS, 5, 6)]
+    # SO_REUSEPORT spreads the events over the workers in no particular order
+    workers = [ledger_of(events[1::2][::-1]), ledger_of(events[0::2])]
+    merged = Ledger()
+    for worker in workers:
+        merged.merge(worker)
+    single = ledger_of(events)
+    assert merged.balances == single.balances
+    assert merged.total_supply == single.total_supply
+    assert merged.allowances == single.allowances
+    assert merged.allowance(TOKEN, ALICE, CAROL) == 3
+
+
+def test_snapshot_round_trip(tmp_path):
+    ledger = ledger_of([transfer(ZERO_ADDRESS, ALICE, 2 ** 200), approval(ALICE, BOB, 1, 2)])
+    path = str(tmp_path / SNAPSHOT_NAME)
+    ledger.write_snapshot(path)
+    loaded = Ledger.load(path)
+    assert loaded.state() == ledger.state()
+    assert loaded.balance_of(TOKEN, ALICE) == 2 ** 200
+    assert Ledger.load(str(tmp_path / 'missing.json')).seq == -1
+
+
+def test_snapshot_plus_replay_of_later_events(tmp_path):
+    directory = str(tmp_path)
+    events = [transfer(ZERO_ADDRESS, ALICE, 100), transfer(ALICE, BOB, 10), transfer(ALICE, CAROL, 20)]
+    log_events(directory, events[:2])
+    ledger = Ledger()
+    assert ledger.catch_up(directory) == 2
+    ledger.write_snapshot(os.path.join(directory, SNAPSHOT_NAME))
+    log_events(directory, events[2:])
+    # as the listener does on start: the snapshot, then only the events logged after it
+    restarted = Ledger.load(os.path.join(directory, SNAPSHOT_NAME))
+    assert restarted.seq == 1
+    assert restarted.catch_up(directory) == 1
+    assert restarted.state() == ledger_of(events).state()
+
+
+def test_from_event_log_merges_the_workers(tmp_path):
+    events = [transfer(ZERO_ADDRESS, ALICE, 100), transfer(ALICE, BOB, 10), transfer(ALICE, CAROL, 20)]
+    log_events(str(tmp_path / 'worker-0'), events[:1])
+    log_events(str(tmp_path / 'worker-1'), events[1:])
+    ledger = Ledger.from_event_log(str(tmp_path))
+    assert ledger.balances == ledger_of(events).balances
+    assert ledger.supply(TOKEN) == 100
@@ -0,0 +1,116 @@
+import asyncio
+import csv
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import pycurl
+import pytest
+import tornado.curl_httpclient
+
+from bulk import run_partitioned, with_retries
+from session_cache import SessionCache, account_digest
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'cli.py')
+PRIVATE_KEY = '0x' + '11' * 32
+CONTRACT = '0x' + '22' * 20
+
+
+class Response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def sender(*results):
+    """
+    send() for with_retries, returning or raising `results` in turn, and the list of its calls
+    """
+    calls = list()
+
+    async def send():
+        calls.append(len(calls))
+        result = results[len(calls) - 1]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return send, calls
+
+
+def test_retries_refused_connections():
+    send, calls = sender(tornado.curl_httpclient.CurlError(pycurl.E_COULDNT_CONNECT, 'refused'),
+                         tornado.curl_httpclient.CurlError(pycurl.E_COULDNT_RESOLVE_HOST, 'no such host'),
+                         Response(200))
+    assert asyncio.run(with_retries(send, retries=3, backoff=0)).status_code == 200
+    assert len(calls) == 3
+
+
+def test_retries_turned_away_requests():
+    send, calls = sender(Response(429), Response(503), Response(200))
+    assert asyncio.run(with_retries(send, retries=3, backoff=0)).status_code == 200
+    assert len(calls) == 3
+
+
+def test_gives_up_after_retries():
+    send, calls = sender(*[tornado.curl_httpclient.CurlError(pycurl.E_COULDNT_CONNECT, 'refused')] * 3)
+    with pytest.raises(tornado.curl_httpclient.CurlError):
+        asyncio.run(with_retries(send, retries=2, backoff=0))
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize('result', [tornado.curl_httpclient.CurlError(pycurl.E_OPERATION_TIMEDOUT, 'timed out'),
+                                    Response(500), Response(400)])
+def test_does_not_retry_what_may_have_gone_through(result):
+    send, calls = sender(result, Response(200))
+    try:
+        asyncio.run(with_retries(send, retries=3, backoff=0))
+    except tornado.curl_httpclient.CurlError:
+        pass
+    assert len(calls) == 1
+
+
+def test_lanes_keep_the_order_of_each_key():
+    async def run():
+        seen = list()
+
+        async def worker(item):
+            # later items of other keys overtake this one
+            await asyncio.sleep(0.001 * (item[1] % 3))
+            seen.append(item)
+        items = [(key, n) for n in range(30) for key in 'abcde']
+        await run_partitioned(items, lambda item: item[0], worker, lanes=3, queue_size=2)
+        return seen
+    seen = asyncio.run(run())
+    assert len(seen) == 150
+    for key in 'abcde':
+        assert [n for k, n in seen if k == key] == list(range(30))
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_payout_retries_a_closed_port(tmp_path):
+    endpoint = f'http://127.0.0.1:{closed_port()}'
+    with open(tmp_path / 'settings.json', 'w') as f:
+        json.dump({'development': {'privatekey': PRIVATE_KEY, 'contractAddress': CONTRACT,
+                                   'REST_API_ENDPOINT': endpoint + '/v0.1',
+                                   'INTERNAL_API_ENDPOINT': endpoint + '/api'}}, f)
+    # a cached API key, so that the command does not log in
+    env = dict(os.environ, EV_SESSION_CACHE=str(tmp_path / 'sessions.json'),
+               EV_READ_CACHE=str(tmp_path / 'read_cache.sqlite'), EV_EVENT_STORE=str(tmp_path / 'events.sqlite'))
+    SessionCache(path=env['EV_SESSION_CACHE']).put(account_digest(PRIVATE_KEY), endpoint + '/api', 'api-key')
+    with open(tmp_path / 'transfers.csv', 'w') as f:
+        f.write(f'{"0x" + "33" * 20},{"0x" + "44" * 20},5\n')
+    proc = subprocess.run([sys.executable, CLI, 'payout', 'transfers.csv', '--retries', '2'], cwd=tmp_path, env=env,
+                          capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0, proc.stderr
+    with open(tmp_path / 'transfers.csv.results.csv') as f:
+        [row] = list(csv.DictReader(f))
+    assert row['attempts'] == '3'
+    # nothing reached the API, so the transfer can be sent again
+    assert row['state'] == 'failed'
+    assert 'failed: 1' in proc.stdout
@@ -0,0 +1,51 @@
+from read_cache import ReadCache, ZERO_ADDRESS
+
+CONTRACT = '0x' + 'ab' * 20
+ALICE = '0x' + '11' * 20
+BOB = '0x' + '22' * 20
+
+
+def test_hits_do_not_write(tmp_path):
+    cache = ReadCache(str(tmp_path / 'reads.sqlite'), ttl=60)
+    key = cache.key(CONTRACT, 'balanceOf', ALICE)
+    cache.put(key, '{"success": true}')
+    writes = cache.conn.total_changes
+    assert cache.get(key) == '{"success": true}'
+    assert cache.conn.total_changes == writes
+
+
+def test_entries_are_kept_per_endpoint(tmp_path):
+    path = str(tmp_path / 'reads.sqlite')
+    mainnet, testnet = ReadCache(path, endpoint='https://main/'), ReadCache(path, endpoint='https://test')
+    key = mainnet.key(CONTRACT, 'totalSupply')
+    mainnet.put(key, 'main')
+    assert testnet.get(key) is None
+    assert ReadCache(path, endpoint='https://main').get(key) == 'main'
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ReadCache(str(tmp_path / 'reads.sqlite'), ttl=-1)
+    key = cache.key(CONTRACT, 'totalSupply')
+    cache.put(key, 'stale')
+    assert cache.get(key) is None
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    cache = ReadCache(str(tmp_path / 'reads.sqlite'), ttl=60, max_entries=2, evict_every=3)
+    keys = [cache.key(CONTRACT, 'balanceOf', f'0x{i:040x}') for i in range(3)]
+    for key in keys:
+        cache.put(key, key)
+    assert [cache.get(key) for key in keys] == [None, keys[1], keys[2]]
+
+
+def test_mint_invalidates_balance_and_total_supply(tmp_path):
+    cache = ReadCache(str(tmp_path / 'reads.sqlite'), ttl=60)
+    stale = [cache.key(CONTRACT, 'balanceOf', ALICE), cache.key(CONTRACT, 'totalSupply')]
+    kept = cache.key(CONTRACT, 'balanceOf', BOB)
+    for key in stale + [kept]:
+        cache.put(key, 'cached')
+    event = {'event_name': 'Transfer', 'contract': CONTRACT.upper(),
+             'event_data': {'from': ZERO_ADDRESS, 'to': ALICE.upper(), 'value': 10}}
+    cache.invalidate_event(event)
+    assert [cache.get(key) for key in stale] == [None, None]
+    assert cache.get(kept) == 'cached'
@@ -1,14 +1,47 @@
 import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
 import tornado.options
 import tornado.web
 import tornado.httpclient
 import tornado.escape
 from tornado.options import define, options
+import asyncio
+import functools
 import logging
+import os
+import signal
 import sys
+import time
+from dedup import DedupIndex, dedup_key
+from event_log import EventLog
+from metrics import InstrumentedApplication, MetricsHandler, monitor_loop_lag, server_metrics
+from event_store import EventStore
+from ledger import Ledger, SNAPSHOT_NAME
+import prefork
+from read_cache import ReadCache
 
 define("port", default=5554, help="run on the given port", type=int)
+define("event_log_dir", default="events", help="directory of the log of received events")
+define("event_log_segment_mb", default=64, help="size of the event log segments in MB", type=int)
+define("event_log_commit_ms", default=2, help="how long an event waits for others to share its fsync, in ms",
+       type=float)
+define("event_store_flush_ms", default=200, help="how often events are written to the local event store, in ms",
+       type=int)
+define("ledger_snapshot_s", default=60, help="how often the token ledger is snapshotted, in seconds", type=float)
+define("workers", default=1, help="number of worker processes, sharing the port through SO_REUSEPORT", type=int)
+define("dedup_entries", default=200000, help="number of delivered payload ids kept in memory to drop redeliveries",
+       type=int)
+define("dedup_ttl", default=3 * 24 * 3600, help="seconds for which redeliveries of a payload are dropped", type=int)
+define("dedup_db", default="", help="SQLite file keeping delivered payload ids across restarts "
+                                    "(default with --workers: <event_log_dir>/dedup.sqlite, see --dedup_shards)")
+define("dedup_shards", default=8, help="number of SQLite files the payload ids of --dedup_db are spread over, so that "
+                                       "workers seldom wait for each other; keep it across restarts", type=int)
+define("read_cache", default=False, help="drop the reads cached by the CLI (READ_CACHE_TTL) that each event makes stale",
+       type=bool)
+define("shutdown_timeout", default=10, help="seconds a stopping worker waits for the requests in flight", type=float)
+define("metrics_event_names", default=64, help="event names counted separately in /metrics, further ones are counted "
+                                               "as _other", type=int)
 
 tornado_logger = logging.getLogger('WebhookListener')
 tornado_logger.propagate = False
@@ -34,33 +67,174 @@ logging.getLogger("tornado.access").propagate = False
 
 
 class MainHandler(tornado.web.RequestHandler):
+    def initialize(self, event_log, dedup, event_store, ledger, read_cache, stats, events):
+        self.event_log = event_log
+        self.dedup = dedup
+        self.event_store = event_store
+        self.ledger = ledger
+        self.read_cache = read_cache
+        self.stats = stats
+        self.events = events
+
+    def prepare(self):
+        self.stats.incr('requests')
+        self.stats.incr('in_flight')
+
+    def on_finish(self):
+        self.stats.incr('in_flight', -1)
+        if self.get_status() >= 400:
+            self.stats.incr('errors')
+
     async def post(self):
         # tornado_logger.debug(self.request.headers['content-type'])
         # tornado_logger.debug('---Transaction---')
         request_json = tornado.escape.json_decode(self.request.body)
+        key = dedup_key(request_json)
+        # atomic across workers: of concurrent deliveries of a payload, a single one is claimed
+        if key is not None and not await self.dedup.claim(key):
+            self.stats.incr('duplicates')
+            tornado_logger.debug('Dropped redelivery of %s', key)
+            self.set_status(status_code=202)
+            self.write({'success': True, 'duplicate': True})
+            return
+        try:
+            # acknowledge only once the event is on disk, EthVigil delivers it again otherwise
+            seq = await self.event_log.append(self.request.body)
+        except Exception:
+            if key is not None:
+                await self.dedup.discard(key)
+            raise
+        # right away, so that the ledger applies records in event log order
+        self.ledger.apply(request_json, seq)
+        self.stats.incr('events')
+        self.stats.incr('bytes', len(self.request.body))
         self.set_status(status_code=202)
         self.write({'success': True})
         if 'event_name' in request_json:
+            self.events.incr(str(request_json['event_name']))
             tornado_logger.debug('========New event received========')
             tornado_logger.debug(request_json['event_name'])
             tornado_logger.debug('---JSON Payload delivered-----')
             tornado_logger.debug(request_json)
+            self.event_store.add(request_json)
+            if self.read_cache is not None:
+                invalidated = self.read_cache.invalidate_event(request_json)
+                if invalidated:
+                    tornado_logger.debug('Invalidated cached reads: %s', invalidated)
 
 
-def main():
-    tornado.options.parse_command_line()
-    application = tornado.web.Application([
-        (r"/", MainHandler),
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, stats):
+        self.stats = stats
 
-    ])
-    http_server = tornado.httpserver.HTTPServer(application)
-    http_server.listen(options.port)
-    try:
-        tornado.ioloop.IOLoop.current().start()
-    except KeyboardInterrupt:
+    def get(self):
+        self.write(self.stats.snapshot())
+
+
+def run_worker(worker_id, stats, metrics):
+    """
+    Serves webhook deliveries until SIGTERM or SIGINT, then lets the requests in flight finish and returns
+    """
+    event_log_dir = options.event_log_dir
+    if stats.workers > 1:
+        # the event log has a single writer
+        event_log_dir = os.path.join(event_log_dir, f'worker-{worker_id}')
+    slot = stats.slot(worker_id)
+    metrics.bind(worker_id)
+    dedup_db = options.dedup_db
+    if not dedup_db and stats.workers > 1:
+        # redeliveries may reach any worker
+        dedup_db = os.path.join(options.event_log_dir, 'dedup.sqlite')
+    dedup = DedupIndex(dedup_db or None, max_entries=options.dedup_entries, ttl=options.dedup_ttl,
+                       shards=options.dedup_shards)
+    event_store = EventStore()
+    # only with the CLI's read cache on, the listener would run a write on its event loop for every event otherwise
+    read_cache = ReadCache() if options.read_cache else None
+
+    async def serve():
+        event_log = EventLog(event_log_dir, segment_size=options.event_log_segment_mb * 1024 * 1024,
+                             commit_interval=options.event_log_commit_ms / 1000)
+        ledger_path = os.path.join(event_log_dir, SNAPSHOT_NAME)
+        ledger = Ledger.load(ledger_path)
+        replayed = ledger.catch_up(event_log_dir)
+        tornado_logger.debug('Loaded %s, replayed %d events logged after its snapshot', ledger, replayed)
+        loop = asyncio.get_running_loop()
+        # set once no more events can arrive
+        stopped = asyncio.Event()
+
+        async def snapshot_ledger():
+            snapshot_seq = ledger.seq if not replayed else None
+            while not stopped.is_set():
+                try:
+                    await asyncio.wait_for(stopped.wait(), options.ledger_snapshot_s)
+                except asyncio.TimeoutError:
+                    pass
+                if ledger.seq != snapshot_seq:
+                    snapshot = ledger.copy()
+                    await loop.run_in_executor(None, snapshot.write_snapshot, ledger_path)
+                    snapshot_seq = snapshot.seq
+
+        application = InstrumentedApplication([
+            (r"/", MainHandler, dict(event_log=event_log, dedup=dedup, event_store=event_store, ledger=ledger,
+                                     read_cache=read_cache, stats=slot,
+                                     events=metrics['webhook_events_total'])),
+            (r"/stats", StatsHandler, dict(stats=stats)),
+            (r"/metrics", MetricsHandler, dict(metrics=metrics)),
+        ], metrics)
+        http_server = tornado.httpserver.HTTPServer(application)
+        http_server.add_sockets(tornado.netutil.bind_sockets(options.port, reuse_port=stats.workers > 1))
+        # batches the inserts into the event store
+        tornado.ioloop.PeriodicCallback(event_store.flush, options.event_store_flush_ms).start()
+        snapshots = asyncio.ensure_future(snapshot_ledger())
+        lag_monitor = asyncio.ensure_future(monitor_loop_lag(metrics['ioloop_lag_seconds']))
+        stopping = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stopping.set)
+        await stopping.wait()
         tornado_logger.debug('Shutting down...')
-        tornado.ioloop.IOLoop.current().stop()
+        http_server.stop()
+        deadline = loop.time() + options.shutdown_timeout
+        while slot['in_flight'] > 0 and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        await http_server.close_all_connections()
+        lag_monitor.cancel()
+        await event_log.close()
+        stopped.set()
+        await snapshots
+
+    try:
+        tornado.ioloop.IOLoop.current().run_sync(serve)
+    finally:
+        dedup.close()
+        event_store.close()
+        if read_cache is not None:
+            read_cache.close()
+
+
+def listener_metrics(workers):
+    metrics = server_metrics(workers)
+    metrics.counter('webhook_events_total', 'Events received, by event name', 'event_name',
+                    capacity=options.metrics_event_names)
+    return metrics.allocate()
+
+
+def main():
+    tornado.options.parse_command_line()
+    if options.dedup_entries < 1 or options.dedup_shards < 1:
+        # rather than have every worker fail to start
+        raise SystemExit('--dedup_entries and --dedup_shards must be at least 1')
+    # shared by the workers, so allocated before forking them
+    metrics = listener_metrics(options.workers)
+    if options.workers > 1:
+        stats = prefork.supervise(options.workers, functools.partial(run_worker, metrics=metrics), tornado_logger)
+        tornado_logger.info('Events handled per worker: %s', {w['worker']: w['events'] for w in stats['workers']})
+    else:
+        stats = prefork.WorkerStats(1)
+        slot = stats.slot(0)
+        slot['pid'] = os.getpid()
+        slot['started'] = time.time_ns()
+        run_worker(0, stats, metrics)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,241 @@
+"""
+The parts of erc20/bulk.py that the eth_sign CLI uses: reading and writing record files, checkpoints and
+bounded concurrency. Keep them in sync with erc20/bulk.py.
+"""
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+
+from ethvigil_async_client import connect_failed
+
+
+def input_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'ndjson' if os.path.splitext(path)[1].lower() in ('.ndjson', '.jsonl') else 'csv'
+
+
+def iter_records(path, fields, fmt=None):
+    """
+    Streams (row number, record) pairs from a CSV or NDJSON file without reading it into memory.
+
+    CSV rows are mapped positionally onto `fields`; a first row that matches the field names is treated as a header
+    and skipped. NDJSON lines must be objects holding the keys in `fields`.
+    Row numbers count data rows from 1 and are stable across runs over the same file.
+    """
+    fmt = input_format(path, fmt)
+    row_number = 0
+    with open(path, 'r', newline='') as f:
+        if fmt == 'ndjson':
+            for line in f:
+                if not line.strip():
+                    continue
+                row_number += 1
+                record = json.loads(line)
+                try:
+                    yield row_number, {field: record[field] for field in fields}
+                except KeyError as e:
+                    raise ValueError(f'Row {row_number} of {path} has no {e.args[0]!r} key') from None
+        else:
+            for i, row in enumerate(csv.reader(f)):
+                row = [col.strip() for col in row]
+                if not row or not any(row):
+                    continue
+                if i == 0 and [col.lower() for col in row[:len(fields)]] == [field.lower() for field in fields]:
+                    continue
+                row_number += 1
+                if len(row) < len(fields):
+                    raise ValueError(f'Row {row_number} of {path} has fewer than {len(fields)} columns: {row}')
+                yield row_number, dict(zip(fields, row))
+
+
+class RecordWriter(object):
+    """
+    Writes records to a CSV or NDJSON file (or stdout for '-') as they are produced, flushing every `flush_every` records
+    """
+    def __init__(self, path, fields, fmt=None, flush_every=1000):
+        self.path = path
+        self.fields = fields
+        self.fmt = input_format(path, fmt) if path != '-' else (fmt or 'csv')
+        self.flush_every = flush_every
+        self._count = 0
+        self._f = sys.stdout if path == '-' else open(path, 'w', newline='')
+        if self.fmt == 'csv':
+            self._csv = csv.writer(self._f)
+            self._csv.writerow(fields)
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            self._csv.writerow([record.get(field, '') for field in self.fields])
+        else:
+            self._f.write(json.dumps({field: record.get(field) for field in self.fields}) + '\n')
+        self._count += 1
+        if self._count % self.flush_every == 0:
+            self._f.flush()
+
+    def close(self):
+        self._f.flush()
+        if self._f is not sys.stdout:
+            self._f.close()
+
+
+class Checkpoint(object):
+    """
+    Append-only NDJSON journal of per-row outcomes of a bulk run, used to resume it after a crash.
+
+    A row is journaled as `pending` before its request is sent and gets a final state once the outcome is known:
+    `done` (accepted by the API), `failed` (rejected by the API, or the request never reached it: nothing was sent to
+    the chain, safe to retry) or `unknown` (timeout, dropped connection or server error: the transaction may or may
+    not have been sent).
+    On resume, `done` rows are skipped, and so are `pending` and `unknown` rows unless `retry_unknown` is set,
+    since resending them could submit the same transaction twice.
+    Lines are written through to the OS right away, so they survive a crash of the process; they are fsync()-ed
+    every `fsync_every` lines and on close.
+    """
+    def __init__(self, path, retry_unknown=False, fsync_every=100):
+        self.path = path
+        self.retry_unknown = retry_unknown
+        self.fsync_every = fsync_every
+        self.states = dict()
+        self.identities = dict()
+        if os.path.exists(path):
+            self._load()
+        self._f = open(path, 'a')
+        self._unsynced = 0
+
+    def _load(self):
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a torn last line from a crash
+                    continue
+                self.states[entry['row']] = entry['state']
+                if 'id' in entry:
+                    self.identities[entry['row']] = entry['id']
+
+    def should_skip(self, row_number, identity):
+        """
+        Whether a row was already handled by a previous run. Raises ValueError if the row does not match
+        what was journaled for it, i.e. the input file changed between runs.
+        """
+        state = self.states.get(row_number)
+        if state is None:
+            return False
+        if self.identities.get(row_number, identity) != identity:
+            raise ValueError(f'Row {row_number} differs from the checkpointed run: {identity!r} vs '
+                             f'{self.identities[row_number]!r}. Use a fresh checkpoint for a different input file.')
+        if state == 'done':
+            return True
+        if state in ('pending', 'unknown'):
+            return not self.retry_unknown
+        return False
+
+    def _append(self, entry):
+        self._f.write(json.dumps(entry) + '\n')
+        self._f.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            os.fsync(self._f.fileno())
+            self._unsynced = 0
+
+    def mark_pending(self, row_number, identity):
+        self.states[row_number] = 'pending'
+        self._append({'row': row_number, 'state': 'pending', 'id': identity})
+
+    def mark(self, row_number, state, **details):
+        self.states[row_number] = state
+        self._append(dict(row=row_number, state=state, **details))
+
+    def counts(self):
+        counts = dict()
+        for state in self.states.values():
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    def close(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+
+
+def outcome(response):
+    """
+    Checkpoint state and details for the response to a transaction sent to a contract method
+    """
+    try:
+        rj = response.json()
+    except ValueError:
+        rj = None
+    if response.status_code == 200 and rj and rj.get('success'):
+        data = rj.get('data')
+        tx_hash = data[0].get('txHash') if isinstance(data, list) and data and isinstance(data[0], dict) else None
+        return 'done', {'txHash': tx_hash}
+    state = 'failed' if 400 <= response.status_code < 500 else 'unknown'
+    return state, {'status_code': response.status_code, 'response': rj if rj is not None else response.text[:500]}
+
+
+def error_outcome(error):
+    """
+    Checkpoint state and details for a transaction whose request raised `error`: failed if it never reached the API,
+    so that a rerun sends it again, unknown otherwise, e.g. after a timeout
+    """
+    return 'failed' if connect_failed(error) else 'unknown', {'error': repr(error)}
+
+
+async def run_bounded(items, worker, concurrency):
+    """
+    Runs `await worker(item)` for every item of a (possibly lazy) iterable with at most `concurrency` workers at once.
+    Items are pulled from the iterable only as workers free up, so memory stays flat however long the input is.
+    Returns the number of items processed; the first worker exception is raised after in-flight workers finish.
+    """
+    in_flight = set()
+    processed = 0
+    errors = list()
+    try:
+        for item in items:
+            if len(in_flight) >= concurrency:
+                finished, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                errors.extend(task.exception() for task in finished if task.exception())
+                if errors:
+                    break
+            in_flight.add(asyncio.ensure_future(worker(item)))
+            processed += 1
+    finally:
+        # also reached when the input iterable raises: let the requests already sent complete
+        if in_flight:
+            finished, _ = await asyncio.wait(in_flight)
+            errors.extend(task.exception() for task in finished if task.exception())
+    if errors:
+        raise errors[0]
+    return processed
+
+
+class Progress(object):
+    """
+    Prints a progress line with throughput every `every` items
+    """
+    def __init__(self, echo, label, every=1000):
+        self.echo = echo
+        self.label = label
+        self.every = every
+        self.count = 0
+        self.start = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.count / elapsed if elapsed else 0.0
+
+    def update(self, n=1):
+        self.count += n
+        if self.count % self.every == 0:
+            self.echo(f'{self.label}: {self.count} | {self.rate:.1f}/sec')
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        return f'{self.label}: {self.count} in {elapsed:.1f}s | {self.rate:.1f}/sec'
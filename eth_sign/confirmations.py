@@ -0,0 +1,218 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import os
+
+
+CONFIRMATION_TYPES = ['uint256', 'address']
+# eth_sign prefix of a 32 byte message, as defunct_hash_message() adds it
+MESSAGE_PREFIX = b'\x19Ethereum Signed Message:\n32'
+SECP256K1_N = 0xfffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141
+ZERO_ADDRESS = '0x' + '0' * 40
+
+
+def parse_range(value):
+    """
+    `START:END` -> range of unique IDs, END excluded
+    """
+    try:
+        start, end = (int(bound) for bound in value.split(':'))
+    except ValueError:
+        raise ValueError(f'Expected a range of unique IDs like 1:1000, got {value!r}') from None
+    if not 0 <= start <= end:
+        raise ValueError(f'Invalid range of unique IDs {value!r}')
+    return range(start, end)
+
+
+def iter_chunks(items, size):
+    chunk = list()
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = list()
+    if chunk:
+        yield chunk
+
+
+def sign_confirmations(rows, contract, private_key):
+    """
+    [(row number, unique ID, signature)] of a chunk of (row number, unique ID) rows, signed as sign_confirmation()
+    signs them. Runs in the worker processes of sign_in_pool(), so the key is parsed once per chunk rather than once
+    per ID.
+    """
+    from eth_keys import keys
+    from eth_utils import decode_hex
+    from eth_sign_cli import solidityKeccakBatch
+    key = keys.PrivateKey(decode_hex(private_key))
+    row_numbers = [row_number for row_number, _ in rows]
+    unique_ids = [int(unique_id) for _, unique_id in rows]
+    hashes = solidityKeccakBatch((CONFIRMATION_TYPES, [unique_id, contract]) for unique_id in unique_ids)
+    message_hashes = solidityKeccakBatch((['bytes28', 'bytes32'], [MESSAGE_PREFIX, h]) for h in hashes)
+    signed = list()
+    for row_number, unique_id, message_hash in zip(row_numbers, unique_ids, message_hashes):
+        signature = key.sign_msg_hash(message_hash)
+        sig = signature.r.to_bytes(32, 'big') + signature.s.to_bytes(32, 'big') + bytes([signature.v + 27])
+        signed.append((row_number, unique_id, '0x' + sig.hex()))
+    return signed
+
+
+async def map_chunks(func, items, *args, workers=None, chunk_size=1000, pool=None):
+    """
+    Runs `func(chunk, *args)` on chunks of `items` across a pool of `workers` processes, and yields the results in input
+    order. At most two chunks per worker are queued in the pool, so the items are read only as fast as they are
+    processed and consumed. Runs on `pool` if given, on a pool of its own otherwise.
+    """
+    loop = asyncio.get_running_loop()
+    workers = workers or os.cpu_count() or 1
+    with contextlib.ExitStack() as stack:
+        if pool is None:
+            pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(workers))
+        ahead = 2 * workers
+        pending = collections.deque()
+        try:
+            for chunk in iter_chunks(items, chunk_size):
+                pending.append(loop.run_in_executor(pool, func, chunk, *args))
+                if len(pending) >= ahead:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def sign_in_pool(rows, contract, private_key, workers=None, chunk_size=1000):
+    """
+    Signs the unique IDs of (row number, unique ID) rows across a pool of `workers` processes, and yields the signed
+    chunks in input order
+    """
+    return map_chunks(sign_confirmations, rows, contract, private_key, workers=workers, chunk_size=chunk_size)
+
+
+def _hash_rows(rows):
+    """
+    solidityKeccakBatch() of the rows, with None for the rows that cannot be encoded rather than failing them all
+    """
+    from eth_sign_cli import solidityKeccak, solidityKeccakBatch
+    try:
+        return solidityKeccakBatch(rows)
+    except Exception:
+        # eth_abi's EncodingError, or a ValueError or TypeError: hash the rows one by one to find the ones at fault
+        pass
+    hashes = list()
+    for abi_types, values in rows:
+        try:
+            hashes.append(solidityKeccak(abi_types, values))
+        except Exception:
+            hashes.append(None)
+    return hashes
+
+
+def recover_signers(confirmations):
+    """
+    Signer of each (unique ID, contract, signature) confirmation, recovered exactly as submitConfirmation() in
+    SignerTesting.sol recovers it: the zero address where ecrecover() fails, e.g. for a `v` other than 27 or 28,
+    and None where the transaction would revert because the signature is not 65 bytes long, or could not be sent
+    because the unique ID, contract or signature is malformed, e.g. a mixed-case contract address with a bad checksum.
+    """
+    from eth_keys import keys
+    from eth_keys.exceptions import BadSignature, ValidationError
+    from eth_utils import is_address
+    rows, signatures = list(), list()
+    for unique_id, contract, sig in confirmations:
+        try:
+            signature = bytes.fromhex(sig[2:] if sig[:2] in ('0x', '0X') else sig)
+            unique_id = int(unique_id)
+            if not 0 <= unique_id < 2 ** 256 or not isinstance(contract, str) or not is_address(contract):
+                raise ValueError(contract)
+            rows.append((CONFIRMATION_TYPES, [unique_id, contract]))
+        except (TypeError, ValueError):
+            signature = None
+            rows.append((CONFIRMATION_TYPES, [0, ZERO_ADDRESS]))
+        signatures.append(signature)
+    hashes = _hash_rows(rows)
+    message_hashes = _hash_rows([(['bytes28', 'bytes32'], [MESSAGE_PREFIX, h if h is not None else bytes(32)])
+                                 for h in hashes])
+    signers = list()
+    for signature, row_hash, message_hash in zip(signatures, hashes, message_hashes):
+        if signature is None or row_hash is None or len(signature) != 65:
+            signers.append(None)
+            continue
+        r, s, v = int.from_bytes(signature[:32], 'big'), int.from_bytes(signature[32:64], 'big'), signature[64]
+        # the ecrecover precompile's checks; unlike transaction signatures, high `s` values are accepted
+        if v not in (27, 28) or not 0 < r < SECP256K1_N or not 0 < s < SECP256K1_N:
+            signers.append(ZERO_ADDRESS)
+            continue
+        try:
+            public_key = keys.Signature(vrs=(v - 27, r, s)).recover_public_key_from_msg_hash(message_hash)
+        except (BadSignature, ValidationError):
+            signers.append(ZERO_ADDRESS)
+            continue
+        signers.append(public_key.to_checksum_address())
+    return signers
+
+
+class SignerCache(object):
+    """
+    LRU cache of the signers recovered from confirmations, keyed by unique ID, contract and signature
+    """
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._signers = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f'SignerCache(entries={len(self._signers)}, max_entries={self.max_entries})'
+
+    @staticmethod
+    def key(unique_id, contract, sig):
+        return str(unique_id), str(contract).lower(), str(sig).lower()
+
+    def get(self, key, default=None):
+        try:
+            self._signers.move_to_end(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self._signers[key]
+
+    def put(self, key, signer):
+        self._signers[key] = signer
+        self._signers.move_to_end(key)
+        if len(self._signers) > self.max_entries:
+            self._signers.popitem(last=False)
+
+    def stats(self):
+        return {'entries': len(self._signers), 'max_entries': self.max_entries, 'hits': self.hits,
+                'misses': self.misses}
+
+
+_MISSING = object()
+
+
+async def verify_confirmations(confirmations, cache, workers=None, chunk_size=1000, pool=None):
+    """
+    Signers of a batch of (unique ID, contract, signature) confirmations, as recover_signers() returns them.
+    Confirmations found in the cache are answered from it, the others are recovered across a pool of `workers`
+    processes and cached. With `workers=0` they are recovered in this process.
+    """
+    keys = [cache.key(*confirmation) for confirmation in confirmations]
+    signers = [cache.get(key, _MISSING) for key in keys]
+    missing = [i for i, signer in enumerate(signers) if signer is _MISSING]
+    if not missing:
+        return signers
+    if workers == 0:
+        recovered = recover_signers([confirmations[i] for i in missing])
+    else:
+        recovered = list()
+        async for chunk in map_chunks(recover_signers, (confirmations[i] for i in missing), workers=workers,
+                                      chunk_size=chunk_size, pool=pool):
+            recovered.extend(chunk)
+    for i, signer in zip(missing, recovered):
+        signers[i] = signer
+        cache.put(keys[i], signer)
+    return signers
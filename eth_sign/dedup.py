@@ -0,0 +1,197 @@
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import os
+import sqlite3
+import time
+
+
+DEFAULT_MAX_ENTRIES = 200000
+DEFAULT_TTL = 3 * 24 * 3600
+
+
+def dedup_key(payload):
+    """
+    Identity of a payload delivered by an EthVigil webhook: transaction hash and log index for events,
+    transaction hash for transactions, the EthVigil event id otherwise. None if it has none of these.
+    """
+    tx_hash = payload.get('txHash')
+    if tx_hash:
+        log_index = payload.get('logIndex')
+        return tx_hash.lower() if log_index is None else f'{tx_hash.lower()}:{log_index}'
+    event_id = payload.get('ethvigil_event_id')
+    return f'ethvigil:{event_id}' if event_id is not None else None
+
+
+class DedupIndex(object):
+    """
+    Remembers which webhook payloads were already received, to drop redeliveries.
+
+    Keys are kept as 16 byte digests in an LRU ordered dict capped at `max_entries`, and expire `ttl` seconds after
+    they were last seen. With a `path`, they are also recorded in SQLite (WAL mode), which survives restarts and is
+    shared by the workers of a pre-forked listener. Keys are spread by digest over `shards` databases, named
+    `<name>-<n><ext>` after `path` if more than one, so that workers claiming different keys seldom wait for each
+    other's write lock. The databases are only used from a thread of their own: claims made while it writes are
+    committed together by its next transaction. Expired keys are purged every `purge_every` claims.
+    Must be used from a single event loop.
+    """
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, purge_every=10000, shards=1):
+        if max_entries < 1:
+            raise ValueError(f'max_entries must be at least 1, not {max_entries}')
+        if shards < 1:
+            raise ValueError(f'shards must be at least 1, not {shards}')
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._seen = collections.OrderedDict()
+        self._claims = 0
+        self._pending = list()
+        self._writer = None
+        self._executor = None
+        self._conns = list()
+        self.paths = list()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            name, ext = os.path.splitext(path)
+            self.paths = [path] if shards == 1 else [f'{name}-{n}{ext}' for n in range(shards)]
+            # sqlite3 connections may only be used from the thread that opened them
+            self._executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='dedup')
+            self._executor.submit(self._connect).result()
+
+    def __repr__(self):
+        return f'DedupIndex({self.path!r}, entries={len(self._seen)}, ttl={self.ttl}, shards={len(self.paths) or 1})'
+
+    def __len__(self):
+        return len(self._seen)
+
+    @staticmethod
+    def digest(key):
+        return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+    def _connect(self):
+        for path in self.paths:
+            conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS seen (digest BLOB PRIMARY KEY, seen_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS seen_seen_at ON seen (seen_at)')
+            self._conns.append(conn)
+
+    def _shard(self, digest):
+        return int.from_bytes(digest[:4], 'big') % len(self._conns)
+
+    async def claim(self, key):
+        """
+        Records `key` and returns True, or returns False if it was recorded within the last `ttl` seconds, by this or
+        another worker, i.e. the payload is a redelivery. Of concurrent claims of a key, exactly one returns True.
+        """
+        digest = self.digest(key)
+        now = time.time()
+        seen_at = self._seen.get(digest)
+        if seen_at is not None:
+            if seen_at > now - self.ttl:
+                self._seen[digest] = now
+                self._seen.move_to_end(digest)
+                return False
+            del self._seen[digest]
+        if self._executor is None:
+            self._remember(digest, now)
+            return True
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((digest, now, future))
+        if self._writer is None or self._writer.done():
+            self._writer = loop.create_task(self._write_loop())
+        # remembered either way: claimed now, or by a concurrent delivery
+        claimed = await future
+        self._remember(digest, now)
+        return claimed
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            pending, self._pending = self._pending, list()
+            try:
+                claimed = await loop.run_in_executor(self._executor, self._claim_all,
+                                                     [(digest, now) for digest, now, _ in pending])
+            except Exception as e:
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, _, future), result in zip(pending, claimed):
+                    if not future.done():
+                        future.set_result(result)
+
+    def _claim_all(self, claims):
+        """
+        Whether each (digest, time) claim was recorded, i.e. its digest was not recorded within the last `ttl` seconds.
+        One transaction per shard, which holds the shard's write lock for the few microseconds of its upserts.
+        """
+        by_shard = collections.defaultdict(list)
+        for i, (digest, _) in enumerate(claims):
+            by_shard[self._shard(digest)].append(i)
+        claimed = [False] * len(claims)
+        for shard, indices in by_shard.items():
+            conn = self._conns[shard]
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for i in indices:
+                    digest, now = claims[i]
+                    # inserts new keys and takes over expired ones, a single statement so that no other worker can
+                    # record the key in between; leaves unexpired keys alone, which counts no rows
+                    cursor = conn.execute('INSERT INTO seen (digest, seen_at) VALUES (?, ?) ON CONFLICT (digest) '
+                                          'DO UPDATE SET seen_at = excluded.seen_at WHERE seen.seen_at <= ?',
+                                          (digest, now, now - self.ttl))
+                    claimed[i] = cursor.rowcount == 1
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        self._claims += len(claims)
+        if self._claims >= self.purge_every:
+            self._claims = 0
+            expired = time.time() - self.ttl
+            for conn in self._conns:
+                conn.execute('DELETE FROM seen WHERE seen_at <= ?', (expired,))
+        return claimed
+
+    async def discard(self, key):
+        """
+        Forgets `key`, e.g. when the payload it was claimed for could not be stored, so that a redelivery is accepted
+        """
+        digest = self.digest(key)
+        self._seen.pop(digest, None)
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._delete, digest)
+
+    def _delete(self, digest):
+        self._conns[self._shard(digest)].execute('DELETE FROM seen WHERE digest = ?', (digest,))
+
+    def _remember(self, digest, now):
+        self._seen[digest] = now
+        self._seen.move_to_end(digest)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        # drop expired keys from the least recently seen end, a few at a time
+        for _ in range(2):
+            # empty once the key just remembered expired as well, with a ttl of 0 or less
+            if not self._seen:
+                break
+            oldest = next(iter(self._seen))
+            if self._seen[oldest] > now - self.ttl:
+                break
+            del self._seen[oldest]
+
+    def _close(self):
+        for conn in self._conns:
+            conn.close()
+        self._conns = list()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.submit(self._close).result()
+            self._executor.shutdown()
+            self._executor = None
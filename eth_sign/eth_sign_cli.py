@@ -1,12 +1,7 @@
 import click
-import requests
-from eth_account.messages import defunct_hash_message
-from eth_account.account import Account
-from eth_abi import is_encodable
-from eth_abi.packed import encode_abi_packed, encode_single_packed
+import functools
 import json
-from dynaconf import settings
-import eth_utils
+import re
 
 
 CONTEXT_SETTINGS = dict(
@@ -14,6 +9,127 @@ CONTEXT_SETTINGS = dict(
 )
 
 
+@functools.lru_cache(maxsize=None)
+def _keccak256():
+    """
+    keccak256 of bytes or a bytearray. pysha3's, if installed, is several times faster than
+    eth_hash with its default pycryptodome backend.
+    """
+    try:
+        from sha3 import keccak_256
+    except ImportError:
+        from eth_hash.auto import keccak
+        return keccak
+    return lambda data: keccak_256(data).digest()
+
+
+_HEX_ADDRESS = re.compile(r'0x[0-9a-fA-F]{40}')
+
+
+@functools.lru_cache(maxsize=4096)
+def _checksum_matches(address):
+    """
+    False for a mixed-case hex address whose case is not its EIP-55 checksum
+    """
+    hex_digits = address[2:]
+    if hex_digits == hex_digits.lower() or hex_digits == hex_digits.upper():
+        return True
+    from eth_utils import is_checksum_address
+    return is_checksum_address(address)
+
+
+def _eth_abi_packed(abi_type, value):
+    # eth_abi accepts or rejects the values the fast encoders do not take, exactly as solidityPack always did
+    from eth_abi.packed import encode_single_packed
+    return encode_single_packed(abi_type, value)
+
+
+def _packed_encoder(abi_type):
+    """
+    (size, encode) of a fixed size ABI type, encode returning the value packed as Solidity's abi.encodePacked does.
+    None for the other types, which are left to eth_abi. The encoders only take the usual values themselves: ints
+    in range (not bools), 0x-prefixed hex addresses with a valid checksum if mixed-case, bytes and bools.
+    Anything else is handed to eth_abi, which packs or rejects it.
+    """
+    match = re.fullmatch(r'(uint|int|bytes)(\d+)', abi_type)
+    if match:
+        kind, bits = match.group(1), int(match.group(2))
+        # invalid sizes like uint7 or bytes33 are left to eth_abi to reject
+        if kind == 'bytes' and not 1 <= bits <= 32 or kind != 'bytes' and (bits % 8 or not 8 <= bits <= 256):
+            return None
+        if kind == 'bytes':
+            size = bits
+
+            def encode(value):
+                if isinstance(value, (bytes, bytearray)) and len(value) <= size:
+                    return bytes(value).ljust(size, b'\x00')
+                return _eth_abi_packed(abi_type, value)
+            return size, encode
+        size, signed = bits // 8, kind == 'int'
+
+        def encode(value):
+            # not isinstance(), which bools pass
+            if type(value) is int:
+                try:
+                    return value.to_bytes(size, 'big', signed=signed)
+                except OverflowError:
+                    pass
+            return _eth_abi_packed(abi_type, value)
+        return size, encode
+    if abi_type == 'address':
+        def encode(value):
+            if isinstance(value, str) and _HEX_ADDRESS.fullmatch(value) and _checksum_matches(value):
+                return bytes.fromhex(value[2:])
+            if isinstance(value, (bytes, bytearray)) and len(value) == 20:
+                return bytes(value)
+            return _eth_abi_packed(abi_type, value)
+        return 20, encode
+    if abi_type == 'bool':
+        def encode(value):
+            if type(value) is bool:
+                return b'\x01' if value else b'\x00'
+            return _eth_abi_packed(abi_type, value)
+        return 1, encode
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _packed_layout(abi_types):
+    """
+    [(start, end, encode)] of each value of a row of `abi_types` in its packed encoding, and the size of the row.
+    None if any of the types has no fixed size.
+    """
+    layout, offset = list(), 0
+    for abi_type in abi_types:
+        encoder = _packed_encoder(abi_type)
+        if encoder is None:
+            return None
+        size, encode = encoder
+        layout.append((offset, offset + size, encode))
+        offset += size
+    return layout, offset
+
+
+def _check_encodable(abi_types, values):
+    from eth_abi import is_encodable
+    for t, v in zip(abi_types, values):
+        if not is_encodable(t, v):
+            print(f'Value {v} is not encodable for ABI type {t}')
+            return False
+    return True
+
+
+def solidityPack(abi_types, values):
+    """
+    abi.encodePacked(values) as bytes
+    """
+    layout = _packed_layout(tuple(abi_types))
+    if layout is not None:
+        return b''.join(encode(value) for (_, _, encode), value in zip(layout[0], values))
+    from eth_abi.packed import encode_single_packed
+    return b''.join(encode_single_packed(abi_type, value) for abi_type, value in zip(abi_types, values))
+
+
 def solidityKeccak(abi_types, values, validity_check=False):
     """
     Executes keccak256 exactly as Solidity does.
@@ -27,46 +143,142 @@ def solidityKeccak(abi_types, values, validity_check=False):
             "Length mismatch between provided abi types and values.  Got "
             "{0} types and {1} values.".format(len(abi_types), len(values))
         )
-    if validity_check:
-        for t, v in zip(abi_types, values):
-            if not is_encodable(t, v):
-                print(f'Value {v} is not encodable for ABI type {t}')
-                return False
-    hex_string = eth_utils.add_0x_prefix(''.join(
-        encode_single_packed(abi_type, value).hex()
-        for abi_type, value
-        in zip(abi_types, values)
-    ))
-    # hex_string = encode_abi_packed(abi_types, values).hex()
-    return eth_utils.keccak(hexstr=hex_string)
+    if validity_check and not _check_encodable(abi_types, values):
+        return False
+    return _keccak256()(solidityPack(abi_types, values))
+
+
+def solidityKeccakBatch(rows, validity_check=False):
+    """
+    solidityKeccak of each (abi_types, values) row, e.g. `(['uint256', 'address'], [1, '0x...'])`, as a list.
+    Rows of fixed size types are packed into a buffer allocated once per row layout, instead of building
+    the packed bytes of every row anew. Consecutive rows sharing the same abi_types list share its layout lookup too.
+    """
+    keccak = _keccak256()
+    buffers = dict()
+    hashes = list()
+    last_types, layout, buffer = None, None, None
+    for abi_types, values in rows:
+        if abi_types is not last_types:
+            last_types, abi_types = abi_types, tuple(abi_types)
+            layout = _packed_layout(abi_types)
+            if layout is not None:
+                buffer = buffers.setdefault(abi_types, bytearray(layout[1]))
+        if len(last_types) != len(values):
+            raise ValueError(
+                "Length mismatch between provided abi types and values.  Got "
+                "{0} types and {1} values.".format(len(last_types), len(values))
+            )
+        if validity_check and not _check_encodable(last_types, values):
+            hashes.append(False)
+        elif layout is None:
+            hashes.append(keccak(solidityPack(last_types, values)))
+        else:
+            for (start, end, encode), value in zip(layout[0], values):
+                buffer[start:end] = encode(value)
+            hashes.append(keccak(buffer))
+    return hashes
+
+
+class ContextObject(dict):
+    """
+    Context object handed to every command.
+
+    Settings are read from settings.json, and the API key obtained from the session cache or /login,
+    only when a command first looks them up, so commands pay only for what they actually use.
+    """
+    settings_keys = {
+        'private_key': 'privatekey',
+        'contract_address': 'contractAddress',
+        'internal_api_endpoint': 'INTERNAL_API_ENDPOINT',
+        'rest_api_endpoint': 'REST_API_ENDPOINT'
+    }
+
+    def load_settings(self):
+        from profiling import span
+        with span('load settings.json', 'settings'):
+            from dynaconf import settings
+            from session_cache import SessionCache
+            for key, setting in self.settings_keys.items():
+                self[key] = settings[setting]
+            self['session_cache'] = SessionCache(ttl=settings.get('SESSION_CACHE_TTL', 12 * 3600))
+        if self['contract_address'] == "" or not self['contract_address']:
+            click.echo("Contract address was not supplied in configuration")
+
+    def __missing__(self, key):
+        if key in self.settings_keys or key == 'session_cache':
+            self.load_settings()
+        elif key == 'client':
+            from dynaconf import settings
+            from ethvigil_client import EthVigilClient
+            self['client'] = EthVigilClient(self['rest_api_endpoint'], self['internal_api_endpoint'],
+                                            gzip_deploys=settings.get('GZIP_DEPLOYS', False))
+        elif key == 'api_key':
+            from profiling import span
+            from session_cache import get_api_key
+            with span('get API key', 'login'):
+                self['api_key'] = get_api_key(self['internal_api_endpoint'], self['private_key'],
+                                              functools.partial(ev_login, client=self['client']),
+                                              cache=self['session_cache'])
+        else:
+            raise KeyError(key)
+        return self[key]
 
 
 @click.group(context_settings=CONTEXT_SETTINGS)
+@click.option('--profile', is_flag=True, help='Print the time the command spent on imports, settings, login, signing, '
+                                               'HTTP calls and JSON parsing')
+@click.option('--profile-dump', type=click.Path(dir_okay=False),
+              help='Profile the command with cProfile as well and write the stats to this file')
+@click.option('--profile-trace', type=click.Path(dir_okay=False),
+              help='Write the timed spans to this file in the Trace Event Format, for chrome://tracing or Perfetto')
 @click.pass_context
-def cli(ctx):
-    private_key = settings['privatekey']
-    api_endpoint = settings['INTERNAL_API_ENDPOINT']
-    rest_api_endpoint = settings['REST_API_ENDPOINT']
-    api_key = ev_login(api_endpoint, private_key)
-    contract_addr = settings['contractAddress']
-    if contract_addr == "" or not contract_addr:
-        click.echo("Contract address was not supplied in configuration")
-    ctx.obj = {
-        'api_key': api_key,
-        'private_key': private_key,
-        'contract_address': contract_addr,
-        'internal_api_endpoint': api_endpoint,
-        'rest_api_endpoint': rest_api_endpoint
-    }
+def cli(ctx, profile, profile_dump, profile_trace):
+    ctx.obj = ContextObject()
+    if profile or profile_dump or profile_trace:
+        start_profiling(ctx, profile_dump, profile_trace)
+
+
+def start_profiling(ctx, dump_path=None, trace_path=None):
+    """
+    Times the phases of the command about to run and prints their breakdown to stderr once it is done
+    """
+    import cProfile
+    import profiling
+    profiler = profiling.start()
+    if dump_path:
+        c_profiler = cProfile.Profile()
+        c_profiler.enable()
+
+    def report():
+        if dump_path:
+            c_profiler.disable()
+            c_profiler.dump_stats(dump_path)
+        profiler.stop()
+        for line in profiler.breakdown(ctx.invoked_subcommand or ctx.info_name):
+            click.echo(line, err=True)
+        if trace_path:
+            profiler.write_trace(trace_path)
+            click.echo(f'Trace written to {trace_path}', err=True)
+        if dump_path:
+            click.echo(f'cProfile stats written to {dump_path}', err=True)
+
+    ctx.call_on_close(report)
 
 
-def ev_login(api_endpoint, private_key):
+def ev_login(api_endpoint, private_key, client=None):
+    import requests
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
+    from ethvigil_client import EthVigilClient
+    from profiling import span
+    client = client or EthVigilClient(internal_api_endpoint=api_endpoint)
     msg = "Trying to login"
-    message_hash = defunct_hash_message(text=msg)
-    signed_msg = Account.signHash(message_hash, private_key)
+    with span('sign login message', 'sign'):
+        message_hash = defunct_hash_message(text=msg)
+        signed_msg = Account.signHash(message_hash, private_key)
     # --ethvigil API CALL---
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
-    r = requests.post(api_endpoint + '/login', json={'msg': msg, 'sig': signed_msg.signature.hex()}, headers=headers)
+    r = client.login(msg, signed_msg.signature.hex())
     if r.status_code == requests.codes.ok:
         r = r.json()
         return r['data']['key']
@@ -74,9 +286,52 @@ def ev_login(api_endpoint, private_key):
         return None
 
 
+def ev_request(ctx_obj, method, url, method_args=None, key_field=None):
+    """
+    Sends an API request authenticated with the cached API key, either as the X-API-KEY header
+    or as the `key_field` of the JSON body.
+    If the API rejects the key, logs in again once and retries with the fresh key.
+    """
+    import requests
+    from session_cache import get_api_key
+    r = None
+    for refresh in (False, True):
+        if refresh:
+            ctx_obj['api_key'] = get_api_key(ctx_obj['internal_api_endpoint'], ctx_obj['private_key'],
+                                             functools.partial(ev_login, client=ctx_obj['client']),
+                                             refresh=True, cache=ctx_obj['session_cache'])
+        if key_field:
+            method_args[key_field] = ctx_obj['api_key']
+            r = ctx_obj['client'].request(method, url, json=method_args)
+        else:
+            r = ctx_obj['client'].request(method, url, json=method_args, api_key=ctx_obj['api_key'])
+        if r.status_code not in (requests.codes.unauthorized, requests.codes.forbidden):
+            break
+    return r
+
+
+async def ev_call_async(ctx_obj, client_method, *args):
+    """
+    Counterpart of ev_request for AsyncEthVigilClient methods: if the API rejects the key, logs in again once
+    and retries with the fresh key. Concurrent calls rejected with the same key trigger a single login.
+    """
+    from session_cache import get_api_key
+    api_key = ctx_obj['api_key']
+    r = await client_method(*args, api_key=api_key)
+    if r.status_code in (401, 403):
+        if ctx_obj['api_key'] == api_key:
+            # blocks the event loop, but at most once per rejected key
+            ctx_obj['api_key'] = get_api_key(ctx_obj['internal_api_endpoint'], ctx_obj['private_key'],
+                                             functools.partial(ev_login, client=ctx_obj['client']),
+                                             refresh=True, cache=ctx_obj['session_cache'])
+        r = await client_method(*args, api_key=ctx_obj['api_key'])
+    return r
+
+
 @cli.command()
+@click.option('--force', is_flag=True, help='Deploy even if the same contract was deployed before')
 @click.pass_obj
-def deploy(ctx_obj):
+def deploy(ctx_obj, force):
     """
     Deploys a new instance of ERC20Mintable.sol on EthVigil.
     When prompted, enter a JSON-compatible list of constructor inputs to be passed on to the ERC20Mintable contract.
@@ -85,7 +340,13 @@ def deploy(ctx_obj):
     NOTE: Enter double quoted strings. Single quoted strings are not supported as JSON serialized.
 
     Check deploy.py for a code example
+
+    A deploy of the same source with the same constructor inputs, endpoint and account as an earlier successful one
+    is not sent again: the known results are shown instead, unless --force is passed.
     """
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
+    from deploy_registry import deploy_once
     msg = "Trying to deploy"
     message_hash = defunct_hash_message(text=msg)
     private_key = ctx_obj['private_key']
@@ -107,10 +368,11 @@ def deploy(ctx_obj):
         'inputs': [],
         'code': contract_code
     }
-    # API call to deploy
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
-    r = requests.post(ctx_obj['internal_api_endpoint']+'/deploy', json=deploy_params, headers=headers)
-    rj = r.json()
+    # API call to deploy, unless this exact deploy succeeded before
+    rj, known = deploy_once(ctx_obj['client'], deploy_params, Account.from_key(private_key).address, force=force)
+    if known:
+        click.echo('This contract was already deployed with the same source and constructor inputs. '
+                   'Pass --force to deploy another instance.')
     click.echo('Deployed contract results')
     click.echo(rj)
     if rj['success']:
@@ -122,7 +384,7 @@ def deploy(ctx_obj):
 @click.argument('privatekey', required=True)
 @click.pass_obj
 def submitConfirmation(ctx_obj, uniqueid, privatekey):
-    api_key = ctx_obj['api_key']
+    import eth_utils
     private_key = privatekey
     contract = ctx_obj['contract_address']
     contract = eth_utils.to_checksum_address(contract)
@@ -131,13 +393,14 @@ def submitConfirmation(ctx_obj, uniqueid, privatekey):
         'uniqueID': uniqueid,
         'sig': signed_specific_msg
     }
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'X-API-KEY': api_key}
-    method_api_endpoint = f'{ctx_obj["rest_api_endpoint"]}/contract/{ctx_obj["contract_address"]}/submitConfirmation'
-    r = requests.post(url=method_api_endpoint, json=method_args, headers=headers)
+    method_api_endpoint = ctx_obj['client'].contract_url(ctx_obj['contract_address'], 'submitConfirmation')
+    r = ev_request(ctx_obj, 'post', method_api_endpoint, method_args)
     print(r.text)
 
 
 def sign_confirmation(unique_id, contractaddr, private_key):
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
     print('Signing data with settlementid, contractaddr...')
     print(unique_id)
     print(contractaddr)
@@ -150,9 +413,227 @@ def sign_confirmation(unique_id, contractaddr, private_key):
 
 
 
+def confirmation_rows(id_range, ids, input_format):
+    """
+    (row number, unique ID) rows of a START:END range or of a CSV/NDJSON file of unique IDs
+    """
+    from bulk import iter_records
+    from confirmations import parse_range
+    if id_range:
+        return enumerate(parse_range(id_range), start=1)
+    return ((row_number, record['uniqueID']) for row_number, record in iter_records(ids, ['uniqueID'], input_format))
+
+
+def unique_id_options(f):
+    f = click.option('--format', 'input_format', type=click.Choice(['csv', 'ndjson']),
+                     help='Input format. Guessed from the file extension by default')(f)
+    f = click.option('--workers', type=int, help='Number of signing processes. Defaults to the number of cores')(f)
+    f = click.option('--ids', type=click.Path(exists=True, dir_okay=False),
+                     help='CSV or NDJSON file of unique IDs, one `uniqueID` per row')(f)
+    f = click.option('--range', 'id_range', help='Unique IDs START:END to sign, END excluded')(f)
+    return f
+
+
+@cli.command('sign-confirmations')
+@click.argument('privatekey', required=True)
+@unique_id_options
+@click.option('--output', '-o', default='-', show_default=True,
+              help='CSV or NDJSON file to write the signed confirmations to')
+@click.pass_obj
+def sign_confirmations(ctx_obj, privatekey, id_range, ids, workers, input_format, output):
+    """
+    Signs many unique IDs for submitConfirmation across a pool of processes, and writes `uniqueID,sig` rows
+    to submit later with `submit-confirmations --signed`.
+    """
+    import asyncio
+    import eth_utils
+    from bulk import Progress, RecordWriter
+    from confirmations import sign_in_pool
+    if bool(id_range) == bool(ids):
+        raise click.UsageError('Pass either --range or --ids')
+    contract = eth_utils.to_checksum_address(ctx_obj['contract_address'])
+    try:
+        rows = confirmation_rows(id_range, ids, input_format)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--range')
+    writer = RecordWriter(output, ['uniqueID', 'sig'])
+    progress = Progress(lambda line: click.echo(line, err=True), 'Signed', every=10000)
+
+    async def main():
+        async for chunk in sign_in_pool(rows, contract, privatekey, workers=workers):
+            for _, unique_id, sig in chunk:
+                writer.write({'uniqueID': unique_id, 'sig': sig})
+            progress.update(len(chunk))
+
+    try:
+        asyncio.run(main())
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        writer.close()
+    click.echo(progress.summary(), err=True)
+
+
+@cli.command('submit-confirmations')
+@click.argument('privatekey', required=False)
+@unique_id_options
+@click.option('--signed', type=click.Path(exists=True, dir_okay=False),
+              help='Submit the `uniqueID,sig` rows written by sign-confirmations instead of signing')
+@click.option('--checkpoint', help='Checkpoint file recording the outcome of every row. '
+                                   'Defaults to <input file>.checkpoint, or confirmations-START-END.checkpoint')
+@click.option('--concurrency', default=10, show_default=True,
+              help='Maximum number of submitConfirmation() calls in flight')
+@click.option('--retry-unknown', is_flag=True, help='Also resend rows whose outcome was not known when a previous '
+                                                    'run stopped. These may already have been confirmed.')
+@click.pass_obj
+def submit_confirmations(ctx_obj, privatekey, id_range, ids, workers, input_format, signed, checkpoint, concurrency,
+                         retry_unknown):
+    """
+    Calls submitConfirmation for many unique IDs, signing them with <privatekey> across a pool of processes
+    while the signed ones are submitted, up to --concurrency calls at a time.
+
+    The outcome of every row is recorded in the checkpoint file. Run the same command again to resume
+    an interrupted run: rows already confirmed are skipped and not signed again.
+    """
+    import asyncio
+    import eth_utils
+    from bulk import Checkpoint, Progress, error_outcome, iter_records, outcome, run_bounded
+    from confirmations import parse_range, sign_in_pool
+    from ethvigil_async_client import AsyncEthVigilClient
+    if sum(bool(source) for source in (id_range, ids, signed)) != 1:
+        raise click.UsageError('Pass one of --range, --ids or --signed')
+    if not signed and not privatekey:
+        raise click.UsageError('<privatekey> is needed to sign the unique IDs')
+    contract = eth_utils.to_checksum_address(ctx_obj['contract_address'])
+    # log in before entering the event loop
+    if not ctx_obj['api_key']:
+        click.echo('Could not log in to EthVigil. Check the privatekey and INTERNAL_API_ENDPOINT in settings.json')
+        return
+    if id_range:
+        try:
+            parse_range(id_range)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--range')
+    if not checkpoint:
+        checkpoint = (signed or ids or 'confirmations-{}-{}'.format(*id_range.split(':'))) + '.checkpoint'
+    checkpoint = Checkpoint(checkpoint, retry_unknown=retry_unknown)
+    progress = Progress(lambda line: click.echo(line, err=True), 'Submitted')
+
+    def pending(rows):
+        return ((row_number, unique_id, *rest) for row_number, unique_id, *rest in rows
+                if not checkpoint.should_skip(row_number, str(unique_id)))
+
+    async def main():
+        client = AsyncEthVigilClient(ctx_obj['rest_api_endpoint'], contract_address=contract,
+                                     concurrency=concurrency)
+
+        async def submit_row(row):
+            row_number, unique_id, sig = row
+            checkpoint.mark_pending(row_number, str(unique_id))
+            try:
+                r = await ev_call_async(ctx_obj, client.call, 'submitConfirmation',
+                                        {'uniqueID': int(unique_id), 'sig': sig})
+            except Exception as e:
+                state, details = error_outcome(e)
+            else:
+                state, details = outcome(r)
+            checkpoint.mark(row_number, state, **details)
+            progress.update()
+
+        try:
+            if signed:
+                rows = ((row_number, record['uniqueID'], record['sig'])
+                        for row_number, record in iter_records(signed, ['uniqueID', 'sig'], input_format))
+                await run_bounded(pending(rows), submit_row, concurrency)
+            else:
+                rows = pending(confirmation_rows(id_range, ids, input_format))
+                # the pool keeps signing the next chunks while a chunk is submitted
+                async for chunk in sign_in_pool(rows, contract, privatekey, workers=workers):
+                    await run_bounded(chunk, submit_row, concurrency)
+        finally:
+            client.close()
+
+    try:
+        asyncio.run(main())
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        checkpoint.close()
+    click.echo(progress.summary())
+    counts = checkpoint.counts()
+    click.echo(f'Checkpoint {checkpoint.path}: ' + ', '.join(f'{state}: {n}' for state, n in sorted(counts.items())))
+    if counts.get('failed'):
+        click.echo('Failed rows were rejected by the API or could not reach it, and will be retried when the command is '
+                   'run again.')
+    if counts.get('unknown') or counts.get('pending'):
+        click.echo('Rows in the unknown/pending state may or may not have been confirmed. Check them on chain '
+                   'before rerunning with --retry-unknown.')
+
+
+@cli.command('verify-confirmations')
+@click.argument('confirmations', required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', '-o', default='-', show_default=True,
+              help='CSV or NDJSON file to write `uniqueID,sig,signer` rows to')
+@click.option('--signer', help='Expected signer. Exits with status 1 if any confirmation is signed by another address')
+@click.option('--contract', help='Contract the confirmations were signed for. Defaults to contractAddress in settings')
+@click.option('--workers', type=int, help='Number of processes recovering signers. Defaults to the number of cores')
+@click.option('--cache-size', default=100000, show_default=True,
+              help='Number of verified confirmations cached, so that repeated ones are recovered once')
+@click.option('--format', 'input_format', type=click.Choice(['csv', 'ndjson']),
+              help='Input format. Guessed from the file extension by default')
+@click.pass_obj
+def verify_confirmations(ctx_obj, confirmations, output, signer, contract, workers, cache_size, input_format):
+    """
+    Recovers the signers of many `uniqueID,sig` confirmations, e.g. written by sign-confirmations, off-chain and
+    across a pool of processes, exactly as submitConfirmation() in SignerTesting.sol recovers them.
+
+    A signature that fails ecrecover() yields the zero address; one that would make the transaction revert
+    yields an empty signer.
+    """
+    import asyncio
+    import concurrent.futures
+    import os
+    from bulk import Progress, RecordWriter, iter_records
+    from confirmations import SignerCache, iter_chunks
+    from confirmations import verify_confirmations as verify
+    contract = contract or ctx_obj['contract_address']
+    workers = workers or os.cpu_count() or 1
+    cache = SignerCache(max_entries=cache_size)
+    writer = RecordWriter(output, ['uniqueID', 'sig', 'signer'])
+    progress = Progress(lambda line: click.echo(line, err=True), 'Verified', every=10000)
+    mismatches = 0
+
+    async def main():
+        nonlocal mismatches
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            records = iter_records(confirmations, ['uniqueID', 'sig'], input_format)
+            for block in iter_chunks(records, 1000 * workers):
+                batch = [(record['uniqueID'], contract, record['sig']) for _, record in block]
+                signers = await verify(batch, cache, workers=workers, pool=pool)
+                for (unique_id, _, sig), recovered in zip(batch, signers):
+                    writer.write({'uniqueID': unique_id, 'sig': sig, 'signer': recovered})
+                    if signer and (recovered or '').lower() != signer.lower():
+                        mismatches += 1
+                progress.update(len(batch))
+
+    try:
+        asyncio.run(main())
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        writer.close()
+    click.echo(progress.summary(), err=True)
+    click.echo(f'Cache hits: {cache.hits}', err=True)
+    if signer:
+        click.echo(f'Not signed by {signer}: {mismatches}', err=True)
+        if mismatches:
+            click.get_current_context().exit(1)
+
+
 @cli.command()
 @click.pass_obj
 def init(ctx_obj):
+    ctx_obj.load_settings()
     print("Got context object")
     print(ctx_obj)
 
@@ -161,20 +642,21 @@ def init(ctx_obj):
 @click.argument('url', required=True)
 @click.pass_obj
 def registerhook(ctx_obj, url):
+    import requests
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
     contract = ctx_obj['contract_address']
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
     msg = 'dummystring'
     message_hash = defunct_hash_message(text=msg)
     sig_msg = Account.signHash(message_hash, ctx_obj['private_key'])
     method_args = {
         "msg": msg,
         "sig": sig_msg.signature.hex(),
-        "key": ctx_obj['api_key'],
         "type": "web",
         "contract": contract,
         "web": url
     }
-    r = requests.post(url=f'{ctx_obj["internal_api_endpoint"]}/hooks/add', json=method_args, headers=headers)
+    r = ev_request(ctx_obj, 'post', ctx_obj['client'].internal_url('hooks/add'), method_args, key_field='key')
     click.echo(r.text)
     if r.status_code == requests.codes.ok:
         r = r.json()
@@ -193,12 +675,13 @@ def registerhook(ctx_obj, url):
 @click.argument('events', required=True)
 @click.pass_obj
 def addhooktoevent(ctx_obj, hookid, events):
+    import requests
+    from eth_account.messages import defunct_hash_message
+    from eth_account.account import Account
     msg = 'dummystring'
     message_hash = defunct_hash_message(text=msg)
     contract_address = ctx_obj['contract_address']
     private_key = ctx_obj['private_key']
-    api_key = ctx_obj['api_key']
-    api_endpoint = ctx_obj['internal_api_endpoint']
     sig_msg = Account.signHash(message_hash, private_key)
     events_to_be_registered_on = list()
     if not events:
@@ -209,16 +692,13 @@ def addhooktoevent(ctx_obj, hookid, events):
     method_args = {
         "msg": msg,
         "sig": sig_msg.signature.hex(),
-        "key": api_key,
         "type": "web",
         "contract": contract_address,
         "id": hookid,
         "events": events_to_be_registered_on
     }
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json'}
     click.echo(f'Registering | hook ID: {hookid} | events: {events_to_be_registered_on} | contract: {contract_address}')
-    r = requests.post(url=f'{api_endpoint}/hooks/updateEvents', json=method_args,
-                      headers=headers)
+    r = ev_request(ctx_obj, 'post', ctx_obj['client'].internal_url('hooks/updateEvents'), method_args, key_field='key')
     click.echo(r.text)
     if r.status_code == requests.codes.ok:
         r = r.json()
@@ -0,0 +1,257 @@
+import asyncio
+import mmap
+import os
+import struct
+import time
+import zlib
+
+import click
+
+
+# every record is its payload prefixed with the payload length and CRC32
+RECORD_HEADER = struct.Struct('<II')
+SEGMENT_SUFFIX = '.log'
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_COMMIT_INTERVAL = 0.002
+
+
+def segment_name(first_seq):
+    return f'{first_seq:020d}{SEGMENT_SUFFIX}'
+
+
+def list_segments(directory):
+    """
+    (first sequence number, path) of the segments in a log directory, oldest first
+    """
+    segments = list()
+    for name in os.listdir(directory):
+        if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+            segments.append((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def scan_records(buf, offset=0):
+    """
+    Yields (offset of the record, payload) for the complete, intact records of a segment buffer starting at `offset`.
+    Stops at the first torn or corrupt record, which is where the writer crashed or is still writing.
+    """
+    end = len(buf)
+    while offset + RECORD_HEADER.size <= end:
+        length, crc = RECORD_HEADER.unpack_from(buf, offset)
+        start = offset + RECORD_HEADER.size
+        if start + length > end:
+            return
+        payload = buf[start:start + length]
+        if zlib.crc32(payload) != crc:
+            return
+        yield offset, payload
+        offset = start + length
+
+
+def _valid_length(path):
+    size = os.path.getsize(path)
+    if not size:
+        return 0, 0
+    count, valid = 0, 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for offset, payload in scan_records(buf):
+            count += 1
+            valid = offset + RECORD_HEADER.size + len(payload)
+    return count, valid
+
+
+class EventLog(object):
+    """
+    Segmented append-only log of the events delivered to the webhook listener.
+
+    `append` hands back once the record is on disk. Records appended within `commit_interval` seconds of each other
+    share a single fsync (group commit), which runs on a worker thread so that the event loop keeps accepting
+    requests meanwhile. A new segment is started once the current one reaches `segment_size` bytes;
+    segments are named after the sequence number of their first record.
+    On open, a torn record at the end of the last segment, left by a crash, is truncated away.
+    Must be used from a single event loop.
+    """
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE, commit_interval=DEFAULT_COMMIT_INTERVAL):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.commit_interval = commit_interval
+        os.makedirs(directory, exist_ok=True)
+        segments = list_segments(directory)
+        if segments:
+            first_seq, path = segments[-1]
+            count, valid = _valid_length(path)
+            self._f = open(path, 'r+b')
+            self._f.truncate(valid)
+            self._f.seek(valid)
+            self._size = valid
+            self.next_seq = first_seq + count
+            self._new_segment = False
+        else:
+            self.next_seq = 0
+            self._open_segment()
+        self._closing = list()
+        self._waiters = list()
+        self._committer = None
+        self._closed = False
+
+    def __repr__(self):
+        return f'EventLog({self.directory!r}, next_seq={self.next_seq})'
+
+    def _open_segment(self):
+        self._f = open(os.path.join(self.directory, segment_name(self.next_seq)), 'xb')
+        self._size = 0
+        # the directory entry of the new segment is made durable with the next commit
+        self._new_segment = True
+
+    def _roll(self):
+        self._f.flush()
+        # fsync-ed and closed by the committer, which may be syncing it right now
+        self._closing.append(self._f)
+        self._open_segment()
+
+    async def append(self, payload):
+        """
+        Appends a payload (bytes) to the log and returns its sequence number once it is durable
+        """
+        if self._closed:
+            raise ValueError('Event log is closed')
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        if self._size and self._size + len(record) > self.segment_size:
+            self._roll()
+        self._f.write(record)
+        self._size += len(record)
+        seq = self.next_seq
+        self.next_seq += 1
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        if self._committer is None or self._committer.done():
+            self._committer = loop.create_task(self._commit_loop())
+        await waiter
+        return seq
+
+    async def _commit_loop(self):
+        loop = asyncio.get_running_loop()
+        while self._waiters:
+            # let concurrent requests join this commit
+            await asyncio.sleep(self.commit_interval)
+            waiters, self._waiters = self._waiters, list()
+            closing, self._closing = self._closing, list()
+            sync_directory, self._new_segment = self._new_segment, False
+            try:
+                self._f.flush()
+                await loop.run_in_executor(None, self._sync, self._f, closing, sync_directory)
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            else:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+    def _sync(self, f, closing, sync_directory):
+        for old in closing:
+            os.fsync(old.fileno())
+            old.close()
+        os.fsync(f.fileno())
+        if sync_directory:
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    async def close(self):
+        self._closed = True
+        if self._committer is not None:
+            await self._committer
+        self._sync(self._f, self._closing, self._new_segment)
+        self._closing = list()
+        self._f.close()
+
+
+class EventLogReader(object):
+    """
+    Reads the records of an event log through memory maps, from any sequence number onwards,
+    while the listener keeps appending to it.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def replay(self, from_seq=0):
+        """
+        Yields (sequence number, payload) for the records currently in the log, starting at `from_seq`
+        """
+        segments = list_segments(self.directory)
+        for i, (first_seq, path) in enumerate(segments):
+            if i + 1 < len(segments) and segments[i + 1][0] <= from_seq:
+                continue
+            for seq, payload, _ in self._read_segment(path, first_seq, 0):
+                if seq >= from_seq:
+                    yield seq, payload
+
+    def tail(self, from_seq=0, poll_interval=0.5):
+        """
+        Like `replay`, then keeps yielding records as they are appended, following segment rollovers.
+        Every poll reads on from the end of the last record read, rather than scanning the segment from its start.
+        """
+        first_seq, path = self._segment_for(from_seq)
+        while path is None:
+            time.sleep(poll_interval)
+            first_seq, path = self._segment_for(from_seq)
+        # sequence number and byte offset of the next record of the segment at `path`
+        seq, offset = first_seq, 0
+        while True:
+            found = False
+            for record_seq, payload, end in self._read_segment(path, seq, offset):
+                if record_seq >= from_seq:
+                    yield record_seq, payload
+                seq, offset, found = record_seq + 1, end, True
+            if found:
+                continue
+            next_segment = os.path.join(self.directory, segment_name(seq))
+            if next_segment != path and os.path.exists(next_segment):
+                # the writer rolled over to a new segment
+                path, offset = next_segment, 0
+                continue
+            time.sleep(poll_interval)
+
+    def _segment_for(self, seq):
+        candidates = [(first_seq, path) for first_seq, path in list_segments(self.directory) if first_seq <= seq]
+        return candidates[-1] if candidates else (None, None)
+
+    @staticmethod
+    def _read_segment(path, seq, offset):
+        """
+        Yields (sequence number, payload, end offset) for the records of a segment from byte `offset` onwards, where
+        record `seq` starts
+        """
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size <= offset:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for record_offset, payload in scan_records(buf, offset):
+                    yield seq, payload, record_offset + RECORD_HEADER.size + len(payload)
+                    seq += 1
+
+
+@click.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--from-seq', default=0, help='Sequence number of the first event to print')
+@click.option('--follow', '-f', is_flag=True, help='Keep printing events as they are received')
+def main(directory, from_seq, follow):
+    """
+    Prints the events recorded by the webhook listener in DIRECTORY, one JSON payload per line
+    """
+    reader = EventLogReader(directory)
+    records = reader.tail(from_seq) if follow else reader.replay(from_seq)
+    try:
+        for seq, payload in records:
+            click.echo(f'{seq}\t{payload.decode("utf-8")}')
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import mmap
+import os
+import signal
+import time
+
+
+# per worker counters, kept in memory shared by the supervisor and all workers
+STAT_FIELDS = ('pid', 'started', 'restarts', 'requests', 'events', 'duplicates', 'bytes', 'errors',
+               'in_flight')
+# a worker exiting sooner than this after starting is crashing on startup, restart it with a delay
+MIN_WORKER_UPTIME = 1.0
+
+
+class WorkerStats(object):
+    """
+    Counters of every worker of a pre-forked server, in an anonymous shared memory map created before forking.
+    Each worker only writes its own slot, so no locking is needed; any process can read all of them.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self._mmap = mmap.mmap(-1, 8 * len(STAT_FIELDS) * workers)
+        self._counters = memoryview(self._mmap).cast('q')
+
+    def slot(self, worker_id):
+        return WorkerSlot(self._counters, worker_id * len(STAT_FIELDS))
+
+    def snapshot(self):
+        """
+        Per worker counters, their totals, and each worker's share of the events
+        """
+        now = time.time()
+        workers = list()
+        for worker_id in range(self.workers):
+            slot = self.slot(worker_id)
+            worker = {field: slot[field] for field in STAT_FIELDS}
+            worker['worker'] = worker_id
+            worker['uptime'] = round(now - worker.pop('started') / 1e9, 1) if worker['pid'] else 0
+            workers.append(worker)
+        total = {field: sum(w[field] for w in workers) for field in STAT_FIELDS if field not in ('pid', 'started')}
+        for worker in workers:
+            worker['share'] = round(worker['events'] / total['events'], 3) if total['events'] else None
+        return {'workers': workers, 'total': total}
+
+
+class WorkerSlot(object):
+    def __init__(self, counters, base):
+        self._counters = counters
+        self._base = base
+
+    def __getitem__(self, field):
+        return self._counters[self._base + STAT_FIELDS.index(field)]
+
+    def __setitem__(self, field, value):
+        self._counters[self._base + STAT_FIELDS.index(field)] = value
+
+    def incr(self, field, n=1):
+        self._counters[self._base + STAT_FIELDS.index(field)] += n
+
+
+def supervise(workers, run_worker, logger):
+    """
+    Forks `workers` processes running `run_worker(worker_id, stats)` and keeps them running.
+
+    A worker that exits is restarted in its slot, unless the supervisor is shutting down.
+    SIGTERM and SIGINT shut all workers down gracefully; SIGHUP restarts them one at a time, so that the others
+    keep serving. Workers are expected to finish their in-flight requests and exit on SIGTERM.
+    """
+    stats = WorkerStats(workers)
+    children = dict()
+    rolling = list()
+    stopping = False
+
+    def spawn(worker_id):
+        pid = os.fork()
+        if pid == 0:
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(sig, signal.SIG_DFL)
+            status = 1
+            try:
+                run_worker(worker_id, stats)
+                status = 0
+            except Exception:
+                logger.exception('Worker %d failed', worker_id)
+            finally:
+                os._exit(status)
+        slot = stats.slot(worker_id)
+        if slot['pid']:
+            slot.incr('restarts')
+        slot['pid'] = pid
+        slot['started'] = time.time_ns()
+        slot['in_flight'] = 0
+        children[pid] = worker_id
+        logger.info('Started worker %d (pid %d)', worker_id, pid)
+
+    def terminate(pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def on_shutdown(signum, frame):
+        nonlocal stopping
+        if not stopping:
+            logger.info('Shutting down %d workers...', len(children))
+            stopping = True
+            for pid in list(children):
+                terminate(pid)
+
+    def on_restart(signum, frame):
+        if stopping or rolling:
+            return
+        logger.info('Restarting %d workers, one at a time...', len(children))
+        rolling.extend(children)
+        terminate(rolling[0])
+
+    signal.signal(signal.SIGTERM, on_shutdown)
+    signal.signal(signal.SIGINT, on_shutdown)
+    signal.signal(signal.SIGHUP, on_restart)
+
+    for worker_id in range(workers):
+        spawn(worker_id)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = children.pop(pid, None)
+        if worker_id is None:
+            continue
+        slot = stats.slot(worker_id)
+        slot['in_flight'] = 0
+        if stopping:
+            logger.info('Worker %d (pid %d) stopped', worker_id, pid)
+            continue
+        if pid in rolling:
+            rolling.remove(pid)
+        else:
+            exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            logger.warning('Worker %d (pid %d) exited with status %d, restarting it', worker_id, pid, exit_code)
+            if time.time() - slot['started'] / 1e9 < MIN_WORKER_UPTIME:
+                time.sleep(MIN_WORKER_UPTIME)
+                if stopping:
+                    continue
+        spawn(worker_id)
+        if rolling:
+            terminate(rolling[0])
+    return stats.snapshot()
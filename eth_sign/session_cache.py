@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.ethvigil', 'sessions.json')
+DEFAULT_TTL = 12 * 3600
+
+
+class SessionCache(object):
+    """
+    On-disk cache of EthVigil API keys returned by /login.
+
+    Entries are keyed by a digest of the signing private key (see account_digest()) and the internal API endpoint,
+    so that every CLI in this repository configured with the same credentials reuses the same API key instead of
+    signing and logging in again on each invocation.
+    The cache file is rewritten atomically: readers either see the previous contents or the new ones.
+    """
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        self.path = path or os.environ.get('EV_SESSION_CACHE', DEFAULT_CACHE_PATH)
+        self.ttl = ttl
+
+    def __repr__(self):
+        return f'SessionCache({self.path!r}, ttl={self.ttl})'
+
+    @staticmethod
+    def cache_key(account, api_endpoint):
+        return f'{account.lower()}@{api_endpoint.rstrip("/")}'
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                sessions = json.load(f)
+        except (OSError, ValueError):
+            return dict()
+        return sessions if isinstance(sessions, dict) else dict()
+
+    def _dump(self, sessions):
+        cache_dir = os.path.dirname(self.path)
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.sessions-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(sessions, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get(self, account, api_endpoint):
+        entry = self._load().get(self.cache_key(account, api_endpoint))
+        if not entry or entry.get('expires_at', 0) <= time.time():
+            return None
+        return entry.get('key')
+
+    def put(self, account, api_endpoint, api_key):
+        now = time.time()
+        # drop expired entries while we are rewriting the file anyway
+        sessions = {k: v for k, v in self._load().items() if v.get('expires_at', 0) > now}
+        sessions[self.cache_key(account, api_endpoint)] = {'key': api_key, 'expires_at': now + self.ttl}
+        self._dump(sessions)
+
+    def invalidate(self, account, api_endpoint):
+        sessions = self._load()
+        if sessions.pop(self.cache_key(account, api_endpoint), None) is not None:
+            self._dump(sessions)
+
+
+def account_digest(private_key):
+    """
+    Identifies the account of a private key without deriving its address, which takes importing eth_account.
+    Unlike the key itself, the digest can be written to disk.
+    """
+    if isinstance(private_key, str):
+        hex_key = private_key[2:] if private_key[:2].lower() == '0x' else private_key
+        try:
+            private_key = bytes.fromhex(hex_key)
+        except ValueError:
+            private_key = private_key.encode('utf-8')
+    return hashlib.sha256(b'ethvigil-session:' + bytes(private_key)).hexdigest()
+
+
+def get_api_key(api_endpoint, private_key, login_fn, refresh=False, cache=None):
+    """
+    Returns an API key for the account behind `private_key`, calling `login_fn(api_endpoint, private_key)`
+    only when no unexpired key is cached or when `refresh` is set, e.g. after the API rejected the cached key.
+    """
+    cache = cache or SessionCache()
+    # a cache hit needs neither eth_account nor a login
+    account = account_digest(private_key)
+    if not refresh:
+        api_key = cache.get(account, api_endpoint)
+        if api_key:
+            return api_key
+    api_key = login_fn(api_endpoint, private_key)
+    try:
+        if api_key:
+            cache.put(account, api_endpoint, api_key)
+        else:
+            cache.invalidate(account, api_endpoint)
+    except OSError as e:
+        # an unwritable cache only costs us a login on the next run
+        print(f'Could not update session cache at {cache.path}: {e}', file=sys.stderr)
+    return api_key
@@ -17,7 +17,9 @@ setup(
             'eth-account == 0.4.0',
             'click == 7.0',
             'tornado == 6.0.3',
-            'eth_abi == 2.0.0'
+            'pycurl == 7.43.0.5',
+            'eth_abi == 2.0.0',
+            'eth-keys == 0.2.4'
         ],
     version="0.1"
 )
\ No newline at end of file
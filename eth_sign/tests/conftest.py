@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules of this example are imported by their bare names, as eth_sign_cli.py and webhook_listener.py do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from eth_account.account import Account
+from eth_utils import to_checksum_address
+
+from confirmations import SECP256K1_N, ZERO_ADDRESS, SignerCache, iter_chunks, parse_range, recover_signers, \
+    sign_confirmations, sign_in_pool, verify_confirmations
+from eth_sign_cli import sign_confirmation
+
+PRIVATE_KEY = '0x' + '11' * 32
+SIGNER = Account.from_key(PRIVATE_KEY).address
+CONTRACT = to_checksum_address('0x3dc7d43d5f180661970387a4f89c7e715b567512')
+
+
+def sign(unique_id, contract=CONTRACT):
+    [(_, _, sig)] = sign_confirmations([(1, unique_id)], contract, PRIVATE_KEY)
+    return sig
+
+
+def with_vrs(sig, v=None, r=None, s=None):
+    raw = bytes.fromhex(sig[2:])
+    r = raw[:32] if r is None else r.to_bytes(32, 'big')
+    s = raw[32:64] if s is None else s.to_bytes(32, 'big')
+    v = raw[64:] if v is None else bytes([v])
+    return '0x' + (r + s + v).hex()
+
+
+def test_recovers_the_signer():
+    assert recover_signers([(7, CONTRACT, sign(7)), (8, CONTRACT.lower(), sign(8))]) == [SIGNER, SIGNER]
+
+
+def test_another_id_recovers_another_address():
+    [signer] = recover_signers([(8, CONTRACT, sign(7))])
+    assert signer not in (SIGNER, ZERO_ADDRESS, None)
+
+
+@pytest.mark.parametrize('v', [0, 1, 26, 29, 255])
+def test_v_other_than_27_or_28_recovers_the_zero_address(v):
+    assert recover_signers([(7, CONTRACT, with_vrs(sign(7), v=v))]) == [ZERO_ADDRESS]
+
+
+@pytest.mark.parametrize('r, s', [(0, None), (SECP256K1_N, None), (2 ** 256 - 1, None),
+                                  (None, 0), (None, SECP256K1_N)])
+def test_r_and_s_out_of_range_recover_the_zero_address(r, s):
+    assert recover_signers([(7, CONTRACT, with_vrs(sign(7), r=r, s=s))]) == [ZERO_ADDRESS]
+
+
+def test_high_s_is_accepted_like_ecrecover():
+    sig = bytes.fromhex(sign(7)[2:])
+    s, v = int.from_bytes(sig[32:64], 'big'), sig[64]
+    # the other signature of the same message: s' = N - s with the parity of v flipped
+    high_s = with_vrs(sign(7), s=SECP256K1_N - s, v=55 - v)
+    assert recover_signers([(7, CONTRACT, high_s)]) == [SIGNER]
+
+
+@pytest.mark.parametrize('sig', [sign(7)[:-2], sign(7) + '00', '0x', '0xzz' + sign(7)[6:], None])
+def test_malformed_signatures_recover_none(sig):
+    assert recover_signers([(7, CONTRACT, sig)]) == [None]
+
+
+@pytest.mark.parametrize('unique_id, contract', [
+    (-1, CONTRACT), (2 ** 256, CONTRACT), ('seven', CONTRACT),
+    (7, CONTRACT[:-2]), (7, CONTRACT + '00'), (7, None),
+    # mixed case, with a bad EIP-55 checksum
+    (7, CONTRACT[:2] + CONTRACT[2:].swapcase()),
+])
+def test_malformed_confirmations_recover_none_without_failing_the_batch(unique_id, contract):
+    assert recover_signers([(6, CONTRACT, sign(6)), (unique_id, contract, sign(7)), (8, CONTRACT, sign(8))]) == \
+        [SIGNER, None, SIGNER]
+
+
+def test_verify_confirmations_caches_signers():
+    cache = SignerCache()
+    confirmations = [(7, CONTRACT, sign(7)), (7, CONTRACT, with_vrs(sign(7), v=30))]
+    assert asyncio.run(verify_confirmations(confirmations, cache, workers=0)) == [SIGNER, ZERO_ADDRESS]
+    assert asyncio.run(verify_confirmations(confirmations, cache, workers=0)) == [SIGNER, ZERO_ADDRESS]
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_parse_range():
+    assert parse_range('3:6') == range(3, 6)
+    for value in ('6:3', '-1:3', '3', 'a:b'):
+        with pytest.raises(ValueError):
+            parse_range(value)
+
+
+def test_iter_chunks():
+    assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_chunks([], 2)) == []
+
+
+def test_batch_signing_matches_sign_confirmation(capsys):
+    for unique_id in (0, 1, 2 ** 255 + 12345):
+        assert sign(unique_id) == '0x' + sign_confirmation(unique_id, CONTRACT, PRIVATE_KEY).replace('0x', '')
+
+
+def test_pool_signing_matches_signing_in_process():
+    rows = [(row_number, unique_id) for row_number, unique_id in enumerate(range(1000, 1037), start=1)]
+
+    async def sign_all():
+        return [signed async for chunk in sign_in_pool(iter(rows), CONTRACT, PRIVATE_KEY, workers=2, chunk_size=5)
+                for signed in chunk]
+
+    assert asyncio.run(sign_all()) == sign_confirmations(rows, CONTRACT, PRIVATE_KEY)
+
+
+def test_pool_verification_matches_verification_in_process():
+    confirmations = [(unique_id, CONTRACT, sign(unique_id)) for unique_id in range(20)]
+    confirmations[3] = (3, CONTRACT, with_vrs(sign(3), v=29))
+    confirmations[5] = (5, 'not an address', sign(5))
+    in_process = asyncio.run(verify_confirmations(confirmations, SignerCache(), workers=0))
+    in_pool = asyncio.run(verify_confirmations(confirmations, SignerCache(), workers=2, chunk_size=3))
+    assert in_pool == in_process
+    assert in_process[3] == ZERO_ADDRESS and in_process[5] is None
+    assert in_process.count(SIGNER) == 18
@@ -1,14 +1,48 @@
 import tornado.httpserver
 import tornado.ioloop
+import tornado.netutil
 import tornado.options
 import tornado.web
 import tornado.httpclient
 import tornado.escape
 from tornado.options import define, options
+import asyncio
+import functools
+import concurrent.futures
 import logging
+import multiprocessing
+import os
+import signal
 import sys
+import time
+from confirmations import SignerCache, verify_confirmations
+from dedup import DedupIndex, dedup_key
+from event_log import EventLog
+from metrics import InstrumentedApplication, MetricsHandler, monitor_loop_lag, server_metrics
+import prefork
 
 define("port", default=5554, help="run on the given port", type=int)
+define("event_log_dir", default="events", help="directory of the log of received events")
+define("event_log_segment_mb", default=64, help="size of the event log segments in MB", type=int)
+define("event_log_commit_ms", default=2, help="how long an event waits for others to share its fsync, in ms",
+       type=float)
+define("workers", default=1, help="number of worker processes, sharing the port through SO_REUSEPORT", type=int)
+define("dedup_entries", default=200000, help="number of delivered payload ids kept in memory to drop redeliveries",
+       type=int)
+define("dedup_ttl", default=3 * 24 * 3600, help="seconds for which redeliveries of a payload are dropped", type=int)
+define("dedup_db", default="", help="SQLite file keeping delivered payload ids across restarts "
+                                    "(default with --workers: <event_log_dir>/dedup.sqlite, see --dedup_shards)")
+define("dedup_shards", default=8, help="number of SQLite files the payload ids of --dedup_db are spread over, so that "
+                                       "workers seldom wait for each other; keep it across restarts", type=int)
+define("verify_workers", default=os.cpu_count() or 1, help="processes recovering signers for /verify, 0 to recover "
+                                                       "them in the listener process", type=int)
+define("verify_cache_entries", default=100000, help="number of verified confirmations kept in the /verify cache",
+       type=int)
+define("verify_max_batch", default=10000, help="largest number of confirmations accepted by one /verify request",
+       type=int)
+define("shutdown_timeout", default=10, help="seconds a stopping worker waits for the requests in flight", type=float)
+define("metrics_event_names", default=64, help="event names counted separately in /metrics, further ones are counted "
+                                               "as _other", type=int)
 
 tornado_logger = logging.getLogger('WebhookListener')
 tornado_logger.propagate = False
@@ -34,33 +68,176 @@ logging.getLogger("tornado.access").propagate = False
 
 
 class MainHandler(tornado.web.RequestHandler):
+    def initialize(self, event_log, dedup, stats, events):
+        self.event_log = event_log
+        self.dedup = dedup
+        self.stats = stats
+        self.events = events
+
+    def prepare(self):
+        self.stats.incr('requests')
+        self.stats.incr('in_flight')
+
+    def on_finish(self):
+        self.stats.incr('in_flight', -1)
+        if self.get_status() >= 400:
+            self.stats.incr('errors')
+
     async def post(self):
         # tornado_logger.debug(self.request.headers['content-type'])
         # tornado_logger.debug('---Transaction---')
         request_json = tornado.escape.json_decode(self.request.body)
+        key = dedup_key(request_json)
+        # atomic across workers: of concurrent deliveries of a payload, a single one is claimed
+        if key is not None and not await self.dedup.claim(key):
+            self.stats.incr('duplicates')
+            tornado_logger.debug('Dropped redelivery of %s', key)
+            self.set_status(status_code=202)
+            self.write({'success': True, 'duplicate': True})
+            return
+        try:
+            # acknowledge only once the event is on disk, EthVigil delivers it again otherwise
+            await self.event_log.append(self.request.body)
+        except Exception:
+            if key is not None:
+                await self.dedup.discard(key)
+            raise
+        self.stats.incr('events')
+        self.stats.incr('bytes', len(self.request.body))
         self.set_status(status_code=202)
         self.write({'success': True})
         if 'event_name' in request_json:
+            self.events.incr(str(request_json['event_name']))
             tornado_logger.debug('========New event received========')
             tornado_logger.debug(request_json['event_name'])
             tornado_logger.debug('---JSON Payload delivered-----')
             tornado_logger.debug(request_json)
 
 
-def main():
-    tornado.options.parse_command_line()
-    application = tornado.web.Application([
-        (r"/", MainHandler),
+class VerifyHandler(tornado.web.RequestHandler):
+    """
+    Recovers the signers of a batch of submitConfirmation() confirmations, as SignerTesting.sol would, without
+    sending them to the chain. Takes {"confirmations": [{"uniqueID": ..., "contract": ..., "sig": ...}, ...]}.
+    """
+    def initialize(self, cache, pool):
+        self.cache = cache
+        self.pool = pool
 
-    ])
-    http_server = tornado.httpserver.HTTPServer(application)
-    http_server.listen(options.port)
-    try:
-        tornado.ioloop.IOLoop.current().start()
-    except KeyboardInterrupt:
+    async def post(self):
+        try:
+            items = tornado.escape.json_decode(self.request.body)['confirmations']
+            confirmations = [(item['uniqueID'], item['contract'], item['sig']) for item in items]
+        except (ValueError, KeyError, TypeError):
+            self.set_status(status_code=400)
+            self.write({'success': False,
+                        'error': 'expected {"confirmations": [{"uniqueID": ..., "contract": ..., "sig": ...}]}'})
+            return
+        if len(confirmations) > options.verify_max_batch:
+            self.set_status(status_code=413)
+            self.write({'success': False, 'error': f'at most {options.verify_max_batch} confirmations per request'})
+            return
+        workers = options.verify_workers
+        # spread the batch over all the processes
+        chunk_size = max(100, -(-len(confirmations) // workers)) if workers else len(confirmations)
+        signers = await verify_confirmations(confirmations, self.cache, workers=workers, chunk_size=chunk_size,
+                                             pool=self.pool)
+        self.write({'success': True, 'data': [
+            {'uniqueID': unique_id, 'contract': contract, 'sig': sig, 'signer': signer}
+            for (unique_id, contract, sig), signer in zip(confirmations, signers)
+        ]})
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, stats):
+        self.stats = stats
+
+    def get(self):
+        self.write(self.stats.snapshot())
+
+
+def run_worker(worker_id, stats, metrics):
+    """
+    Serves webhook deliveries until SIGTERM or SIGINT, then lets the requests in flight finish and returns
+    """
+    event_log_dir = options.event_log_dir
+    if stats.workers > 1:
+        # the event log has a single writer
+        event_log_dir = os.path.join(event_log_dir, f'worker-{worker_id}')
+    slot = stats.slot(worker_id)
+    metrics.bind(worker_id)
+    dedup_db = options.dedup_db
+    if not dedup_db and stats.workers > 1:
+        # redeliveries may reach any worker
+        dedup_db = os.path.join(options.event_log_dir, 'dedup.sqlite')
+    dedup = DedupIndex(dedup_db or None, max_entries=options.dedup_entries, ttl=options.dedup_ttl,
+                       shards=options.dedup_shards)
+
+    signer_cache = SignerCache(max_entries=options.verify_cache_entries)
+    verify_pool = None
+    if options.verify_workers:
+        # spawned rather than forked from a process running an event loop and the event log's threads
+        verify_pool = concurrent.futures.ProcessPoolExecutor(options.verify_workers,
+                                                             mp_context=multiprocessing.get_context('spawn'))
+
+    async def serve():
+        event_log = EventLog(event_log_dir, segment_size=options.event_log_segment_mb * 1024 * 1024,
+                             commit_interval=options.event_log_commit_ms / 1000)
+        application = InstrumentedApplication([
+            (r"/", MainHandler, dict(event_log=event_log, dedup=dedup, stats=slot,
+                                     events=metrics['webhook_events_total'])),
+            (r"/verify", VerifyHandler, dict(cache=signer_cache, pool=verify_pool)),
+            (r"/stats", StatsHandler, dict(stats=stats)),
+            (r"/metrics", MetricsHandler, dict(metrics=metrics)),
+        ], metrics)
+        http_server = tornado.httpserver.HTTPServer(application)
+        http_server.add_sockets(tornado.netutil.bind_sockets(options.port, reuse_port=stats.workers > 1))
+        lag_monitor = asyncio.ensure_future(monitor_loop_lag(metrics['ioloop_lag_seconds']))
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stopping.set)
+        await stopping.wait()
         tornado_logger.debug('Shutting down...')
-        tornado.ioloop.IOLoop.current().stop()
+        http_server.stop()
+        deadline = loop.time() + options.shutdown_timeout
+        while slot['in_flight'] > 0 and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        await http_server.close_all_connections()
+        lag_monitor.cancel()
+        await event_log.close()
+
+    try:
+        tornado.ioloop.IOLoop.current().run_sync(serve)
+    finally:
+        dedup.close()
+        if verify_pool is not None:
+            verify_pool.shutdown()
+
+
+def listener_metrics(workers):
+    metrics = server_metrics(workers)
+    metrics.counter('webhook_events_total', 'Events received, by event name', 'event_name',
+                    capacity=options.metrics_event_names)
+    return metrics.allocate()
+
+
+def main():
+    tornado.options.parse_command_line()
+    if options.dedup_entries < 1 or options.dedup_shards < 1:
+        # rather than have every worker fail to start
+        raise SystemExit('--dedup_entries and --dedup_shards must be at least 1')
+    # shared by the workers, so allocated before forking them
+    metrics = listener_metrics(options.workers)
+    if options.workers > 1:
+        stats = prefork.supervise(options.workers, functools.partial(run_worker, metrics=metrics), tornado_logger)
+        tornado_logger.info('Events handled per worker: %s', {w['worker']: w['events'] for w in stats['workers']})
+    else:
+        stats = prefork.WorkerStats(1)
+        slot = stats.slot(0)
+        slot['pid'] = os.getpid()
+        slot['started'] = time.time_ns()
+        run_worker(0, stats, metrics)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()